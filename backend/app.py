@@ -4,12 +4,13 @@ import os
 import uuid
 import logging
 from datetime import datetime, timedelta
-from flask import Flask, request, jsonify
+from flask import Flask, request, jsonify, Response
 from flask_cors import CORS
 from functools import wraps
 from werkzeug.utils import secure_filename
 from google.cloud import storage, pubsub_v1, firestore
 import json
+import orjson
 import anthropic
 
 from config import Config
@@ -37,6 +38,9 @@ anthropic_client = anthropic.Anthropic(api_key=Config.ANTHROPIC_API_KEY)
 # Get or create bucket
 bucket = storage_client.bucket(Config.GCS_BUCKET_NAME)
 
+# Sessions collection reference (resolved once, reused by every handler)
+_SESSIONS_COLL = firestore_client.collection(Config.FIRESTORE_COLLECTION_SESSIONS)
+
 # Pub/Sub topic path
 topic_path = publisher.topic_path(Config.GOOGLE_CLOUD_PROJECT, Config.PUBSUB_TOPIC_VIDEO_UPLOADS)
 
@@ -57,6 +61,11 @@ def allowed_file(filename):
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in Config.ALLOWED_EXTENSIONS
 
 
+def _json(payload, status=200):
+    """Serialize a JSON response with orjson, bypassing Flask's JSON provider."""
+    return Response(orjson.dumps(payload), status=status, mimetype='application/json')
+
+
 @app.route('/health', methods=['GET'])
 def health_check():
     """Health check endpoint."""
@@ -125,7 +134,7 @@ def upload_video():
         }
         
         # Save to Firestore
-        firestore_client.collection(Config.FIRESTORE_COLLECTION_SESSIONS).document(session_id).set(session_doc)
+        _SESSIONS_COLL.document(session_id).set(session_doc)
         
         # Publish message to Pub/Sub
         message_data = {
@@ -141,7 +150,7 @@ def upload_video():
         # Wait for publish to complete
         future.result()
         
-        logger.info(f"Video uploaded successfully: {session_id}")
+        logger.info("Video uploaded successfully: %s", session_id)
         
         return jsonify({
             'sessionId': session_id,
@@ -150,7 +159,7 @@ def upload_video():
         }), 201
         
     except Exception as e:
-        logger.error(f"Error uploading video: {str(e)}")
+        logger.error("Error uploading video: %s", e)
         return jsonify({'error': 'Internal server error'}), 500
 
 
@@ -160,7 +169,7 @@ def get_video_url(session_id):
     """Get a signed URL for video playback."""
     try:
         # Get session from Firestore
-        doc_ref = firestore_client.collection('sessions').document(session_id)
+        doc_ref = _SESSIONS_COLL.document(session_id)
         doc = doc_ref.get()
         
         if not doc.exists:
@@ -199,7 +208,7 @@ def get_video_url(session_id):
             return jsonify({'error': 'Invalid video URI format'}), 500
             
     except Exception as e:
-        logger.error(f"Error generating video URL: {str(e)}")
+        logger.error("Error generating video URL: %s", e)
         return jsonify({'error': 'Failed to generate video URL'}), 500
 
 
@@ -209,7 +218,7 @@ def get_session(session_id):
     """Get session details."""
     try:
         # Get session from Firestore
-        doc = firestore_client.collection(Config.FIRESTORE_COLLECTION_SESSIONS).document(session_id).get()
+        doc = _SESSIONS_COLL.document(session_id).get()
         
         if not doc.exists:
             return jsonify({'error': 'Session not found'}), 404
@@ -223,7 +232,7 @@ def get_session(session_id):
         return jsonify(session_data), 200
         
     except Exception as e:
-        logger.error(f"Error getting session: {str(e)}")
+        logger.error("Error getting session: %s", e)
         return jsonify({'error': 'Internal server error'}), 500
 
 
@@ -237,7 +246,7 @@ def list_sessions():
         offset = int(request.args.get('offset', 0))
         
         # Query Firestore
-        query = firestore_client.collection(Config.FIRESTORE_COLLECTION_SESSIONS)\
+        query = _SESSIONS_COLL\
             .order_by('uploadTime', direction=firestore.Query.DESCENDING)\
             .limit(limit)\
             .offset(offset)
@@ -259,7 +268,7 @@ def list_sessions():
         }), 200
         
     except Exception as e:
-        logger.error(f"Error listing sessions: {str(e)}")
+        logger.error("Error listing sessions: %s", e)
         return jsonify({'error': 'Internal server error'}), 500
 
 
@@ -276,7 +285,7 @@ def query_sessions():
         user_query = data['query']
         
         # Get all sessions with summaries for context
-        sessions_ref = firestore_client.collection(Config.FIRESTORE_COLLECTION_SESSIONS)
+        sessions_ref = _SESSIONS_COLL
         sessions = []
         
         for doc in sessions_ref.stream():
@@ -392,7 +401,7 @@ Format as clear sections."""
         return jsonify(response), 200
         
     except Exception as e:
-        logger.error(f"Error processing query: {str(e)}")
+        logger.error("Error processing query: %s", e)
         return jsonify({'error': 'Internal server error'}), 500
 
 
@@ -405,7 +414,7 @@ def voice_webhook():
         if vapi_secret:
             signature = request.headers.get('X-Vapi-Signature')
             if not signature:
-                return jsonify({'error': 'Missing signature'}), 401
+                return _json({'error': 'Missing signature'}, 401)
             
             # Verify HMAC signature
             expected_signature = hmac.new(
@@ -415,13 +424,13 @@ def voice_webhook():
             ).hexdigest()
             
             if not hmac.compare_digest(signature, expected_signature):
-                return jsonify({'error': 'Invalid signature'}), 401
+                return _json({'error': 'Invalid signature'}, 401)
         
         # Parse webhook payload
         data = request.get_json()
         webhook_type = data.get('type')
         
-        logger.info(f"Received Vapi webhook: {webhook_type}")
+        logger.info("Received Vapi webhook: %s", webhook_type)
         
         # Forward to agents service for processing
         agents_url = os.environ.get('AGENTS_SERVICE_URL', 'http://localhost:3001')
@@ -434,10 +443,11 @@ def voice_webhook():
                 timeout=30
             )
             
-            return jsonify(response.json()), response.status_code
+            # Relay the upstream body as-is instead of parsing and re-serializing it
+            return Response(response.content, status=response.status_code, mimetype='application/json')
             
         except requests.exceptions.RequestException as e:
-            logger.error(f"Failed to forward to agents service: {str(e)}")
+            logger.error("Failed to forward to agents service: %s", e)
             
             # Handle function calls directly if agents service is unavailable
             if webhook_type == 'function-call':
@@ -445,66 +455,78 @@ def voice_webhook():
                 function_name = function_call.get('name')
                 parameters = function_call.get('parameters', {})
                 
-                if function_name == 'searchSessions':
-                    # Call the query endpoint internally
-                    query_response = query_sessions_internal(parameters.get('query', ''))
-                    return jsonify({
-                        'response': query_response.get('summary', 'No results found'),
-                        'data': {
-                            'sessions': query_response.get('results', [])[:3],
-                            'totalFound': query_response.get('totalMatches', 0)
-                        }
-                    }), 200
+                handler = _VOICE_HANDLERS.get(function_name)
+                if handler is None:
+                    return _json({'error': f'Unknown function: {function_name}'}, 400)
                 
-                elif function_name == 'getSessionDetails':
-                    session_id = parameters.get('sessionId')
-                    if not session_id:
-                        return jsonify({'error': 'sessionId required'}), 400
-                    
-                    # Get session details
-                    doc = firestore_client.collection(Config.FIRESTORE_COLLECTION_SESSIONS).document(session_id).get()
-                    if not doc.exists:
-                        return jsonify({
-                            'response': 'I couldn\'t find that session.',
-                            'error': 'Session not found'
-                        }), 200
-                    
-                    session = doc.to_dict()
-                    friction_count = len(session.get('frictionPoints', []))
-                    
-                    response_text = f"Session {session_id} has {friction_count} friction points detected."
-                    if friction_count > 0:
-                        high_priority = sum(1 for fp in session.get('frictionPoints', []) if fp.get('priority') == 'high')
-                        if high_priority > 0:
-                            response_text += f" {high_priority} are high priority issues."
-                    
-                    return jsonify({
-                        'response': response_text,
-                        'data': {
-                            'sessionId': session_id,
-                            'frictionPoints': friction_count,
-                            'summary': session.get('behaviorSummary', '')
-                        }
-                    }), 200
-                
-                else:
-                    return jsonify({
-                        'error': f'Unknown function: {function_name}'
-                    }), 400
+                payload, status = handler(parameters)
+                return _json(payload, status)
             
             # For other webhook types, just acknowledge
-            return jsonify({'success': True}), 200
+            return _json({'success': True}, 200)
         
     except Exception as e:
-        logger.error(f"Error processing voice webhook: {str(e)}")
-        return jsonify({'error': 'Internal server error'}), 500
+        logger.error("Error processing voice webhook: %s", e)
+        return _json({'error': 'Internal server error'}, 500)
+
+
+def _handle_search(parameters):
+    """Voice function: search sessions via the internal query."""
+    query_response = query_sessions_internal(parameters.get('query', ''))
+    return {
+        'response': query_response.get('summary', 'No results found'),
+        'data': {
+            'sessions': query_response.get('results', [])[:3],
+            'totalFound': query_response.get('totalMatches', 0)
+        }
+    }, 200
+
+
+def _handle_details(parameters):
+    """Voice function: summarize a single session."""
+    session_id = parameters.get('sessionId')
+    if not session_id:
+        return {'error': 'sessionId required'}, 400
+    
+    # Get session details
+    doc = _SESSIONS_COLL.document(session_id).get()
+    if not doc.exists:
+        return {
+            'response': 'I couldn\'t find that session.',
+            'error': 'Session not found'
+        }, 200
+    
+    session = doc.to_dict()
+    friction_count = len(session.get('frictionPoints', []))
+    
+    response_text = f"Session {session_id} has {friction_count} friction points detected."
+    if friction_count > 0:
+        high_priority = sum(1 for fp in session.get('frictionPoints', []) if fp.get('priority') == 'high')
+        if high_priority > 0:
+            response_text += f" {high_priority} are high priority issues."
+    
+    return {
+        'response': response_text,
+        'data': {
+            'sessionId': session_id,
+            'frictionPoints': friction_count,
+            'summary': session.get('behaviorSummary', '')
+        }
+    }, 200
+
+
+# Voice function-call name -> handler returning (payload, status)
+_VOICE_HANDLERS = {
+    'searchSessions': _handle_search,
+    'getSessionDetails': _handle_details,
+}
 
 
 def query_sessions_internal(query):
     """Internal function to query sessions (used by voice webhook)."""
     try:
         # Reuse logic from query_sessions endpoint
-        sessions_ref = firestore_client.collection(Config.FIRESTORE_COLLECTION_SESSIONS)
+        sessions_ref = _SESSIONS_COLL
         sessions = []
         
         for doc in sessions_ref.stream():
@@ -596,7 +618,7 @@ Please provide a brief, voice-friendly summary (2-3 sentences) of the findings.
         }
         
     except Exception as e:
-        logger.error(f"Error in internal query: {str(e)}")
+        logger.error("Error in internal query: %s", e)
         return {
             'query': query,
             'results': [],
@@ -622,7 +644,7 @@ if __name__ == '__main__':
     try:
         Config.validate()
     except ValueError as e:
-        logger.error(f"Configuration error: {e}")
+        logger.error("Configuration error: %s", e)
         exit(1)
     
     # Run the app
@@ -10,11 +10,12 @@ from functools import wraps
 from werkzeug.utils import secure_filename
 from google.cloud import storage, pubsub_v1, firestore
 import json
+import orjson
 import anthropic
 import requests
 import hmac
 import hashlib
-from typing import Dict, List, Any, Optional
+from typing import Dict, List, Any, Optional, Tuple
 import subprocess
 import tempfile
 
@@ -46,6 +47,9 @@ anthropic_client = anthropic.Anthropic(api_key=Config.ANTHROPIC_API_KEY)
 upload_bucket = storage_client.bucket(Config.GCS_BUCKET_NAME)
 results_bucket = storage_client.bucket(Config.GCS_RESULTS_BUCKET)
 
+# Sessions collection reference (resolved once, reused by every handler)
+_SESSIONS_COLL = firestore_client.collection(Config.FIRESTORE_COLLECTION_SESSIONS)
+
 # Pub/Sub topic path
 topic_path = publisher.topic_path(Config.GOOGLE_CLOUD_PROJECT, Config.PUBSUB_TOPIC_VIDEO_UPLOADS)
 
@@ -66,6 +70,11 @@ def allowed_file(filename):
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in Config.ALLOWED_EXTENSIONS
 
 
+def _json(payload, status=200):
+    """Serialize a JSON response with orjson, bypassing Flask's JSON provider."""
+    return Response(orjson.dumps(payload), status=status, mimetype='application/json')
+
+
 @app.route('/health', methods=['GET'])
 def health_check():
     """Health check endpoint."""
@@ -140,7 +149,7 @@ def upload_video():
         }
         
         # Save to Firestore
-        firestore_client.collection(Config.FIRESTORE_COLLECTION_SESSIONS).document(session_id).set(session_doc)
+        _SESSIONS_COLL.document(session_id).set(session_doc)
         
         # Publish message to Pub/Sub for enhanced processing
         message_data = {
@@ -157,7 +166,7 @@ def upload_video():
         # Wait for publish to complete
         future.result()
         
-        logger.info(f"Video uploaded successfully for enhanced processing: {session_id}")
+        logger.info("Video uploaded successfully for enhanced processing: %s", session_id)
         
         return jsonify({
             'sessionId': session_id,
@@ -167,7 +176,7 @@ def upload_video():
         }), 201
         
     except Exception as e:
-        logger.error(f"Error uploading video: {str(e)}")
+        logger.error("Error uploading video: %s", e)
         return jsonify({'error': 'Internal server error'}), 500
 
 
@@ -177,7 +186,7 @@ def get_video_url(session_id):
     """Get video URL with HLS support."""
     try:
         # Get session from Firestore
-        doc_ref = firestore_client.collection('sessions').document(session_id)
+        doc_ref = _SESSIONS_COLL.document(session_id)
         doc = doc_ref.get()
         
         if not doc.exists:
@@ -259,7 +268,7 @@ def get_video_url(session_id):
             return jsonify({'error': 'Invalid video URI format'}), 500
             
     except Exception as e:
-        logger.error(f"Error generating video URL: {str(e)}")
+        logger.error("Error generating video URL: %s", e)
         return jsonify({'error': 'Failed to generate video URL'}), 500
 
 
@@ -269,7 +278,7 @@ def get_session(session_id):
     """Get enhanced session details with all analytics."""
     try:
         # Get session from Firestore
-        doc = firestore_client.collection(Config.FIRESTORE_COLLECTION_SESSIONS).document(session_id).get()
+        doc = _SESSIONS_COLL.document(session_id).get()
         
         if not doc.exists:
             return jsonify({'error': 'Session not found'}), 404
@@ -301,12 +310,12 @@ def get_session(session_id):
                     session_data['uiElements'] = analysis_data.get('uiElements', [])
             
             except Exception as e:
-                logger.warning(f"Error loading additional data: {str(e)}")
+                logger.warning("Error loading additional data: %s", e)
         
         return jsonify(session_data), 200
         
     except Exception as e:
-        logger.error(f"Error getting session: {str(e)}")
+        logger.error("Error getting session: %s", e)
         return jsonify({'error': 'Internal server error'}), 500
 
 
@@ -336,7 +345,7 @@ def get_heatmap_url(session_id):
         }), 200
         
     except Exception as e:
-        logger.error(f"Error getting heatmap URL: {str(e)}")
+        logger.error("Error getting heatmap URL: %s", e)
         return jsonify({'error': 'Failed to generate heatmap URL'}), 500
 
 
@@ -346,7 +355,7 @@ def get_user_journey(session_id):
     """Get user journey narrative for a session."""
     try:
         # Get session from Firestore
-        doc = firestore_client.collection(Config.FIRESTORE_COLLECTION_SESSIONS).document(session_id).get()
+        doc = _SESSIONS_COLL.document(session_id).get()
         
         if not doc.exists:
             return jsonify({'error': 'Session not found'}), 404
@@ -373,7 +382,7 @@ def get_user_journey(session_id):
                         'narrative': narrative
                     }), 200
             except Exception as e:
-                logger.warning(f"Error loading journey data: {str(e)}")
+                logger.warning("Error loading journey data: %s", e)
         
         return jsonify({
             'sessionId': session_id,
@@ -382,7 +391,7 @@ def get_user_journey(session_id):
         }), 200
         
     except Exception as e:
-        logger.error(f"Error getting user journey: {str(e)}")
+        logger.error("Error getting user journey: %s", e)
         return jsonify({'error': 'Internal server error'}), 500
 
 
@@ -401,7 +410,7 @@ def list_sessions():
         order = request.args.get('order', 'desc')
         
         # Build query
-        query = firestore_client.collection(Config.FIRESTORE_COLLECTION_SESSIONS)
+        query = _SESSIONS_COLL
         
         # Apply filters
         if status:
@@ -440,7 +449,7 @@ def list_sessions():
             sessions.append(session_data)
         
         # Get total count
-        total_query = firestore_client.collection(Config.FIRESTORE_COLLECTION_SESSIONS)
+        total_query = _SESSIONS_COLL
         if status:
             total_query = total_query.where('status', '==', status)
         total_count = len(list(total_query.stream()))
@@ -456,7 +465,7 @@ def list_sessions():
         }), 200
         
     except Exception as e:
-        logger.error(f"Error listing sessions: {str(e)}")
+        logger.error("Error listing sessions: %s", e)
         return jsonify({'error': 'Internal server error'}), 500
 
 
@@ -474,7 +483,7 @@ def query_sessions():
         include_analytics = data.get('includeAnalytics', True)
         
         # Get all sessions with summaries
-        sessions_ref = firestore_client.collection(Config.FIRESTORE_COLLECTION_SESSIONS)
+        sessions_ref = _SESSIONS_COLL
         sessions = []
         
         for doc in sessions_ref.stream():
@@ -608,7 +617,7 @@ Return a comprehensive JSON response with these sections."""
         return jsonify(response), 200
         
     except Exception as e:
-        logger.error(f"Error processing query: {str(e)}")
+        logger.error("Error processing query: %s", e)
         return jsonify({'error': 'Internal server error'}), 500
 
 
@@ -622,7 +631,7 @@ def get_friction_trends():
         start_date = datetime.utcnow() - timedelta(days=days)
         
         # Query sessions within time range
-        query = firestore_client.collection(Config.FIRESTORE_COLLECTION_SESSIONS)\
+        query = _SESSIONS_COLL\
             .where('uploadTime', '>=', start_date)\
             .where('status', '==', 'completed')
         
@@ -688,7 +697,7 @@ def get_friction_trends():
         }), 200
         
     except Exception as e:
-        logger.error(f"Error getting friction trends: {str(e)}")
+        logger.error("Error getting friction trends: %s", e)
         return jsonify({'error': 'Internal server error'}), 500
 
 
@@ -698,7 +707,7 @@ def get_funnel_metrics():
     """Get aggregated funnel metrics across sessions."""
     try:
         # Query completed sessions
-        query = firestore_client.collection(Config.FIRESTORE_COLLECTION_SESSIONS)\
+        query = _SESSIONS_COLL\
             .where('status', '==', 'completed')
         
         # Aggregate funnel data
@@ -769,7 +778,7 @@ def get_funnel_metrics():
         }), 200
         
     except Exception as e:
-        logger.error(f"Error getting funnel metrics: {str(e)}")
+        logger.error("Error getting funnel metrics: %s", e)
         return jsonify({'error': 'Internal server error'}), 500
 
 
@@ -782,7 +791,7 @@ def voice_webhook():
         if vapi_secret:
             signature = request.headers.get('X-Vapi-Signature')
             if not signature:
-                return jsonify({'error': 'Missing signature'}), 401
+                return _json({'error': 'Missing signature'}, 401)
             
             # Verify HMAC signature
             expected_signature = hmac.new(
@@ -792,13 +801,13 @@ def voice_webhook():
             ).hexdigest()
             
             if not hmac.compare_digest(signature, expected_signature):
-                return jsonify({'error': 'Invalid signature'}), 401
+                return _json({'error': 'Invalid signature'}, 401)
         
         # Parse webhook payload
         data = request.get_json()
         webhook_type = data.get('type')
         
-        logger.info(f"Received Vapi webhook: {webhook_type}")
+        logger.info("Received Vapi webhook: %s", webhook_type)
         
         # Forward to agents service if available
         agents_url = os.environ.get('AGENTS_SERVICE_URL', 'http://localhost:3001')
@@ -811,10 +820,11 @@ def voice_webhook():
                 timeout=30
             )
             
-            return jsonify(response.json()), response.status_code
+            # Relay the upstream body as-is instead of parsing and re-serializing it
+            return Response(response.content, status=response.status_code, mimetype='application/json')
             
         except requests.exceptions.RequestException as e:
-            logger.error(f"Failed to forward to agents service: {str(e)}")
+            logger.error("Failed to forward to agents service: %s", e)
             
             # Handle function calls directly
             if webhook_type == 'function-call':
@@ -822,87 +832,101 @@ def voice_webhook():
                 function_name = function_call.get('name')
                 parameters = function_call.get('parameters', {})
                 
-                if function_name == 'searchSessions':
-                    # Use enhanced query
-                    query_result = query_sessions_enhanced(parameters.get('query', ''))
-                    return jsonify({
-                        'response': query_result.get('summary', 'No results found'),
-                        'data': {
-                            'sessions': query_result.get('results', [])[:3],
-                            'analytics': query_result.get('analytics', {}),
-                            'totalFound': query_result.get('totalMatches', 0)
-                        }
-                    }), 200
-                
-                elif function_name == 'getSessionDetails':
-                    session_id = parameters.get('sessionId')
-                    if not session_id:
-                        return jsonify({'error': 'sessionId required'}), 400
-                    
-                    # Get enhanced session details
-                    doc = firestore_client.collection(Config.FIRESTORE_COLLECTION_SESSIONS).document(session_id).get()
-                    if not doc.exists:
-                        return jsonify({
-                            'response': 'I couldn\'t find that session.',
-                            'error': 'Session not found'
-                        }), 200
-                    
-                    session = doc.to_dict()
-                    friction_count = len(session.get('frictionPoints', []))
-                    high_severity = sum(1 for fp in session.get('frictionPoints', []) if fp.get('severity') == 'high')
-                    
-                    response_text = f"Session {session_id} has {friction_count} friction points. "
-                    if high_severity > 0:
-                        response_text += f"{high_severity} are high severity issues requiring immediate attention. "
-                    
-                    # Add key moments summary
-                    key_moments = session.get('keyMoments', [])
-                    if key_moments:
-                        response_text += f"Key moments include: {', '.join(m['description'] for m in key_moments[:3])}."
-                    
-                    return jsonify({
-                        'response': response_text,
-                        'data': {
-                            'sessionId': session_id,
-                            'frictionPoints': friction_count,
-                            'highSeverity': high_severity,
-                            'summary': session.get('behaviorSummary', '')[:500]
-                        }
-                    }), 200
-                
-                elif function_name == 'getFrictionTrends':
-                    # Get recent friction trends
-                    trends_result = get_friction_trends_internal(days=7)
-                    
-                    total_friction = trends_result.get('summary', {}).get('totalFrictionPoints', 0)
-                    most_common = trends_result.get('summary', {}).get('mostCommonType', 'unknown')
-                    
-                    response_text = f"In the last 7 days, I found {total_friction} total friction points. "
-                    response_text += f"The most common issue is {most_common.replace('_', ' ')}. "
-                    
-                    return jsonify({
-                        'response': response_text,
-                        'data': trends_result
-                    }), 200
+                handler = _VOICE_HANDLERS.get(function_name)
+                if handler is None:
+                    return _json({'error': f'Unknown function: {function_name}'}, 400)
                 
-                else:
-                    return jsonify({
-                        'error': f'Unknown function: {function_name}'
-                    }), 400
+                payload, status = handler(parameters)
+                return _json(payload, status)
             
             # For other webhook types, acknowledge
-            return jsonify({'success': True}), 200
+            return _json({'success': True}, 200)
         
     except Exception as e:
-        logger.error(f"Error processing voice webhook: {str(e)}")
-        return jsonify({'error': 'Internal server error'}), 500
+        logger.error("Error processing voice webhook: %s", e)
+        return _json({'error': 'Internal server error'}, 500)
+
+
+def _handle_search(parameters: Dict[str, Any]) -> Tuple[Dict[str, Any], int]:
+    """Voice function: search sessions with the enhanced query."""
+    query_result = query_sessions_enhanced(parameters.get('query', ''))
+    return {
+        'response': query_result.get('summary', 'No results found'),
+        'data': {
+            'sessions': query_result.get('results', [])[:3],
+            'analytics': query_result.get('analytics', {}),
+            'totalFound': query_result.get('totalMatches', 0)
+        }
+    }, 200
+
+
+def _handle_details(parameters: Dict[str, Any]) -> Tuple[Dict[str, Any], int]:
+    """Voice function: summarize a single session."""
+    session_id = parameters.get('sessionId')
+    if not session_id:
+        return {'error': 'sessionId required'}, 400
+    
+    # Get enhanced session details
+    doc = _SESSIONS_COLL.document(session_id).get()
+    if not doc.exists:
+        return {
+            'response': 'I couldn\'t find that session.',
+            'error': 'Session not found'
+        }, 200
+    
+    session = doc.to_dict()
+    friction_count = len(session.get('frictionPoints', []))
+    high_severity = sum(1 for fp in session.get('frictionPoints', []) if fp.get('severity') == 'high')
+    
+    response_text = f"Session {session_id} has {friction_count} friction points. "
+    if high_severity > 0:
+        response_text += f"{high_severity} are high severity issues requiring immediate attention. "
+    
+    # Add key moments summary
+    key_moments = session.get('keyMoments', [])
+    if key_moments:
+        response_text += f"Key moments include: {', '.join(m['description'] for m in key_moments[:3])}."
+    
+    return {
+        'response': response_text,
+        'data': {
+            'sessionId': session_id,
+            'frictionPoints': friction_count,
+            'highSeverity': high_severity,
+            'summary': session.get('behaviorSummary', '')[:500]
+        }
+    }, 200
+
+
+def _handle_trends(parameters: Dict[str, Any]) -> Tuple[Dict[str, Any], int]:
+    """Voice function: report friction trends for the last 7 days."""
+    trends_result = get_friction_trends_internal(days=7)
+    
+    total_friction = trends_result.get('summary', {}).get('totalFrictionPoints', 0)
+    most_common = trends_result.get('summary', {}).get('mostCommonType', 'unknown')
+    
+    response_text = f"In the last 7 days, I found {total_friction} total friction points. "
+    response_text += f"The most common issue is {most_common.replace('_', ' ')}. "
+    
+    return {
+        'response': response_text,
+        'data': trends_result
+    }, 200
+
+
+# Voice function-call name -> handler returning (payload, status)
+_VOICE_HANDLERS = {
+    'searchSessions': _handle_search,
+    'getSessionDetails': _handle_details,
+    'getFrictionTrends': _handle_trends,
+}
 
 
 def query_sessions_enhanced(query: str) -> Dict[str, Any]:
     """Enhanced internal query function for voice interactions."""
     try:
         # Get sessions
-        sessions_ref = firestore_client.collection(Config.FIRESTORE_COLLECTION_SESSIONS)
+        sessions_ref = _SESSIONS_COLL
         sessions = []
         
         for doc in sessions_ref.stream():
@@ -981,7 +1005,7 @@ Be concise and natural for voice output."""
         }
         
     except Exception as e:
-        logger.error(f"Error in enhanced query: {str(e)}")
+        logger.error("Error in enhanced query: %s", e)
         return {
             'query': query,
             'results': [],
@@ -991,19 +1015,31 @@ Be concise and natural for voice output."""
         }
 
 
+# Friction trend aggregates keyed on (days, minute-quantized cutoff)
+_friction_trends_cache: Dict[Tuple[int, str], Dict[str, Any]] = {}
+
+
 def get_friction_trends_internal(days: int = 7) -> Dict[str, Any]:
     """Internal function to get friction trends."""
     try:
-        start_date = datetime.utcnow() - timedelta(days=days)
-        
-        query = firestore_client.collection(Config.FIRESTORE_COLLECTION_SESSIONS)\
+        # Quantize the cutoff to the minute so repeat voice queries share a cache key
+        now = datetime.utcnow().replace(second=0, microsecond=0)
+        start_date = now - timedelta(days=days)
+        cache_key = (days, start_date.isoformat())
+        cached = _friction_trends_cache.get(cache_key)
+        if cached is not None:
+            return cached
+        
+        # Project to the one field we aggregate over, so session bodies aren't pulled
+        query = _SESSIONS_COLL\
             .where('uploadTime', '>=', start_date)\
-            .where('status', '==', 'completed')
-        
+            .where('status', '==', 'completed')\
+            .select(['frictionPoints'])
+
         friction_types = {}
         total_friction = 0
         session_count = 0
-        
+
         for doc in query.stream():
             session = doc.to_dict()
             session_count += 1
@@ -1015,7 +1051,7 @@ def get_friction_trends_internal(days: int = 7) -> Dict[str, Any]:
         
         sorted_types = sorted(friction_types.items(), key=lambda x: x[1], reverse=True)
         
-        return {
+        result = {
             'summary': {
                 'totalSessions': session_count,
                 'totalFrictionPoints': total_friction,
@@ -1025,8 +1061,15 @@ def get_friction_trends_internal(days: int = 7) -> Dict[str, Any]:
             'frictionTypes': dict(sorted_types[:5])
         }
         
+        # Keys from earlier minutes can never hit again; keep only the current one per window
+        for key in [k for k in _friction_trends_cache if k[0] == days]:
+            del _friction_trends_cache[key]
+        _friction_trends_cache[cache_key] = result
+        
+        return result
+        
     except Exception as e:
-        logger.error(f"Error getting friction trends: {str(e)}")
+        logger.error("Error getting friction trends: %s", e)
         return {'summary': {}, 'frictionTypes': {}}
 
 
@@ -1038,7 +1081,7 @@ def export_session_data(session_id):
         format_type = request.args.get('format', 'json')
         
         # Get session data
-        doc = firestore_client.collection(Config.FIRESTORE_COLLECTION_SESSIONS).document(session_id).get()
+        doc = _SESSIONS_COLL.document(session_id).get()
         
         if not doc.exists:
             return jsonify({'error': 'Session not found'}), 404
@@ -1127,7 +1170,7 @@ FRICTION POINTS ({len(session_data.get('frictionPoints', []))})
             return jsonify({'error': 'Invalid format. Supported: json, csv, report'}), 400
             
     except Exception as e:
-        logger.error(f"Error exporting session data: {str(e)}")
+        logger.error("Error exporting session data: %s", e)
         return jsonify({'error': 'Internal server error'}), 500
 
 
@@ -1148,7 +1191,7 @@ if __name__ == '__main__':
     try:
         Config.validate()
     except ValueError as e:
-        logger.error(f"Configuration error: {e}")
+        logger.error("Configuration error: %s", e)
         exit(1)
     
     # Run the app
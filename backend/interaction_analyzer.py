@@ -12,332 +12,669 @@ This script analyzes video frames to detect actual user interaction patterns:
 """
 
 import argparse
+import asyncio
 import base64
-import json
+import hashlib
+import mmap
 import os
-import subprocess
+import queue
+import sqlite3
 import sys
+import threading
 import time
+from multiprocessing import Pool, cpu_count
 from pathlib import Path
-from typing import List, Dict, Any
-import requests
+from typing import List, Dict, Any, Optional
+import httpx
+import orjson
 import cv2
 import numpy as np
+from tenacity import retry, retry_if_exception, stop_after_attempt, wait_exponential_jitter
 
 
-def check_ffmpeg():
-    """Check if ffmpeg is available in the system."""
+OPENROUTER_URL = "https://openrouter.ai/api/v1/chat/completions"
+
+# Upper bound on in-flight OpenRouter requests (replaces the fixed sleep between frames)
+MAX_CONCURRENT_REQUESTS = 4
+
+# Read timeout for one frame's analysis; batched requests allow this much per frame
+READ_TIMEOUT_PER_FRAME = 30
+
+# Sustained OpenRouter request rate; bursts up to this many requests go out immediately
+REQUESTS_PER_SECOND = 5
+
+# Videos with fewer sampled frames than this per worker are scanned in-process
+MIN_SAMPLES_PER_SEGMENT = 32
+
+# Decoded frames buffered ahead of cursor detection by the prefetch thread
+PREFETCH_FRAMES = 8
+
+# Cursor detection works on frames at 1/DIFF_DOWNSCALE of the source width and height
+DIFF_DOWNSCALE = 4
+
+# Vision model used for frame analysis
+VISION_MODEL = "openai/gpt-4o"
+
+# Frames sent to the vision model are JPEG-encoded and capped to this size
+JPEG_QUALITY = 85
+MAX_UPLOAD_SIDE = 1280
+
+# Per-frame vision prompt, aimed at specific problems and implementable fixes
+INTERACTION_PROMPT = """
+Analyze this video frame showing user interaction with a web interface. 
+Focus on identifying specific problems and providing actionable solutions.
+
+**Analysis Requirements:**
+1. **Problem Identification**: What specific issue is the user experiencing?
+2. **Root Cause**: Why is this happening? (UI/UX problem, unclear instructions, etc.)
+3. **Actionable Solution**: Provide 2-3 specific, implementable fixes
+4. **Priority**: Rate the urgency (High/Medium/Low)
+
+**Format your response as:**
+## Problem: [Clear description of the issue]
+**Why it's happening:** [Root cause analysis]
+**How to fix it:**
+1. [Specific actionable solution]
+2. [Specific actionable solution]
+3. [Specific actionable solution]
+**Priority:** [High/Medium/Low]
+
+If no clear problem is visible, state: "No significant issues detected in this frame."
+"""
+
+# Key frames whose 64-bit dHashes differ in at most this many bits reuse one analysis
+DHASH_MAX_DISTANCE = 5
+
+# Opt-in local cache of frame analyses keyed by image content + prompt (FUNCTION_AI_CACHE=1)
+AI_CACHE_ENABLED = os.getenv('FUNCTION_AI_CACHE') == '1'
+AI_CACHE_PATH = os.getenv('FUNCTION_AI_CACHE_PATH', 'interaction_ai_cache.sqlite3')
+_ai_cache = None
+
+
+def _sample_step(cap, fps):
+    """Number of source frames between samples when reading `cap` at `fps`."""
+    video_fps = cap.get(cv2.CAP_PROP_FPS)
+    if not video_fps or video_fps <= 0:
+        return 1
+    return max(1, int(round(video_fps / fps)))
+
+
+def extract_frames_stream(video_path, fps=1, start=0, end=None):
+    """Decode the video in memory, yielding grayscale frames sampled at `fps`.
+    
+    `start` and `end` (inclusive) are sampled-frame indices bounding the segment to read.
+    """
+    cap = cv2.VideoCapture(video_path)
+    if not cap.isOpened():
+        print(f"Error opening video: {video_path}")
+        return
+    
+    step = _sample_step(cap, fps)
+    if start:
+        cap.set(cv2.CAP_PROP_POS_FRAMES, start * step)
+    frame_index = 0
+    sample_index = start
+    
     try:
-        subprocess.run(['ffmpeg', '-version'], 
-                      capture_output=True, check=True)
-        return True
-    except (subprocess.CalledProcessError, FileNotFoundError):
+        # grab() only demuxes/decodes; retrieve() (the colour conversion) runs for sampled frames
+        while (end is None or sample_index <= end) and cap.grab():
+            if frame_index % step == 0:
+                ret, frame = cap.retrieve()
+                if not ret:
+                    break
+                yield cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+                sample_index += 1
+            frame_index += 1
+    finally:
+        cap.release()
+
+
+def prefetch_frames(frames, maxsize=PREFETCH_FRAMES):
+    """Decode `frames` on a background thread, overlapping decode with the consumer's work."""
+    buffer = queue.Queue(maxsize=maxsize)
+    done = object()
+    stop = threading.Event()
+    
+    def put(item):
+        # Bounded put so an abandoned consumer doesn't leave the thread blocked forever
+        while not stop.is_set():
+            try:
+                buffer.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
         return False
+    
+    def produce():
+        try:
+            for frame in frames:
+                if not put(frame):
+                    return
+            put(done)
+        except Exception as e:
+            put(e)
+    
+    producer = threading.Thread(target=produce, daemon=True)
+    producer.start()
+    
+    try:
+        while True:
+            item = buffer.get()
+            if item is done:
+                break
+            if isinstance(item, Exception):
+                raise item
+            yield item
+    finally:
+        stop.set()
+        producer.join()
+
+
+def select_key_frame_indices(frame_count):
+    """Pick the sampled frame indices that are sent to the AI."""
+    # Sample frames for fast analysis (reduced from every 5th to every 20th)
+    if frame_count > 20:
+        # Sample every 20th frame for very fast analysis
+        sample_indices = list(range(0, frame_count, 20))
+        # Ensure we get at least 6 frames
+        if len(sample_indices) < 6:
+            sample_indices = list(range(0, frame_count, frame_count // 6))
+    else:
+        # Analyze all frames if video is short
+        sample_indices = list(range(frame_count))
+    
+    # Limit to maximum 8 frames for speed
+    return [i for i in sample_indices[:8] if i < frame_count]
+
+
+def _frame_sort_key(name):
+    """Sort frame files by their embedded frame number (interaction_frame_0012.jpg -> 12)."""
+    digits = ''.join(c for c in os.path.splitext(name)[0].rsplit('_', 1)[-1] if c.isdigit())
+    return (int(digits) if digits else -1, name)
+
+
+def list_frame_files(frames_dir):
+    """List frame image names in `frames_dir` in numeric frame order."""
+    with os.scandir(frames_dir) as entries:
+        names = [
+            e.name for e in entries
+            if e.is_file() and e.name.endswith(('.png', '.jpg'))
+        ]
+    names.sort(key=_frame_sort_key)
+    return names
+
+
+def _limit_size(img):
+    """Downscale an image so its long side is at most MAX_UPLOAD_SIDE pixels."""
+    height, width = img.shape[:2]
+    scale = MAX_UPLOAD_SIDE / max(height, width)
+    if scale >= 1:
+        return img
+    return cv2.resize(img, (int(width * scale), int(height * scale)), interpolation=cv2.INTER_AREA)
+
+
+def save_key_frames(video_path, output_dir, sample_indices, fps=1):
+    """Seek to each key frame and write only those to disk as upload-ready JPEGs."""
+    cap = cv2.VideoCapture(video_path)
+    step = _sample_step(cap, fps)
+    key_frames = []
+    
+    try:
+        for idx in sample_indices:
+            cap.set(cv2.CAP_PROP_POS_FRAMES, idx * step)
+            ret, frame = cap.read()
+            if not ret:
+                continue
+            
+            frame_path = Path(output_dir) / f'interaction_frame_{idx + 1:04d}.jpg'
+            cv2.imwrite(str(frame_path), _limit_size(frame), [cv2.IMWRITE_JPEG_QUALITY, JPEG_QUALITY])
+            key_frames.append((idx, frame_path))
+    finally:
+        cap.release()
+    
+    return key_frames
 
 
 def extract_interaction_frames(video_path, output_dir, fps=1):
-    """Extract frames at lower frequency for fast interaction tracking."""
+    """Stream frames in memory for movement detection and save only the AI key frames."""
     os.makedirs(output_dir, exist_ok=True)
     
-    # Extract frames at 1 FPS for fast processing (reduced from 2 FPS)
-    cmd = [
-        'ffmpeg',
-        '-i', video_path,
-        '-vf', f'fps={fps}',
-        '-y',
-        os.path.join(output_dir, 'interaction_frame_%04d.png')
-    ]
+    print(f"🎬 Streaming interaction frames at {fps} FPS...")
+    frame_count, movement_patterns = detect_movement_parallel(video_path, fps)
     
-    try:
-        print(f"🎬 Extracting interaction frames at {fps} FPS...")
-        result = subprocess.run(cmd, capture_output=True, text=True, check=True)
-        
-        frame_files = list(Path(output_dir).glob('interaction_frame_*.png'))
-        frame_files.sort()
-        
-        print(f"✅ Extracted {len(frame_files)} interaction frames")
-        return len(frame_files), frame_files
-        
-    except subprocess.CalledProcessError as e:
-        print(f"Error extracting interaction frames: {e}")
-        return 0, []
+    if frame_count == 0:
+        print("Error extracting interaction frames: no frames decoded")
+        return 0, [], []
+    
+    key_frames = save_key_frames(video_path, output_dir, select_key_frame_indices(frame_count), fps)
+    
+    print(f"✅ Streamed {frame_count} interaction frames, saved {len(key_frames)} key frames")
+    return frame_count, key_frames, movement_patterns
+
 
+def _detect_segment(segment):
+    """Pool worker: detect movement over one (video_path, fps, start, end) segment."""
+    video_path, fps, start, end = segment
+    return detect_cursor_movement(prefetch_frames(extract_frames_stream(video_path, fps, start, end)), fps, start)
 
-def detect_cursor_movement(frame_files):
-    """Detect cursor/mouse movement patterns between frames."""
+
+def detect_movement_parallel(video_path, fps=1):
+    """Split the sampled frames into segments and detect movement in a process pool."""
     print("🔍 Analyzing cursor movement patterns...")
     
+    cap = cv2.VideoCapture(video_path)
+    step = _sample_step(cap, fps)
+    total_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+    cap.release()
+    
+    sample_count = -(-total_frames // step) if total_frames > 0 else 0
+    workers = min(max(1, cpu_count() - 1), sample_count // MIN_SAMPLES_PER_SEGMENT)
+    
+    # Unknown length or too short to be worth forking: scan in-process
+    if workers <= 1:
+        return detect_cursor_movement(prefetch_frames(extract_frames_stream(video_path, fps)), fps)
+    
+    # Consecutive segments share one boundary frame so no pair is skipped;
+    # the last segment is open-ended in case the container's frame count is short
+    size = -(-sample_count // workers)
+    starts = list(range(0, sample_count - 1, size))
+    segments = [
+        (video_path, fps, start, start + size if n < len(starts) - 1 else None)
+        for n, start in enumerate(starts)
+    ]
+    
+    with Pool(len(segments)) as pool:
+        results = pool.map(_detect_segment, segments)
+    
+    frame_count = 0
     movement_patterns = []
+    for (_, _, start, _), (count, patterns) in zip(segments, results):
+        if count:
+            frame_count = max(frame_count, start + count)
+        movement_patterns.extend(patterns)
     
-    for i in range(len(frame_files) - 1):
-        frame1_path = str(frame_files[i])
-        frame2_path = str(frame_files[i + 1])
-        
-        # Read frames
-        frame1 = cv2.imread(frame1_path)
-        frame2 = cv2.imread(frame2_path)
-        
-        if frame1 is None or frame2 is None:
-            continue
+    return frame_count, movement_patterns
+
+
+def detect_cursor_movement(gray_frames, fps=1, first_index=0):
+    """Detect cursor/mouse movement patterns from a stream of grayscale frames."""
+    movement_patterns = []
+    frame_count = 0
+    
+    # Short-history background model: each frame's foreground mask is the change
+    # against the last few frames, replacing the pairwise absdiff/threshold
+    bgsub = cv2.createBackgroundSubtractorMOG2(history=10, varThreshold=25, detectShadows=False)
+    
+    # Scratch buffers reused across frames (all frames share the video's resolution)
+    small_buf = None
+    mask_buf = None
+    
+    for i, gray in enumerate(gray_frames, first_index):
+        frame_count += 1
         
-        # Convert to grayscale
-        gray1 = cv2.cvtColor(frame1, cv2.COLOR_BGR2GRAY)
-        gray2 = cv2.cvtColor(frame2, cv2.COLOR_BGR2GRAY)
+        height, width = gray.shape
+        size = (max(1, width // DIFF_DOWNSCALE), max(1, height // DIFF_DOWNSCALE))
+        if small_buf is None or small_buf.shape != (size[1], size[0]):
+            small_buf = np.empty((size[1], size[0]), dtype=np.uint8)
+            mask_buf = np.empty_like(small_buf)
         
-        # Calculate frame difference
-        diff = cv2.absdiff(gray1, gray2)
+        # Model the background at reduced resolution to cut memory traffic on full-size screen captures
+        small = cv2.resize(gray, size, dst=small_buf, interpolation=cv2.INTER_AREA)
+        mask = bgsub.apply(small, mask_buf)
         
-        # Threshold to detect significant changes
-        _, thresh = cv2.threshold(diff, 30, 255, cv2.THRESH_BINARY)
+        # The first frame only seeds the background model
+        if i == first_index:
+            continue
         
-        # Find contours of changes
-        contours, _ = cv2.findContours(thresh, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+        # Changed-pixel area of the foreground mask, scaled back to full-resolution pixels
+        total_area = cv2.countNonZero(mask) * DIFF_DOWNSCALE * DIFF_DOWNSCALE
         
         # Analyze movement patterns
-        if contours:
-            # Calculate movement area
-            total_area = sum(cv2.contourArea(c) for c in contours)
-            
+        if total_area > 0:
             # Detect if it's likely cursor movement (small, focused changes)
             if total_area < 1000:  # Small changes likely cursor
                 movement_patterns.append({
-                    'frame_pair': (frame_files[i].name, frame_files[i + 1].name),
+                    'frame_pair': (i - 1, i),
                     'movement_type': 'cursor',
                     'intensity': total_area,
-                    'timestamp': i * 0.5  # Assuming 2 FPS
+                    'timestamp': (i - 1) / fps
                 })
             elif total_area > 5000:  # Large changes likely scrolling/clicking
                 movement_patterns.append({
-                    'frame_pair': (frame_files[i].name, frame_files[i + 1].name),
+                    'frame_pair': (i - 1, i),
                     'movement_type': 'interaction',
                     'intensity': total_area,
-                    'timestamp': i * 0.5
+                    'timestamp': (i - 1) / fps
                 })
     
-    return movement_patterns
+    return frame_count, movement_patterns
 
 
-def analyze_interaction_patterns(frame_files, api_key):
-    """Analyze frames for actual user interaction patterns."""
-    if not frame_files:
-        return []
+def _dhash(image_path):
+    """64-bit difference hash of an image, or None if it can't be read."""
+    gray = cv2.imread(str(image_path), cv2.IMREAD_REDUCED_GRAYSCALE_4)
+    if gray is None:
+        return None
+    small = cv2.resize(gray, (9, 8), interpolation=cv2.INTER_AREA)
+    return int.from_bytes(np.packbits(small[:, 1:] > small[:, :-1]).tobytes(), 'big')
+
+
+def _group_duplicate_frames(image_paths):
+    """For each frame, return the position of the first near-identical frame (itself if unique)."""
+    seen = []
+    representatives = []
     
-    print(f"🔍 Analyzing {len(frame_files)} frames for interaction patterns...")
+    for position, image_path in enumerate(image_paths):
+        frame_hash = _dhash(image_path)
+        representative = position
+        
+        if frame_hash is not None:
+            for prev_hash, prev_position in seen:
+                if bin(frame_hash ^ prev_hash).count('1') <= DHASH_MAX_DISTANCE:
+                    representative = prev_position
+                    break
+            else:
+                seen.append((frame_hash, position))
+        
+        representatives.append(representative)
     
-    # Detect cursor movement patterns
-    movement_patterns = detect_cursor_movement(frame_files)
+    return representatives
+
+
+class RateLimiter:
+    """Token bucket limiting how fast coroutines may start requests."""
     
-    # Analyze key interaction moments (optimized for speed)
-    interaction_analyses = []
+    def __init__(self, rps, burst=None):
+        self.rate = rps
+        self.capacity = burst or rps
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
     
-    # Sample frames for fast analysis (reduced from every 5th to every 20th)
-    if len(frame_files) > 20:
-        # Sample every 20th frame for very fast analysis
-        sample_indices = list(range(0, len(frame_files), 20))
-        # Ensure we get at least 6 frames
-        if len(sample_indices) < 6:
-            sample_indices = list(range(0, len(frame_files), len(frame_files) // 6))
-    else:
-        # Analyze all frames if video is short
-        sample_indices = list(range(len(frame_files)))
+    async def acquire(self):
+        """Take a token, sleeping until the bucket has refilled enough to cover it."""
+        # Reserve synchronously (no await before the update) so concurrent callers queue fairly
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        self.tokens -= 1
+        if self.tokens < 0:
+            await asyncio.sleep(-self.tokens / self.rate)
+
+
+_rate_limiter = RateLimiter(REQUESTS_PER_SECOND)
+
+
+def _is_retryable(exc):
+    """Retry on timeouts, connection failures, 429s and 5xx responses."""
+    if isinstance(exc, httpx.HTTPStatusError):
+        status = exc.response.status_code
+        return status == 429 or status >= 500
+    return isinstance(exc, httpx.TransportError)
+
+
+def _create_client():
+    """Create the shared async HTTP client used for all OpenRouter calls."""
+    # HTTP/2 multiplexes the concurrent frame requests over one TLS connection
+    return httpx.AsyncClient(
+        http2=True,
+        timeout=httpx.Timeout(READ_TIMEOUT_PER_FRAME, connect=5),
+        limits=httpx.Limits(max_connections=8, max_keepalive_connections=8, keepalive_expiry=30)
+    )
+
+
+@retry(
+    stop=stop_after_attempt(4),
+    wait=wait_exponential_jitter(initial=0.5, max=8),
+    retry=retry_if_exception(_is_retryable),
+    reraise=True
+)
+async def _post_chat(client, api_key, payload, timeout=httpx.USE_CLIENT_DEFAULT):
+    """POST a chat completion request to OpenRouter and return the decoded response.
     
-    # Limit to maximum 8 frames for speed
-    sample_indices = sample_indices[:8]
+    `timeout` overrides the client's timeouts for this request.
+    """
+    await _rate_limiter.acquire()
+    headers = {
+        "Authorization": f"Bearer {api_key}",
+        "Content-Type": "application/json"
+    }
+    # orjson is markedly faster than stdlib json on multi-MB base64 image payloads
+    response = await client.post(OPENROUTER_URL, headers=headers, content=orjson.dumps(payload), timeout=timeout)
+    response.raise_for_status()
+    return orjson.loads(response.content)
+
+
+def _movement_context(movements):
+    """Describe the movement detected around a frame, for the vision prompt."""
+    if not movements:
+        return ""
+    return f"Movement detected: {movements[0]['movement_type']} (intensity: {movements[0]['intensity']})"
+
+
+async def analyze_interaction_patterns(client, key_frames, movement_patterns, api_key=None):
+    """Analyze key frames for user interaction problems and actionable fixes.
     
-    print(f"🚀 Fast analysis: Analyzing {len(sample_indices)} key frames...")
+    `key_frames` is a list of (frame_index, frame_path) pairs; movement detected
+    around a frame is passed to the model as extra context.
+    """
+    if not key_frames:
+        return []
     
-    for i in sample_indices:
-        if i >= len(frame_files):
-            break
-            
-        frame_path = frame_files[i]
-        print(f"🔍 Analyzing interaction frame {sample_indices.index(i)+1}/{len(sample_indices)}...")
-        
-        interaction_analysis = analyze_single_interaction_frame(
-            frame_path, api_key, i, movement_patterns
+    frame_movements = [
+        [m for m in movement_patterns if frame_index in m['frame_pair']]
+        for frame_index, _ in key_frames
+    ]
+    
+    # Visually duplicate frames (static UI) reuse the analysis of the first match
+    representatives = _group_duplicate_frames([frame_path for _, frame_path in key_frames])
+    unique_positions = [p for p, rep in enumerate(representatives) if rep == p]
+    
+    print(f"🚀 Fast analysis: Analyzing {len(unique_positions)} key frames "
+          f"({len(key_frames) - len(unique_positions)} duplicates skipped)...")
+    
+    analyses = {}
+    
+    # Cache entries use the per-frame prompt, so batched and per-frame runs share them
+    cache_keys = {}
+    if AI_CACHE_ENABLED:
+        for position in unique_positions:
+            base64_image = _to_jpeg_b64(key_frames[position][1])
+            if not base64_image:
+                continue
+            prompt = f"{INTERACTION_PROMPT}\n{_movement_context(frame_movements[position])}"
+            cache_keys[position] = _ai_cache_key(base64_image, prompt, VISION_MODEL)
+            cached = _cached_analysis(cache_keys[position])
+            if cached is not None:
+                analyses[position] = cached
+        if analyses:
+            print(f"♻️ Reusing {len(analyses)} cached frame analyses")
+    
+    pending = [p for p in unique_positions if p not in analyses]
+    
+    # One multi-image request for the uncached key frames; fall back to per-frame calls on failure
+    if len(pending) > 1:
+        print(f"🔍 Analyzing {len(pending)} interaction frames in one request...")
+        context = "".join(
+            f"\nFrame {n}: {_movement_context(frame_movements[p])}"
+            for n, p in enumerate(pending, 1) if frame_movements[p]
         )
-        if interaction_analysis:
-            interaction_analyses.append(interaction_analysis)
+        try:
+            results = await analyze_frames_batch_with_ai(
+                client, [str(key_frames[p][1]) for p in pending], INTERACTION_PROMPT + context, api_key
+            )
+            for position, analysis in zip(pending, results):
+                analyses[position] = analysis
+                if position in cache_keys:
+                    _store_analysis(cache_keys[position], analysis)
+            pending = []
+        except Exception as e:
+            print(f"⚠️ Batched analysis failed, analyzing frames individually: {e}")
+    
+    if pending:
+        # Issue all frame requests concurrently, bounded by the semaphore
+        semaphore = asyncio.Semaphore(MAX_CONCURRENT_REQUESTS)
         
-        time.sleep(0.2)  # Reduced rate limiting for speed
+        async def analyze(n, position):
+            frame_path = key_frames[position][1]
+            prompt = f"{INTERACTION_PROMPT}\n{_movement_context(frame_movements[position])}"
+            async with semaphore:
+                print(f"🔍 Analyzing interaction frame {n}/{len(pending)}...")
+                try:
+                    return await analyze_frame_with_ai(client, str(frame_path), prompt, api_key)
+                except Exception as e:
+                    print(f"❌ Error analyzing frame {Path(frame_path).name}: {e}")
+                    return None
+        
+        results = await asyncio.gather(*(
+            analyze(n, position) for n, position in enumerate(pending, 1)
+        ))
+        analyses.update(zip(pending, results))
+    
+    interaction_analyses = []
+    dropped = []
+    for position, (frame_index, frame_path) in enumerate(key_frames):
+        analysis = analyses[representatives[position]]
+        if analysis is None:
+            dropped.append(Path(frame_path).name)
+            continue
+        interaction_analyses.append({
+            'frame': Path(frame_path).name,
+            'frame_index': frame_index,
+            'analysis': analysis,
+            'movement_patterns': frame_movements[position]
+        })
+    
+    if dropped:
+        print(f"⚠️ Dropped {len(dropped)} frames with no analysis: {', '.join(dropped)}")
     
-    return interaction_analyses, movement_patterns
+    return interaction_analyses
 
 
-def analyze_interaction_patterns_fast(frames_dir: str, analysis_id: str) -> Dict[str, Any]:
+async def analyze_interaction_patterns_fast(frames_dir: str, analysis_id: str) -> Dict[str, Any]:
     """
     Fast analysis of interaction patterns using AI vision.
-    Optimized for speed: analyzes only 6 key frames with reduced rate limiting.
+    Thin wrapper over analyze_interaction_patterns for an existing frames directory
+    (no movement data): analyzes only 6 key frames.
     """
     print("🤖 Analyzing interaction patterns with AI...")
-    print("🔍 Analyzing cursor movement patterns...")
     
     # Get all frame files
-    frame_files = sorted([f for f in os.listdir(frames_dir) if f.endswith('.png')])
+    frame_files = list_frame_files(frames_dir)
     
     if not frame_files:
         return {"error": "No frames found for analysis"}
     
     # Fast analysis: analyze only 6 key frames (every 20th frame, max 6)
     step = max(1, len(frame_files) // 6)
-    key_frames = frame_files[::step][:6]
+    key_frames = [
+        (i, os.path.join(frames_dir, frame_files[i]))
+        for i in range(0, len(frame_files), step)
+    ][:6]
     
-    print(f"🚀 Fast analysis: Analyzing {len(key_frames)} key frames...")
-    
-    analyses = []
-    for i, frame_file in enumerate(key_frames, 1):
-        print(f"🔍 Analyzing interaction frame {i}/{len(key_frames)}...")
-        
-        frame_path = os.path.join(frames_dir, frame_file)
-        
-        # Enhanced prompt for more actionable insights
-        prompt = f"""
-        Analyze this video frame showing user interaction with a web interface. 
-        Focus on identifying specific problems and providing actionable solutions.
-
-        **Analysis Requirements:**
-        1. **Problem Identification**: What specific issue is the user experiencing?
-        2. **Root Cause**: Why is this happening? (UI/UX problem, unclear instructions, etc.)
-        3. **Actionable Solution**: Provide 2-3 specific, implementable fixes
-        4. **Priority**: Rate the urgency (High/Medium/Low)
-
-        **Format your response as:**
-        ## Problem: [Clear description of the issue]
-        **Why it's happening:** [Root cause analysis]
-        **How to fix it:**
-        1. [Specific actionable solution]
-        2. [Specific actionable solution]
-        3. [Specific actionable solution]
-        **Priority:** [High/Medium/Low]
-
-        If no clear problem is visible, state: "No significant issues detected in this frame."
-        """
-        
-        try:
-            analysis = analyze_frame_with_ai(frame_path, prompt)
-            analyses.append({
-                "frame": frame_file,
-                "analysis": analysis
-            })
-            time.sleep(0.2)  # Reduced rate limiting for speed
-        except Exception as e:
-            print(f"❌ Error analyzing frame {frame_file}: {e}")
-            analyses.append({
-                "frame": frame_file,
-                "analysis": f"Error analyzing frame: {str(e)}"
-            })
+    async with _create_client() as client:
+        analyses = await analyze_interaction_patterns(client, key_frames, [])
     
     return {
-        "frame_analyses": analyses,
-        "total_frames_analyzed": len(key_frames)
+        "frame_analyses": [
+            {"frame": item['frame'], "analysis": item['analysis']} for item in analyses
+        ],
+        "total_frames_analyzed": len(analyses)
     }
 
 
-def analyze_single_interaction_frame(frame_path, api_key, frame_index, movement_patterns):
-    """Analyze a single frame for user interaction patterns."""
-    base64_image = encode_image_to_base64(frame_path)
-    if not base64_image:
-        return None
-    
-    # Find relevant movement patterns for this frame
-    relevant_movements = [
-        m for m in movement_patterns 
-        if frame_path.name in m['frame_pair']
-    ]
-    
-    movement_context = ""
-    if relevant_movements:
-        movement_context = f"\n\nMovement detected: {relevant_movements[0]['movement_type']} (intensity: {relevant_movements[0]['intensity']})"
-    
-    url = "https://openrouter.ai/api/v1/chat/completions"
-    headers = {
-        "Authorization": f"Bearer {api_key}",
-        "Content-Type": "application/json"
-    }
-    
-    payload = {
-        "model": "openai/gpt-4o",
-        "messages": [
-            {
-                "role": "system",
-                "content": """You are a user interaction analyst. Look at this frame and identify:
+def encode_image_to_base64(image_path):
+    """Encode image to base64 for API transmission."""
+    # Encode straight from the mapped file; base64 output is pure ASCII
+    with open(image_path, "rb") as image_file, \
+            mmap.mmap(image_file.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+        return base64.b64encode(mapped).decode('ascii')
 
-1. **Visible User Actions**: What is the user doing? (clicking, typing, scrolling, hovering)
-2. **Interaction Patterns**: Are there signs of hesitation, confusion, or smooth flow?
-3. **Potential Friction**: What might be causing the user to pause, repeat actions, or struggle?
-4. **Interface Response**: How is the interface responding to user actions?
 
-Focus on ACTUAL user behavior you can observe, not assumptions."""
-            },
-            {
-                "role": "user",
-                "content": [
-                    {
-                        "type": "text",
-                        "text": f"Analyze this frame (Frame {frame_index + 1}) for actual user interaction patterns. What is the user doing and what friction points might be occurring?{movement_context}"
-                    },
-                    {
-                        "type": "image_url",
-                        "image_url": {
-                            "url": f"data:image/png;base64,{base64_image}"
-                        }
-                    }
-                ]
-            }
-        ],
-        "max_tokens": 600
-    }
+def _to_jpeg_b64(image_path):
+    """Base64-encode a frame as JPEG, re-encoding (and downscaling) non-JPEG inputs."""
+    if str(image_path).lower().endswith(('.jpg', '.jpeg')):
+        return encode_image_to_base64(image_path)
     
-    try:
-        response = requests.post(url, headers=headers, json=payload, timeout=30)
-        response.raise_for_status()
-        result = response.json()
-        analysis = result['choices'][0]['message']['content']
-        
-        return {
-            'frame': frame_path.name,
-            'frame_index': frame_index,
-            'interaction_analysis': analysis,
-            'movement_patterns': relevant_movements
-        }
-        
-    except Exception as e:
-        print(f"Error analyzing interaction frame {frame_path.name}: {e}")
+    img = cv2.imread(str(image_path))
+    if img is None:
+        return None
+    ok, buf = cv2.imencode('.jpg', _limit_size(img), [cv2.IMWRITE_JPEG_QUALITY, JPEG_QUALITY])
+    if not ok:
         return None
+    return base64.b64encode(buf).decode('ascii')
 
 
-def encode_image_to_base64(image_path):
-    """Encode image to base64 for API transmission."""
-    with open(image_path, "rb") as image_file:
-        return base64.b64encode(image_file.read()).decode('utf-8')
+def _get_ai_cache():
+    """Open the analysis cache database on first use."""
+    global _ai_cache
+    if _ai_cache is None:
+        _ai_cache = sqlite3.connect(AI_CACHE_PATH)
+        _ai_cache.execute(
+            "CREATE TABLE IF NOT EXISTS analyses (key TEXT PRIMARY KEY, analysis TEXT)"
+        )
+    return _ai_cache
+
+
+def _ai_cache_key(base64_image, prompt, model):
+    """Content hash of the uploaded image, prompt and model."""
+    digest = hashlib.blake2b(digest_size=16)
+    for part in (base64_image, prompt, model):
+        digest.update(part.encode('utf-8'))
+        digest.update(b'\0')
+    return digest.hexdigest()
 
 
-def analyze_frame_with_ai(image_path: str, prompt: str) -> str:
+def _cached_analysis(cache_key):
+    """Cached analysis for the key, or None."""
+    row = _get_ai_cache().execute(
+        "SELECT analysis FROM analyses WHERE key = ?", (cache_key,)
+    ).fetchone()
+    return row[0] if row else None
+
+
+def _store_analysis(cache_key, analysis):
+    """Save an analysis under its cache key."""
+    cache = _get_ai_cache()
+    cache.execute(
+        "INSERT OR REPLACE INTO analyses (key, analysis) VALUES (?, ?)",
+        (cache_key, analysis)
+    )
+    cache.commit()
+
+
+async def analyze_frame_with_ai(client: httpx.AsyncClient, image_path: str, prompt: str, api_key: Optional[str] = None) -> str:
     """
     Analyze a single frame using OpenRouter API with GPT-4o Vision.
     
     Args:
+        client: Shared async HTTP client
         image_path: Path to the image file
         prompt: Analysis prompt for the AI
+        api_key: OpenRouter key (defaults to OPENROUTER_API_KEY)
     
     Returns:
         Analysis result as string
     """
-    api_key = os.getenv('OPENROUTER_API_KEY')
+    api_key = api_key or os.getenv('OPENROUTER_API_KEY')
     if not api_key:
         raise ValueError("OPENROUTER_API_KEY environment variable not set")
     
     # Encode image to base64
-    base64_image = encode_image_to_base64(image_path)
+    base64_image = _to_jpeg_b64(image_path)
+    if not base64_image:
+        raise ValueError(f"Could not read image: {image_path}")
     
-    # Prepare API request
-    headers = {
-        "Authorization": f"Bearer {api_key}",
-        "Content-Type": "application/json"
-    }
+    # Identical frames (repeat runs, static UI) reuse the cached analysis
+    cache_key = None
+    if AI_CACHE_ENABLED:
+        cache_key = _ai_cache_key(base64_image, prompt, VISION_MODEL)
+        cached = _cached_analysis(cache_key)
+        if cached is not None:
+            return cached
     
+    # Prepare API request
     payload = {
-        "model": "openai/gpt-4o",
+        "model": VISION_MODEL,
         "messages": [
             {
                 "role": "user",
@@ -349,7 +686,7 @@ def analyze_frame_with_ai(image_path: str, prompt: str) -> str:
                     {
                         "type": "image_url",
                         "image_url": {
-                            "url": f"data:image/png;base64,{base64_image}"
+                            "url": f"data:image/jpeg;base64,{base64_image}"
                         }
                     }
                 ]
@@ -360,27 +697,83 @@ def analyze_frame_with_ai(image_path: str, prompt: str) -> str:
     }
     
     try:
-        response = requests.post(
-            "https://openrouter.ai/api/v1/chat/completions",
-            headers=headers,
-            json=payload,
-            timeout=30
-        )
-        response.raise_for_status()
-        
-        result = response.json()
+        result = await _post_chat(client, api_key, payload)
         if 'choices' in result and len(result['choices']) > 0:
-            return result['choices'][0]['message']['content']
+            analysis = result['choices'][0]['message']['content']
+            if cache_key:
+                _store_analysis(cache_key, analysis)
+            return analysis
         else:
             return "No analysis result received from API"
             
-    except requests.exceptions.RequestException as e:
+    except httpx.HTTPError as e:
         raise Exception(f"API request failed: {str(e)}")
     except Exception as e:
         raise Exception(f"Analysis failed: {str(e)}")
 
 
-def analyze_user_behavior_patterns(interaction_analyses, movement_patterns, api_key):
+async def analyze_frames_batch_with_ai(client: httpx.AsyncClient, image_paths: List[str], prompt: str, api_key: Optional[str] = None) -> List[str]:
+    """
+    Analyze several frames in a single OpenRouter request.
+    
+    Args:
+        client: Shared async HTTP client
+        image_paths: Paths to the image files, in frame order
+        prompt: Per-frame analysis prompt for the AI
+        api_key: OpenRouter key (defaults to OPENROUTER_API_KEY)
+    
+    Returns:
+        One analysis string per image, in the same order
+    """
+    api_key = api_key or os.getenv('OPENROUTER_API_KEY')
+    if not api_key:
+        raise ValueError("OPENROUTER_API_KEY environment variable not set")
+    
+    batch_prompt = f"""{prompt}
+        You are given {len(image_paths)} frames, numbered 1 to {len(image_paths)} in the order attached.
+        Apply the analysis above to each frame separately.
+        Respond with ONLY a JSON array of {len(image_paths)} objects of the form
+        {{"frame": <frame number>, "analysis": "<analysis in the format above>"}}.
+        """
+    
+    content = [{"type": "text", "text": batch_prompt}]
+    for image_path in image_paths:
+        base64_image = _to_jpeg_b64(image_path)
+        if not base64_image:
+            raise ValueError(f"Could not read image: {image_path}")
+        content.append({
+            "type": "image_url",
+            "image_url": {
+                "url": f"data:image/jpeg;base64,{base64_image}"
+            }
+        })
+    
+    payload = {
+        "model": VISION_MODEL,
+        "messages": [{"role": "user", "content": content}],
+        "max_tokens": 1000 * len(image_paths),
+        "temperature": 0.3
+    }
+    
+    # Generation time grows with the number of frames, so scale the read timeout with it
+    # rather than retrying a slow but healthy batch on the single-frame timeout
+    timeout = httpx.Timeout(READ_TIMEOUT_PER_FRAME * len(image_paths), connect=5)
+    result = await _post_chat(client, api_key, payload, timeout)
+    text = result['choices'][0]['message']['content'].strip()
+    
+    # Tolerate a fenced ```json block around the array
+    if text.startswith('```'):
+        text = text.split('\n', 1)[1].rsplit('```', 1)[0]
+    
+    items = orjson.loads(text)
+    analyses = {int(item['frame']): item['analysis'] for item in items}
+    if len(analyses) != len(image_paths):
+        raise ValueError(f"Expected {len(image_paths)} frame analyses, got {len(analyses)}")
+    
+    return [analyses[i] for i in range(1, len(image_paths) + 1)]
+
+
+async def analyze_user_behavior_patterns(client, interaction_analyses, movement_patterns, api_key):
     """Analyze overall user behavior patterns and friction points."""
     if not interaction_analyses:
         return None
@@ -396,12 +789,6 @@ def analyze_user_behavior_patterns(interaction_analyses, movement_patterns, api_
     for pattern in movement_patterns:
         movement_summary += f"- {pattern['movement_type']} at {pattern['timestamp']:.1f}s (intensity: {pattern['intensity']})\n"
     
-    url = "https://openrouter.ai/api/v1/chat/completions"
-    headers = {
-        "Authorization": f"Bearer {api_key}",
-        "Content-Type": "application/json"
-    }
-    
     payload = {
         "model": "openai/gpt-4o",
         "messages": [
@@ -426,15 +813,30 @@ Focus on what you can actually observe from the user's behavior."""
     }
     
     try:
-        response = requests.post(url, headers=headers, json=payload, timeout=30)
-        response.raise_for_status()
-        result = response.json()
+        result = await _post_chat(client, api_key, payload)
         return result['choices'][0]['message']['content']
     except Exception as e:
         print(f"Error analyzing user behavior patterns: {e}")
         return None
 
 
+async def run_ai_analysis(key_frames, movement_patterns, api_key):
+    """Run frame and behavior analysis over a single shared HTTP client."""
+    async with _create_client() as client:
+        interaction_analyses = await analyze_interaction_patterns(client, key_frames, movement_patterns, api_key)
+        
+        if not interaction_analyses:
+            return interaction_analyses, None
+        
+        # Analyze overall user behavior
+        print(f"\n🎯 Analyzing user behavior patterns...")
+        behavior_analysis = await analyze_user_behavior_patterns(
+            client, interaction_analyses, movement_patterns, api_key
+        )
+    
+    return interaction_analyses, behavior_analysis
+
+
 def generate_interaction_report(interaction_analyses, movement_patterns, behavior_analysis, video_name, output_path):
     """Generate a report focused on actual user interactions."""
     print(f"\n📝 Generating interaction analysis report...")
@@ -503,11 +905,6 @@ def main():
         print(f"Error: Video file '{args.video_path}' not found.")
         sys.exit(1)
     
-    # Check if ffmpeg is available
-    if not check_ffmpeg():
-        print("Error: ffmpeg is not installed or not available in PATH.")
-        sys.exit(1)
-    
     # Check for OpenRouter API key
     api_key = os.getenv('OPENROUTER_API_KEY')
     if not api_key:
@@ -516,8 +913,8 @@ def main():
     
     print("🎯 Starting User Interaction Analysis...")
     
-    # Extract interaction frames
-    frame_count, frame_files = extract_interaction_frames(
+    # Detect movement while streaming, keeping only the AI key frames on disk
+    frame_count, key_frames, movement_patterns = extract_interaction_frames(
         args.video_path, 
         args.output, 
         args.fps
@@ -527,17 +924,15 @@ def main():
         print("No frames extracted. Exiting.")
         sys.exit(1)
     
-    # Analyze interaction patterns
-    interaction_analyses, movement_patterns = analyze_interaction_patterns(frame_files, api_key)
+    # Analyze interaction patterns and overall user behavior
+    interaction_analyses, behavior_analysis = asyncio.run(
+        run_ai_analysis(key_frames, movement_patterns, api_key)
+    )
     
     if not interaction_analyses:
         print("No interaction patterns were identified. Exiting.")
         sys.exit(1)
     
-    # Analyze overall user behavior
-    print(f"\n🎯 Analyzing user behavior patterns...")
-    behavior_analysis = analyze_user_behavior_patterns(interaction_analyses, movement_patterns, api_key)
-    
     # Generate report
     video_name = Path(args.video_path).stem
     analysis_dir = args.analysis
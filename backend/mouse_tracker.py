@@ -13,16 +13,50 @@ This tool analyzes video recordings to track actual mouse movements and clicks:
 import argparse
 import cv2
 import numpy as np
-import json
+import orjson
 import os
+import subprocess
 import sys
 import time
 from pathlib import Path
 from typing import List, Dict, Any, Tuple
-import matplotlib
-matplotlib.use('Agg')  # Use non-interactive backend to prevent GUI issues
-import matplotlib.pyplot as plt
-from collections import defaultdict
+import multiprocessing
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice, repeat
+
+# Videos of at least two segments of this many frames (5 minutes at 30 FPS) are split
+# into segments tracked by separate processes, up to one per core
+SEGMENT_MIN_FRAMES = 9000
+TRACK_PROCESSES = os.cpu_count() or 1
+
+# Frames decoded ahead of cursor detection
+FRAME_QUEUE_SIZE = 32
+
+# Threads running cursor detection, and frames handed to them at a time
+DETECT_WORKERS = min(8, os.cpu_count() or 1)
+DETECT_BATCH_SIZE = 16
+
+# The trackers look for the cursor at half resolution: the mask and contour pass touch
+# a quarter of the pixels, and a 10-500 px cursor is still several pixels across
+CURSOR_DETECT_SCALE = 0.5
+
+# Run cursor masking on an OpenCL device when OpenCV has one (disable with
+# OPENCV_OPENCL_DEVICE=disabled)
+USE_OPENCL = cv2.ocl.haveOpenCL() and cv2.ocl.useOpenCL()
+
+# If no pixel of a sampled frame differs from the last searched frame by more than this,
+# the previous cursor detection is reused. A moving cursor changes its edge pixels by far
+# more, while unchanged regions of a compressed recording stay within a few levels
+STATIC_FRAME_THRESHOLD = 24
+
+# Furthest a cursor can move between two frames of detect_clicks and still be compared
+# with itself, in pixels
+CLICK_MATCH_RADIUS = 20
+
+# Side of one heat map grid cell in the written image, in pixels
+HEAT_MAP_CELL_PIXELS = 10
 
 
 def check_opencv():
@@ -34,38 +68,109 @@ def check_opencv():
         return False
 
 
-def detect_cursor_position(frame):
-    """Detect cursor position in a frame using template matching or color detection."""
-    # Convert to HSV for better color detection
-    hsv = cv2.cvtColor(frame, cv2.COLOR_BGR2HSV)
-    
-    # Common cursor colors (white, black, blue, etc.)
+def open_video_capture(video_path):
+    """Open a video for decoding, using hardware-accelerated decoding where available."""
+    try:
+        # VIDEO_ACCELERATION_ANY falls back to software decoding when no device is usable
+        cap = cv2.VideoCapture(video_path, cv2.CAP_FFMPEG, [
+            cv2.CAP_PROP_HW_ACCELERATION, cv2.VIDEO_ACCELERATION_ANY
+        ])
+        if cap.isOpened():
+            return cap
+    except (AttributeError, TypeError, cv2.error):
+        pass  # OpenCV build without the hardware acceleration API
+    return cv2.VideoCapture(video_path)
+
+
+def _cursor_min_threshold():
+    """Per max(B,G,R), the smallest min(B,G,R) at which a pixel counts as cursor-coloured."""
+    # Cursor colours are white (S <= 30, V >= 200) or black (V <= 30) in HSV. V is the
+    # channel max and S depends only on max and min, so run OpenCV's own conversion over
+    # every (max, min) pair once and keep the boundary; the mask then matches exactly
+    levels = np.arange(256, dtype=np.uint8)
+    vmax, vmin = np.broadcast_arrays(levels[:, None], levels[None, :])
+    hsv = cv2.cvtColor(np.dstack([vmax, vmin, vmin]), cv2.COLOR_BGR2HSV)
+    cursor = ((hsv[..., 1] <= 30) & (vmax >= 200)) | (vmax <= 30)
+    cursor &= vmin <= vmax
+    
+    # Saturation falls as the min rises, so each row is a run of False then True;
+    # rows with no cursor colour get max + 1, which no pixel's min can reach
+    threshold = np.where(cursor.any(axis=1), cursor.argmax(axis=1), levels.astype(np.int32) + 1)
+    return np.clip(threshold, 0, 255).astype(np.uint8)
+
+
+CURSOR_MIN_THRESHOLD = _cursor_min_threshold()
+
+
+# Per-thread scratch images for detect_cursor_position
+_mask_workspace = threading.local()
+
+# Stand-in for the scratch images when OpenCV allocates its own (UMat outputs)
+_NO_MASK_BUFFERS = dict.fromkeys(['small', 'channels', 'max', 'min', 'threshold', 'mask'])
+
+
+def _mask_buffers(height, width):
+    """This thread's scratch images for cursor masking, reallocated only when the size changes."""
+    buffers = getattr(_mask_workspace, 'buffers', None)
+    if buffers is None or buffers['mask'].shape != (height, width):
+        plane = (height, width)
+        buffers = {
+            'small': np.empty((height, width, 3), dtype=np.uint8),
+            'channels': [np.empty(plane, dtype=np.uint8) for _ in range(3)],
+            'max': np.empty(plane, dtype=np.uint8),
+            'min': np.empty(plane, dtype=np.uint8),
+            'threshold': np.empty(plane, dtype=np.uint8),
+            'mask': np.empty(plane, dtype=np.uint8)
+        }
+        _mask_workspace.buffers = buffers
+    return buffers
+
+
+def detect_cursor_position(frame, scale=1.0):
+    """Detect cursor position in a frame using template matching or color detection.
+    
+    With scale < 1 the frame is downscaled before masking; positions and areas are
+    still returned in full-resolution pixels.
+    """
+    height, width = frame.shape[:2]
+    height, width = round(height * scale), round(width * scale)
+    
+    # With OpenCL, the resize and mask steps run on the GPU through the transparent API;
+    # only the finished mask is downloaded for contour tracing. On the CPU every step
+    # writes into this thread's reusable buffers instead of allocating new images
+    if USE_OPENCL:
+        frame = cv2.UMat(frame)
+        buffers = _NO_MASK_BUFFERS
+    else:
+        buffers = _mask_buffers(height, width)
+    
+    if scale != 1.0:
+        frame = cv2.resize(
+            frame, None, dst=buffers['small'], fx=scale, fy=scale, interpolation=cv2.INTER_AREA
+        )
+    
+    # Common cursor colors (white, black): a single LUT lookup on the channel max and
+    # min replaces the HSV conversion and the two inRange masks
     cursor_positions = []
-    
-    # Try to detect white cursor
-    lower_white = np.array([0, 0, 200])
-    upper_white = np.array([180, 30, 255])
-    white_mask = cv2.inRange(hsv, lower_white, upper_white)
-    
-    # Try to detect black cursor
-    lower_black = np.array([0, 0, 0])
-    upper_black = np.array([180, 255, 30])
-    black_mask = cv2.inRange(hsv, lower_black, upper_black)
-    
-    # Combine masks
-    cursor_mask = cv2.bitwise_or(white_mask, black_mask)
+    b, g, r = cv2.split(frame, buffers['channels'])
+    channel_max = cv2.max(cv2.max(b, g, dst=buffers['max']), r, dst=buffers['max'])
+    channel_min = cv2.min(cv2.min(b, g, dst=buffers['min']), r, dst=buffers['min'])
+    threshold = cv2.LUT(channel_max, CURSOR_MIN_THRESHOLD, dst=buffers['threshold'])
+    cursor_mask = cv2.compare(channel_min, threshold, cv2.CMP_GE, dst=buffers['mask'])
+    if USE_OPENCL:
+        cursor_mask = cursor_mask.get()
     
     # Find contours
     contours, _ = cv2.findContours(cursor_mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
     
     for contour in contours:
         area = cv2.contourArea(contour)
-        if 10 < area < 500:  # Reasonable cursor size
+        if 10 * scale * scale < area < 500 * scale * scale:  # Reasonable cursor size
             M = cv2.moments(contour)
             if M["m00"] != 0:
-                cx = int(M["m10"] / M["m00"])
-                cy = int(M["m01"] / M["m00"])
-                cursor_positions.append((cx, cy, area))
+                cx = int(M["m10"] / M["m00"] / scale)
+                cy = int(M["m01"] / M["m00"] / scale)
+                cursor_positions.append((cx, cy, area / (scale * scale)))
     
     return cursor_positions
 
@@ -74,85 +179,213 @@ def detect_clicks(frame_sequence, threshold=50):
     """Detect clicks by looking for sudden changes in cursor area."""
     clicks = []
     
+    if len(frame_sequence) == 0:
+        return clicks
+    
+    # Each frame's cursors are detected once and carried over as the next frame's previous ones
+    prev_cursors = detect_cursor_position(frame_sequence[0])
+    
     for i in range(1, len(frame_sequence)):
-        prev_frame = frame_sequence[i-1]
-        curr_frame = frame_sequence[i]
-        
         # Get cursor positions
-        prev_cursors = detect_cursor_position(prev_frame)
-        curr_cursors = detect_cursor_position(curr_frame)
+        curr_cursors = detect_cursor_position(frame_sequence[i])
         
-        # Check for click indicators (sudden area change)
-        for prev_cursor in prev_cursors:
-            for curr_cursor in curr_cursors:
-                area_diff = abs(curr_cursor[2] - prev_cursor[2])
-                if area_diff > threshold:  # Significant area change indicates click
-                    clicks.append({
-                        'frame': i,
-                        'position': (curr_cursor[0], curr_cursor[1]),
-                        'timestamp': i / 30.0,  # Assuming 30 FPS
-                        'area_change': area_diff
-                    })
+        # Check for click indicators (sudden area change), comparing each cursor only with
+        # the nearest cursor of the previous frame rather than with every blob in it
+        if prev_cursors and curr_cursors:
+            prev = np.array(prev_cursors, dtype=np.float64)
+            curr = np.array(curr_cursors, dtype=np.float64)
+            distances = np.hypot(curr[:, None, 0] - prev[None, :, 0], curr[:, None, 1] - prev[None, :, 1])
+            nearest = distances.argmin(axis=1)
+            area_diffs = np.abs(curr[:, 2] - prev[nearest, 2])
+            matched = distances[np.arange(len(curr)), nearest] <= CLICK_MATCH_RADIUS
+            
+            # Significant area change indicates click
+            for j in np.flatnonzero(matched & (area_diffs > threshold)).tolist():
+                clicks.append({
+                    'frame': i,
+                    'position': (curr_cursors[j][0], curr_cursors[j][1]),
+                    'timestamp': i / 30.0,  # Assuming 30 FPS
+                    'area_change': area_diffs[j].item()
+                })
+        
+        prev_cursors = curr_cursors
     
     return clicks
 
 
-def track_mouse_movement(video_path, output_dir):
-    """Track mouse movement throughout the video."""
-    print(f"🎯 Tracking mouse movements in {video_path}...")
-    
-    cap = cv2.VideoCapture(video_path)
-    if not cap.isOpened():
-        print(f"Error: Could not open video {video_path}")
-        return None
+def read_sampled_frames(cap, sample_every, total_frames, progress_every, start_frame=0, end_frame=None):
+    """Yield (frame index, frame) for every `sample_every`-th frame, decoded on a reader thread.
+    
+    The capture must already be positioned at start_frame; reading stops before end_frame
+    (None reads to the end of the stream).
+    """
+    # Bounded queue: decoding runs ahead of detection by at most FRAME_QUEUE_SIZE frames;
+    # None marks the end of the stream
+    frame_queue = queue.Queue(maxsize=FRAME_QUEUE_SIZE)
+    stop = threading.Event()
+    
+    def read():
+        frame_count = start_frame
+        try:
+            while not stop.is_set() and (end_frame is None or frame_count < end_frame):
+                # Skipped frames are only grabbed, never retrieved (converted to BGR and copied out)
+                if not cap.grab():
+                    break
+                
+                if frame_count % sample_every == 0:
+                    ret, frame = cap.retrieve()
+                    if not ret:
+                        break
+                    frame_queue.put((frame_count, frame))
+                
+                frame_count += 1
+                
+                # Progress indicator
+                if frame_count % progress_every == 0:
+                    progress = (frame_count / total_frames) * 100
+                    print(f"📈 Progress: {progress:.1f}% ({frame_count}/{total_frames} frames)")
+        finally:
+            frame_queue.put(None)
+    
+    reader = threading.Thread(target=read, daemon=True)
+    reader.start()
+    
+    item = None
+    try:
+        while (item := frame_queue.get()) is not None:
+            yield item
+    finally:
+        # If the consumer gave up early, unblock the reader and let it reach the end marker
+        if item is not None:
+            stop.set()
+            while frame_queue.get() is not None:
+                pass
+        reader.join()
+
+
+def mark_static_frames(frames):
+    """Pass (frame index, frame) pairs through, replacing frames that look unchanged with None."""
+    prev_frame = None
+    for frame_count, frame in frames:
+        # The largest per-pixel difference is a single pass over both frames, cheaper
+        # than detecting the cursor again
+        if prev_frame is not None and cv2.norm(frame, prev_frame, cv2.NORM_INF) <= STATIC_FRAME_THRESHOLD:
+            yield frame_count, None
+        else:
+            # Compare against the last searched frame, so slow drift still adds up
+            prev_frame = frame
+            yield frame_count, frame
+
+
+def track_sampled_frames(cap, fps, total_frames, sample_every, progress_every, start_frame=0, end_frame=None):
+    """Detect the cursor in every `sample_every`-th frame of an open capture.
+    
+    Returns the tracked positions column-wise: a dict of equal-length arrays 'frame',
+    'x', 'y', 'timestamp' and 'area', one entry per frame where a cursor was found.
+    """
+    found_frames, found_xs, found_ys, found_areas = [], [], [], []
+    frames = mark_static_frames(
+        read_sampled_frames(cap, sample_every, total_frames, progress_every, start_frame, end_frame)
+    )
+    cursor_positions = []
     
+    # OpenCV releases the GIL, so batches of frames are searched concurrently while the
+    # reader thread keeps decoding; results come back in frame order
+    with ThreadPoolExecutor(max_workers=DETECT_WORKERS) as executor:
+        while batch := list(islice(frames, DETECT_BATCH_SIZE)):
+            detections = executor.map(
+                detect_cursor_position,
+                (frame for _, frame in batch if frame is not None),
+                repeat(CURSOR_DETECT_SCALE)
+            )
+            for frame_count, frame in batch:
+                # Unchanged frames keep the previous frame's cursors
+                if frame is not None:
+                    cursor_positions = next(detections)
+                
+                if cursor_positions:
+                    # Use the largest cursor (most likely the main cursor)
+                    main_cursor = max(cursor_positions, key=lambda x: x[2])
+                    found_frames.append(frame_count)
+                    found_xs.append(main_cursor[0])
+                    found_ys.append(main_cursor[1])
+                    found_areas.append(main_cursor[2])
+    
+    frame_indices = np.array(found_frames, dtype=np.int64)
+    return {
+        'frame': frame_indices,
+        'x': np.array(found_xs, dtype=np.int64),
+        'y': np.array(found_ys, dtype=np.int64),
+        'timestamp': frame_indices / fps,
+        'area': np.array(found_areas, dtype=np.float64)
+    }
+
+
+def track_segment(video_path, start_frame, end_frame, sample_every, progress_every):
+    """Track the cursor over frames [start_frame, end_frame) of a video, on its own capture."""
+    cap = open_video_capture(video_path)
     fps = cap.get(cv2.CAP_PROP_FPS)
     total_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
-    duration = total_frames / fps
-    
-    print(f"📊 Video info: {total_frames} frames, {fps:.1f} FPS, {duration:.1f}s duration")
-    
-    # Track mouse positions
-    mouse_positions = []
-    frame_count = 0
-    
-    while True:
-        ret, frame = cap.read()
-        if not ret:
-            break
-        
-        # Sample every 3rd frame to reduce processing time
-        if frame_count % 3 == 0:
-            cursor_positions = detect_cursor_position(frame)
-            
-            if cursor_positions:
-                # Use the largest cursor (most likely the main cursor)
-                main_cursor = max(cursor_positions, key=lambda x: x[2])
-                mouse_positions.append({
-                    'frame': frame_count,
-                    'position': (main_cursor[0], main_cursor[1]),
-                    'timestamp': frame_count / fps,
-                    'area': main_cursor[2]
-                })
-        
-        frame_count += 1
-        
-        # Progress indicator
-        if frame_count % 100 == 0:
-            progress = (frame_count / total_frames) * 100
-            print(f"📈 Progress: {progress:.1f}% ({frame_count}/{total_frames} frames)")
     
+    if start_frame:
+        # Keyframe seeks can land off target on inter-coded or variable-frame-rate streams,
+        # which would shift every index in the segment; unless the capture confirms it is
+        # at start_frame, reopen and decode up to the segment start instead
+        seeked = cap.set(cv2.CAP_PROP_POS_FRAMES, start_frame)
+        if not seeked or int(cap.get(cv2.CAP_PROP_POS_FRAMES)) != start_frame:
+            cap.release()
+            cap = open_video_capture(video_path)
+            for _ in range(start_frame):
+                if not cap.grab():
+                    break
+    
+    mouse_positions = track_sampled_frames(
+        cap, fps, total_frames, sample_every, progress_every, start_frame, end_frame
+    )
     cap.release()
-    
-    print(f"✅ Tracked {len(mouse_positions)} mouse positions")
     return mouse_positions
 
 
-def track_mouse_movement_fast(video_path, output_dir):
-    """Fast mouse movement tracking with reduced sampling."""
-    print(f"🎯 Fast tracking mouse movements in {video_path}...")
+def track_video(video_path, total_frames, sample_every, progress_every):
+    """Track the cursor through a whole video, splitting long videos across processes."""
+    segment_count = min(TRACK_PROCESSES, total_frames // SEGMENT_MIN_FRAMES)
+    if segment_count < 2:
+        return track_segment(video_path, 0, None, sample_every, progress_every)
+    
+    # Segment boundaries fall on multiples of sample_every, so the same frames are sampled
+    # as in a single pass; the last segment runs to the end of the stream
+    segment_length = -(-total_frames // (segment_count * sample_every)) * sample_every
+    starts = range(0, total_frames, segment_length)
+    segments = [
+        (video_path, start, start + segment_length if start + segment_length < total_frames else None,
+         sample_every, progress_every)
+        for start in starts
+    ]
+    
+    # Each process decodes its own segment; results are merged in frame order
+    with multiprocessing.get_context('spawn').Pool(len(segments)) as pool:
+        results = pool.starmap(track_segment, segments)
+    return {key: np.concatenate([result[key] for result in results]) for key in results[0]}
+
+
+def position_records(mouse_positions):
+    """Tracked positions as one dict per position (the raw data file's layout)."""
+    columns = (mouse_positions[key].tolist() for key in ('frame', 'x', 'y', 'timestamp', 'area'))
+    return [
+        {'frame': frame, 'position': (x, y), 'timestamp': timestamp, 'area': area}
+        for frame, x, y, timestamp, area in zip(*columns)
+    ]
+
+
+def track_mouse_movement(video_path, output_dir, sample_every=3, progress_every=100):
+    """Track mouse movement throughout the video.
+    
+    The cursor is searched for in every `sample_every`-th frame (every 3rd by default, to
+    reduce processing time).
+    """
+    print(f"🎯 Tracking mouse movements in {video_path}...")
     
-    cap = cv2.VideoCapture(video_path)
+    cap = open_video_capture(video_path)
     if not cap.isOpened():
         print(f"Error: Could not open video {video_path}")
         return None
@@ -163,106 +396,124 @@ def track_mouse_movement_fast(video_path, output_dir):
     
     print(f"📊 Video info: {total_frames} frames, {fps:.1f} FPS, {duration:.1f}s duration")
     
-    # Track mouse positions with reduced sampling
-    mouse_positions = []
-    frame_count = 0
-    
-    while True:
-        ret, frame = cap.read()
-        if not ret:
-            break
-        
-        # Sample every 10th frame instead of every 3rd for speed
-        if frame_count % 10 == 0:
-            cursor_positions = detect_cursor_position(frame)
-            
-            if cursor_positions:
-                # Use the largest cursor (most likely the main cursor)
-                main_cursor = max(cursor_positions, key=lambda x: x[2])
-                mouse_positions.append({
-                    'frame': frame_count,
-                    'position': (main_cursor[0], main_cursor[1]),
-                    'timestamp': frame_count / fps,
-                    'area': main_cursor[2]
-                })
-        
-        frame_count += 1
-        
-        # Progress indicator (less frequent)
-        if frame_count % 500 == 0:
-            progress = (frame_count / total_frames) * 100
-            print(f"📈 Progress: {progress:.1f}% ({frame_count}/{total_frames} frames)")
-    
     cap.release()
     
-    print(f"✅ Tracked {len(mouse_positions)} mouse positions")
+    # Track mouse positions
+    mouse_positions = track_video(video_path, total_frames, sample_every, progress_every)
+    
+    print(f"✅ Tracked {len(mouse_positions['frame'])} mouse positions")
     return mouse_positions
 
 
+def track_mouse_movement_fast(video_path, output_dir):
+    """Fast mouse movement tracking with reduced sampling."""
+    # Every 10th frame instead of every 3rd, and less frequent progress output
+    return track_mouse_movement(video_path, output_dir, sample_every=10, progress_every=500)
+
+
+def transcode_to_mjpeg(video_path, output_dir):
+    """Return an MJPEG copy of the video in output_dir, transcoding it on first use.
+    
+    Intra-only MJPEG decodes several times faster than H.264/H.265, so repeated runs on
+    the same recording skip the expensive decode. Falls back to the original video if
+    ffmpeg is unavailable or fails.
+    """
+    mjpeg_path = os.path.join(output_dir, f'{Path(video_path).stem}_mjpeg.avi')
+    if os.path.exists(mjpeg_path) and os.path.getmtime(mjpeg_path) >= os.path.getmtime(video_path):
+        print(f"♻️ Reusing MJPEG copy: {mjpeg_path}")
+        return mjpeg_path
+    
+    print(f"🎞️ Transcoding {video_path} to MJPEG...")
+    
+    # Write to a temporary name so an interrupted transcode is never reused
+    partial_path = mjpeg_path + '.part'
+    try:
+        result = subprocess.run(
+            ['ffmpeg', '-y', '-loglevel', 'error', '-i', video_path,
+             '-c:v', 'mjpeg', '-q:v', '3', '-an', '-f', 'avi', partial_path],
+            capture_output=True, text=True
+        )
+    except FileNotFoundError:
+        print("Warning: ffmpeg not found, tracking the original video")
+        return video_path
+    
+    if result.returncode != 0:
+        print(f"Warning: MJPEG transcode failed, tracking the original video: {result.stderr.strip()}")
+        if os.path.exists(partial_path):
+            os.remove(partial_path)
+        return video_path
+    
+    os.replace(partial_path, mjpeg_path)
+    print(f"✅ MJPEG copy saved to: {mjpeg_path}")
+    return mjpeg_path
+
+
 def analyze_movement_patterns(mouse_positions):
-    """Analyze mouse movement patterns for friction points."""
-    if not mouse_positions:
+    """Analyze mouse movement patterns (column-wise positions) for friction points."""
+    n = len(mouse_positions['frame'])
+    if n == 0:
         return {}
     
     print("🔍 Analyzing movement patterns...")
     
-    # Calculate movement statistics
-    movements = []
-    speeds = []
-    pauses = []
+    # Calculate movement statistics over consecutive positions in one pass
+    xs = np.asarray(mouse_positions['x'], dtype=np.float64)
+    ys = np.asarray(mouse_positions['y'], dtype=np.float64)
+    ts = np.asarray(mouse_positions['timestamp'], dtype=np.float64)
     
-    for i in range(1, len(mouse_positions)):
-        prev = mouse_positions[i-1]
-        curr = mouse_positions[i]
-        
-        # Calculate distance
-        dx = curr['position'][0] - prev['position'][0]
-        dy = curr['position'][1] - prev['position'][1]
-        distance = np.sqrt(dx*dx + dy*dy)
-        
-        # Calculate time difference
-        time_diff = curr['timestamp'] - prev['timestamp']
-        
-        # Calculate speed (pixels per second)
-        speed = distance / time_diff if time_diff > 0 else 0
-        
-        movements.append({
-            'from': prev['position'],
-            'to': curr['position'],
+    # Python-level positions and timestamps, only for the per-movement output
+    points = list(zip(
+        np.asarray(mouse_positions['x']).tolist(), np.asarray(mouse_positions['y']).tolist()
+    ))
+    timestamps = ts.tolist()
+    
+    distances = np.hypot(np.diff(xs), np.diff(ys))
+    time_diffs = np.diff(ts)
+    
+    # Speed in pixels per second (0 where the timestamps don't advance)
+    speeds = np.divide(distances, time_diffs, out=np.zeros_like(distances), where=time_diffs > 0)
+    
+    movements = [
+        {
+            'from': prev,
+            'to': curr,
             'distance': distance,
             'speed': speed,
             'time_diff': time_diff,
-            'timestamp': curr['timestamp']
-        })
-        
-        speeds.append(speed)
-        
-        # Detect pauses (very slow movement)
-        if speed < 10:  # Less than 10 pixels per second
-            pauses.append({
-                'position': curr['position'],
-                'timestamp': curr['timestamp'],
-                'duration': time_diff
-            })
+            'timestamp': timestamp
+        }
+        for prev, curr, distance, speed, time_diff, timestamp in zip(
+            points, points[1:], distances.tolist(), speeds.tolist(), time_diffs.tolist(), timestamps[1:]
+        )
+    ]
+    
+    # Detect pauses (very slow movement: less than 10 pixels per second)
+    pauses = [
+        {
+            'position': points[i + 1],
+            'timestamp': timestamps[i + 1],
+            'duration': time_diffs[i].item()
+        }
+        for i in np.flatnonzero(speeds < 10).tolist()
+    ]
     
     # Analyze patterns
-    avg_speed = np.mean(speeds) if speeds else 0
-    max_speed = np.max(speeds) if speeds else 0
-    total_distance = sum(m['distance'] for m in movements)
+    avg_speed = speeds.mean().item() if speeds.size else 0
+    max_speed = speeds.max().item() if speeds.size else 0
+    total_distance = distances.sum().item()
     
-    # Find areas of high activity (potential click zones)
-    activity_map = defaultdict(int)
-    for pos in mouse_positions:
-        x, y = pos['position']
-        # Round to grid for heat map
-        grid_x, grid_y = x // 50, y // 50
-        activity_map[(grid_x, grid_y)] += 1
+    # Find areas of high activity (potential click zones), rounding to the heat map grid
+    grid_cells = (np.stack([xs, ys], axis=1) // 50).astype(np.int64)
+    cells, first_seen, counts = np.unique(grid_cells, axis=0, return_index=True, return_counts=True)
     
-    # Find most active areas
-    hot_zones = sorted(activity_map.items(), key=lambda x: x[1], reverse=True)[:5]
+    # Find most active areas; ties go to the area visited first
+    hot_zones = [
+        ((int(cells[i, 0]), int(cells[i, 1])), int(counts[i]))
+        for i in np.lexsort((first_seen, -counts))[:5]
+    ]
     
     return {
-        'total_positions': len(mouse_positions),
+        'total_positions': n,
         'total_movements': len(movements),
         'average_speed': avg_speed,
         'max_speed': max_speed,
@@ -292,19 +543,19 @@ def detect_friction_points(movement_data):
             'description': f"User paused for {pause['duration']:.1f}s at position {pause['position']}"
         })
     
-    # Analyze erratic movements (potential confusion)
-    erratic_movements = []
-    for i in range(1, len(movement_data['movements'])):
-        prev = movement_data['movements'][i-1]
-        curr = movement_data['movements'][i]
-        
-        # Detect back-and-forth movement
-        if abs(curr['speed'] - prev['speed']) > 100:  # Sudden speed change
-            erratic_movements.append({
-                'position': curr['to'],
-                'timestamp': curr['timestamp'],
-                'speed_change': abs(curr['speed'] - prev['speed'])
-            })
+    # Analyze erratic movements (potential confusion): back-and-forth movement shows up
+    # as a sudden speed change between consecutive movements
+    movements = movement_data['movements']
+    speeds = np.fromiter((m['speed'] for m in movements), dtype=np.float64, count=len(movements))
+    speed_changes = np.abs(np.diff(speeds))
+    erratic_movements = [
+        {
+            'position': movements[i + 1]['to'],
+            'timestamp': movements[i + 1]['timestamp'],
+            'speed_change': speed_changes[i].item()
+        }
+        for i in np.flatnonzero(speed_changes > 100).tolist()
+    ]
     
     # Add erratic movement friction points
     for movement in erratic_movements[:5]:  # Top 5 most erratic
@@ -319,29 +570,55 @@ def detect_friction_points(movement_data):
     return friction_points
 
 
-def generate_heat_map(mouse_positions, output_path):
-    """Generate a heat map of mouse activity."""
-    if not mouse_positions:
+def generate_heat_map(mouse_positions, output_path, fancy=False):
+    """Generate a heat map of mouse activity from column-wise positions ('x' and 'y').
+    
+    By default the grid is colour-mapped and written directly with OpenCV; fancy=True
+    renders a labelled matplotlib figure with a colour bar instead.
+    """
+    if len(mouse_positions['x']) == 0:
         return
     
     print("🔥 Generating heat map...")
     
     # Create activity grid
     grid_size = 50
-    max_x = max(pos['position'][0] for pos in mouse_positions)
-    max_y = max(pos['position'][1] for pos in mouse_positions)
-    
-    grid_width = max_x // grid_size + 1
-    grid_height = max_y // grid_size + 1
-    
-    heat_map = np.zeros((grid_height, grid_width))
+    xs = np.asarray(mouse_positions['x'], dtype=np.int64)
+    ys = np.asarray(mouse_positions['y'], dtype=np.int64)
+    
+    grid_width = int(xs.max()) // grid_size + 1
+    grid_height = int(ys.max()) // grid_size + 1
+    
+    # Fill heat map: count positions per grid cell in one pass
+    grid_x = xs // grid_size
+    grid_y = ys // grid_size
+    inside = (grid_x >= 0) & (grid_y >= 0)
+    heat_map = np.bincount(
+        grid_y[inside] * grid_width + grid_x[inside], minlength=grid_width * grid_height
+    ).reshape(grid_height, grid_width)
+    
+    if fancy:
+        _plot_heat_map(heat_map, output_path)
+    else:
+        # Scale counts to 0-255, colour with the same 'hot' map and enlarge each grid
+        # cell to a visible block
+        scaled = (heat_map * (255.0 / max(heat_map.max(), 1))).astype(np.uint8)
+        heat_colored = cv2.applyColorMap(scaled, cv2.COLORMAP_HOT)
+        heat_colored = cv2.resize(
+            heat_colored, None, fx=HEAT_MAP_CELL_PIXELS, fy=HEAT_MAP_CELL_PIXELS,
+            interpolation=cv2.INTER_NEAREST
+        )
+        cv2.imwrite(output_path, heat_colored)
     
-    # Fill heat map
-    for pos in mouse_positions:
-        x, y = pos['position']
-        grid_x, grid_y = x // grid_size, y // grid_size
-        if 0 <= grid_x < grid_width and 0 <= grid_y < grid_height:
-            heat_map[grid_y, grid_x] += 1
+    print(f"✅ Heat map saved to: {output_path}")
+
+
+def _plot_heat_map(heat_map, output_path):
+    """Render the activity grid as a labelled matplotlib figure."""
+    # matplotlib is only needed here, so plain runs never pay for importing it
+    import matplotlib
+    matplotlib.use('Agg')  # Use non-interactive backend to prevent GUI issues
+    import matplotlib.pyplot as plt
     
     # Create heat map visualization
     plt.figure(figsize=(12, 8))
@@ -354,8 +631,6 @@ def generate_heat_map(mouse_positions, output_path):
     # Save heat map
     plt.savefig(output_path, dpi=300, bbox_inches='tight')
     plt.close()
-    
-    print(f"✅ Heat map saved to: {output_path}")
 
 
 def generate_movement_report(movement_data, friction_points, video_name, output_path):
@@ -421,6 +696,17 @@ def main():
         default='mouse_analysis',
         help='Output directory for analysis results (default: mouse_analysis)'
     )
+    parser.add_argument(
+        '--fancy-plot',
+        action='store_true',
+        help='Render the heat map as a labelled matplotlib figure instead of a plain colour-mapped grid'
+    )
+    parser.add_argument(
+        '--prefer-mjpeg',
+        action='store_true',
+        help='Transcode the video to MJPEG once (kept in the output directory) and track on that copy; '
+             'speeds up repeated runs on H.264/H.265 recordings'
+    )
     
     args = parser.parse_args()
     
@@ -440,9 +726,10 @@ def main():
     os.makedirs(args.output, exist_ok=True)
     
     # Track mouse movements
-    mouse_positions = track_mouse_movement(args.video_path, args.output)
+    video_path = transcode_to_mjpeg(args.video_path, args.output) if args.prefer_mjpeg else args.video_path
+    mouse_positions = track_mouse_movement(video_path, args.output)
     
-    if not mouse_positions:
+    if mouse_positions is None or len(mouse_positions['frame']) == 0:
         print("No mouse movements detected. Exiting.")
         sys.exit(1)
     
@@ -455,7 +742,7 @@ def main():
     # Generate heat map
     video_name = Path(args.video_path).stem
     heat_map_path = os.path.join(args.output, f'mouse_heat_map_{video_name}.png')
-    generate_heat_map(mouse_positions, heat_map_path)
+    generate_heat_map(mouse_positions, heat_map_path, fancy=args.fancy_plot)
     
     # Generate report
     timestamp = time.strftime('%Y%m%d_%H%M%S')
@@ -464,15 +751,15 @@ def main():
     
     # Save raw data
     data_path = os.path.join(args.output, f'mouse_data_{video_name}_{timestamp}.json')
-    with open(data_path, 'w') as f:
-        json.dump({
-            'mouse_positions': mouse_positions,
+    with open(data_path, 'wb') as f:
+        f.write(orjson.dumps({
+            'mouse_positions': position_records(mouse_positions),
             'movement_data': movement_data,
             'friction_points': friction_points
-        }, f, indent=2)
+        }, option=orjson.OPT_INDENT_2 | orjson.OPT_SERIALIZE_NUMPY))
     
     print(f"\n🎉 Mouse movement analysis complete!")
-    print(f"📊 Tracked {len(mouse_positions)} mouse positions")
+    print(f"📊 Tracked {len(mouse_positions['frame'])} mouse positions")
     print(f"🚨 Detected {len(friction_points)} friction points")
     print(f"📁 Results saved to: {args.output}")
     print(f"📄 Report: {report_path}")
@@ -1,25 +1,27 @@
 """Video processor service that handles asynchronous video analysis."""
 
+import asyncio
+import gzip
+import io
 import os
-import json
 import logging
+import queue
+import re
 import tempfile
-import base64
-from datetime import datetime
-import cv2
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from fractions import Fraction
 import numpy as np
+import orjson
 from google.cloud import storage, firestore, pubsub_v1
 from google.cloud.pubsub_v1.subscriber import message
-import ffmpeg
-import anthropic
-from PIL import Image
-import io
-import matplotlib
-matplotlib.use('Agg')  # Use non-interactive backend
-import matplotlib.pyplot as plt
+from google.cloud.pubsub_v1.subscriber.scheduler import ThreadScheduler
+import pybase64
 
 from config import Config
-from mouse_tracker import generate_heat_map
+
+# cv2, ffmpeg, anthropic and mouse_tracker are imported where they are used, keeping
+# them off the worker's cold-start path
 
 # Initialize logging
 logging.basicConfig(level=logging.INFO)
@@ -28,12 +30,40 @@ logger = logging.getLogger(__name__)
 # Initialize Google Cloud clients
 storage_client = storage.Client(project=Config.GOOGLE_CLOUD_PROJECT)
 firestore_client = firestore.Client(project=Config.GOOGLE_CLOUD_PROJECT)
+_SESSIONS_COLL = firestore_client.collection(Config.FIRESTORE_COLLECTION_SESSIONS)
 # Explicitly set the project for Pub/Sub operations
 os.environ['GOOGLE_CLOUD_PROJECT'] = Config.GOOGLE_CLOUD_PROJECT
 subscriber = pubsub_v1.SubscriberClient()
 
-# Initialize Anthropic client
-anthropic_client = anthropic.Anthropic(api_key=Config.ANTHROPIC_API_KEY)
+# Anthropic client, created on first use
+_anthropic_client = None
+
+# Numba cursor-centroid kernel, compiled on first use
+_centroid_kernel = None
+
+# Upper bound on concurrent Anthropic frame analyses (keeps us under the RPM limit)
+MAX_CONCURRENT_ANALYSES = 4
+
+# Read size when streaming the video from GCS into ffmpeg
+STREAM_CHUNK_SIZE = 1024 * 1024
+
+# Input stream info parsed from ffmpeg's log when the video is piped in
+_DURATION_RE = re.compile(r'Duration: (\d+):(\d+):(\d+(?:\.\d+)?)')
+_FPS_RE = re.compile(r'Stream #.*Video:.*?, (\d+(?:\.\d+)?) fps')
+
+# Keywords in a frame analysis that flag a friction point, and in the summary that mark it urgent
+_FRICTION_RE = re.compile(r'error|confusion|stuck|unclear|frustration', re.IGNORECASE)
+_HIGH_PRIORITY_RE = re.compile(r'high|critical', re.IGNORECASE)
+
+# Claude downsizes vision inputs to about this long side, so larger uploads are wasted bytes
+MAX_VISION_SIDE = 1568
+
+# Mouse tracking decodes sampled frames on a small thread pool, TRACK_BATCH_SIZE frames per vectorized pass
+DECODE_WORKERS = 4
+TRACK_BATCH_SIZE = 16
+
+# Queued by frame extraction when it restarts from a downloaded copy, so tracking starts over
+_RESTART_TRACKING = object()
 
 # Subscription path
 subscription_path = subscriber.subscription_path(
@@ -42,6 +72,88 @@ subscription_path = subscriber.subscription_path(
 )
 
 
+def _split_mjpeg_stream(stream, chunk_size=1 << 20):
+    """Yield the individual JPEG images of an MJPEG byte stream, split on SOI/EOI markers."""
+    buffer = bytearray()
+    
+    while True:
+        chunk = stream.read(chunk_size)
+        if not chunk:
+            break
+        buffer += chunk
+        
+        while True:
+            start = buffer.find(b'\xff\xd8')
+            end = buffer.find(b'\xff\xd9', start + 2) if start != -1 else -1
+            if end == -1:
+                break
+            yield bytes(buffer[start:end + 2])
+            del buffer[:end + 2]
+
+
+def _jpeg_dimensions(jpeg_bytes):
+    """Read (height, width) from a JPEG's SOF header without decoding, or None if absent."""
+    i = 2
+    while i + 9 <= len(jpeg_bytes) and jpeg_bytes[i] == 0xFF:
+        marker = jpeg_bytes[i + 1]
+        if marker in (0xC0, 0xC1, 0xC2):
+            return (int.from_bytes(jpeg_bytes[i + 5:i + 7], 'big'),
+                    int.from_bytes(jpeg_bytes[i + 7:i + 9], 'big'))
+        i += 2 + int.from_bytes(jpeg_bytes[i + 2:i + 4], 'big')
+    return None
+
+
+def _get_anthropic_client():
+    """Return the shared synchronous Anthropic client, creating it on first use."""
+    global _anthropic_client
+    if _anthropic_client is None:
+        import anthropic
+        _anthropic_client = anthropic.Anthropic(api_key=Config.ANTHROPIC_API_KEY)
+    return _anthropic_client
+
+
+def _get_centroid_kernel():
+    """Compile (on first use) the fused near-white threshold + centroid kernel."""
+    global _centroid_kernel
+    if _centroid_kernel is None:
+        from numba import config as numba_config, njit, prange
+        
+        # The kernel runs on pipeline threads; TBB's pool hangs interpreter exit when first
+        # started off the main thread, so prefer OpenMP (also safe for concurrent sessions)
+        numba_config.THREADING_LAYER_PRIORITY = ['omp', 'tbb', 'workqueue']
+        
+        @njit(parallel=True, nogil=True)
+        def centroid_sums(batch):
+            # White/light colors (typical cursor) are HSV V >= 200 and S <= 30; both follow
+            # from the channel max/min, so each pixel is read once with no HSV/mask buffers
+            frames, height, width = batch.shape[0], batch.shape[1], batch.shape[2]
+            counts = np.zeros(frames, np.int64)
+            x_sums = np.zeros(frames, np.int64)
+            y_sums = np.zeros(frames, np.int64)
+            for i in prange(frames):
+                n = 0
+                sx = 0
+                sy = 0
+                for y in range(height):
+                    for x in range(width):
+                        b = np.int64(batch[i, y, x, 0])
+                        g = np.int64(batch[i, y, x, 1])
+                        r = np.int64(batch[i, y, x, 2])
+                        mx = max(b, g, r)
+                        mn = min(b, g, r)
+                        if mx >= 200 and (mx - mn) * 255 <= mx * 30:
+                            n += 1
+                            sx += x
+                            sy += y
+                counts[i] = n
+                x_sums[i] = sx
+                y_sums[i] = sy
+            return counts, x_sums, y_sums
+        
+        _centroid_kernel = centroid_sums
+    return _centroid_kernel
+
+
 class VideoProcessor:
     """Handles video processing and analysis."""
     
@@ -50,11 +162,13 @@ class VideoProcessor:
         self.gcs_uri = gcs_uri
         self.temp_dir = None
         self.video_path = None
-        self.frames_dir = None
+        self.frames = []  # JPEG bytes, one per extracted second
+        self._summary_buf = io.StringIO()  # Frame analyses, already formatted for the summary prompt
         self.results = {
             'sessionId': session_id,
             'frameAnalyses': [],
-            'mousePositions': [],
+            # Columnar (one list per field) so the encoder doesn't repeat keys for every point
+            'mousePositions': {'frameIndex': [], 'timestamp': [], 'x': [], 'y': []},
             'frictionPoints': [],
             'stats': {},
             'behaviorSummary': ''
@@ -63,28 +177,30 @@ class VideoProcessor:
     def process(self):
         """Main processing pipeline."""
         try:
-            logger.info(f"Starting processing for session {self.session_id}")
+            logger.info("Starting processing for session %s", self.session_id)
             
             # Update status in Firestore
             self._update_status('processing')
             
             # Create temporary directory
             self.temp_dir = tempfile.mkdtemp()
-            self.frames_dir = os.path.join(self.temp_dir, 'frames')
-            os.makedirs(self.frames_dir)
-            
-            # Download video
-            self._download_video()
-            
-            # Extract frames
-            frame_count = self._extract_frames()
-            self.results['stats']['totalFrames'] = frame_count
-            
-            # Track mouse movements
-            self._track_mouse()
             
-            # Analyze key frames with AI
-            self._analyze_frames()
+            # Extract frames (streams the video from GCS; downloads only as a fallback),
+            # tracking mouse movements in each frame as it comes off the decoder
+            frame_queue = queue.Queue()
+            with ThreadPoolExecutor(max_workers=2) as stages:
+                tracking = stages.submit(self._track_mouse, frame_queue)
+                try:
+                    frame_count = self._extract_frames(frame_queue)
+                finally:
+                    frame_queue.put(None)
+                self.results['stats']['totalFrames'] = frame_count
+                
+                # Key frames are spread over the whole video, so AI analysis starts once
+                # extraction is done and runs while tracking catches up
+                analysis = stages.submit(self._analyze_frames)
+                tracking.result()
+                analysis.result()
             
             # Analyze events and funnels
             self._analyze_events()
@@ -92,19 +208,16 @@ class VideoProcessor:
             # Generate behavior summary
             self._generate_summary()
             
-            # Save results
+            # Save results (also marks the session completed)
             self._save_results()
             
-            # Update status
-            self._update_status('completed')
-            
             # Notify agent service if webhook URL is configured
             self._notify_agent()
             
-            logger.info(f"Completed processing for session {self.session_id}")
+            logger.info("Completed processing for session %s", self.session_id)
             
         except Exception as e:
-            logger.error(f"Error processing video: {str(e)}")
+            logger.error("Error processing video: %s", e)
             self._update_status('failed', error=str(e))
             raise
         
@@ -114,140 +227,249 @@ class VideoProcessor:
                 import shutil
                 shutil.rmtree(self.temp_dir)
     
-    def _download_video(self):
-        """Download video from GCS to local temp directory."""
+    def _video_blob(self):
+        """Resolve the session's GCS URI to a blob."""
         # Parse GCS URI
         bucket_name = self.gcs_uri.split('/')[2]
         blob_path = '/'.join(self.gcs_uri.split('/')[3:])
         
         # Get blob
         bucket = storage_client.bucket(bucket_name)
-        blob = bucket.blob(blob_path)
-        
+        return bucket.blob(blob_path)
+    
+    def _download_video(self):
+        """Download video from GCS to local temp directory."""
         # Download to temp file
         self.video_path = os.path.join(self.temp_dir, 'video.mp4')
-        blob.download_to_filename(self.video_path)
+        self._video_blob().download_to_filename(self.video_path)
         
-        logger.info(f"Downloaded video to {self.video_path}")
+        logger.info("Downloaded video to %s", self.video_path)
     
-    def _extract_frames(self):
-        """Extract frames from video at 1 FPS."""
+    def _extract_frames(self, frame_queue=None):
+        """Extract frames from video at 1 FPS, handing each (index, JPEG) to `frame_queue`."""
         try:
-            # Get video info
-            probe = ffmpeg.probe(self.video_path)
-            video_info = next(s for s in probe['streams'] if s['codec_type'] == 'video')
-            fps = eval(video_info['r_frame_rate'])
-            duration = float(probe['format']['duration'])
-            
-            # Extract frames at 1 FPS
-            (
-                ffmpeg
-                .input(self.video_path)
-                .filter('fps', fps=1)
-                .output(os.path.join(self.frames_dir, 'frame_%04d.png'))
-                .overwrite_output()
-                .run(quiet=True)
-            )
-            
-            # Count extracted frames
-            frame_files = [f for f in os.listdir(self.frames_dir) if f.endswith('.png')]
-            frame_count = len(frame_files)
-            
-            self.results['stats']['videoDuration'] = duration
-            self.results['stats']['fps'] = fps
-            
-            logger.info(f"Extracted {frame_count} frames")
+            if not self._extract_frames_streaming(frame_queue):
+                # Containers that need seeking (e.g. MP4 with the moov atom at the end)
+                # can't be demuxed from a pipe; fall back to a local copy
+                logger.warning("Streaming extraction failed for session %s, downloading video", self.session_id)
+                self.frames = []
+                if frame_queue is not None:
+                    frame_queue.put(_RESTART_TRACKING)
+                self._download_video()
+                self._extract_frames_from_file(frame_queue)
+            
+            frame_count = len(self.frames)
+            
+            logger.info("Extracted %s frames", frame_count)
             return frame_count
             
         except Exception as e:
-            logger.error(f"Error extracting frames: {str(e)}")
+            logger.error("Error extracting frames: %s", e)
             raise
     
-    def _track_mouse(self):
-        """Track mouse movements in frames."""
-        frame_files = sorted([f for f in os.listdir(self.frames_dir) if f.endswith('.png')])
+    def _add_frame(self, jpeg_bytes, frame_queue):
+        """Keep an extracted frame and pass it on to the next pipeline stage."""
+        self.frames.append(jpeg_bytes)
+        if frame_queue is not None:
+            frame_queue.put((len(self.frames) - 1, jpeg_bytes))
+    
+    def _extract_frames_streaming(self, frame_queue=None):
+        """Stream the video from GCS through ffmpeg's stdin; return False if ffmpeg can't decode it."""
+        import ffmpeg
         
-        # Sample every 10th frame for mouse tracking
-        sample_indices = list(range(0, len(frame_files), 10))
+        # Extract frames at 1 FPS as an MJPEG stream on stdout (no temp file, no PNG encode)
+        process = (
+            ffmpeg
+            .input('pipe:0')
+            .filter('fps', fps=1)
+            .output('pipe:1', format='image2pipe', vcodec='mjpeg', qscale=2, qmin=1, vsync=0)
+            .global_args('-hide_banner', '-nostats')
+            .run_async(pipe_stdin=True, pipe_stdout=True, pipe_stderr=True)
+        )
         
-        for idx in sample_indices:
-            frame_path = os.path.join(self.frames_dir, frame_files[idx])
-            
+        feed_errors = []
+        stderr_chunks = []
+        
+        def feed():
             try:
-                # Read frame
-                frame = cv2.imread(frame_path)
-                
-                # Simple cursor detection using color masks
-                # This is a simplified version - in production, use more sophisticated tracking
-                hsv = cv2.cvtColor(frame, cv2.COLOR_BGR2HSV)
-                
-                # Define range for white/light colors (typical cursor)
-                lower_white = np.array([0, 0, 200])
-                upper_white = np.array([180, 30, 255])
-                mask = cv2.inRange(hsv, lower_white, upper_white)
-                
-                # Find contours
-                contours, _ = cv2.findContours(mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
-                
-                if contours:
-                    # Get largest contour (likely cursor)
-                    largest_contour = max(contours, key=cv2.contourArea)
-                    M = cv2.moments(largest_contour)
-                    
-                    if M["m00"] != 0:
-                        cx = int(M["m01"] / M["m00"])
-                        cy = int(M["m10"] / M["m00"])
-                        
-                        self.results['mousePositions'].append({
-                            'frameIndex': idx,
-                            'timestamp': idx,  # seconds
-                            'x': cx,
-                            'y': cy
-                        })
-                
+                with self._video_blob().open('rb', chunk_size=STREAM_CHUNK_SIZE) as video:
+                    while True:
+                        chunk = video.read(STREAM_CHUNK_SIZE)
+                        if not chunk:
+                            break
+                        process.stdin.write(chunk)
+            except BrokenPipeError:
+                pass  # ffmpeg exited early; its exit status reports why
             except Exception as e:
-                logger.warning(f"Error tracking mouse in frame {idx}: {str(e)}")
+                feed_errors.append(e)
+            finally:
+                try:
+                    process.stdin.close()
+                except BrokenPipeError:
+                    pass
+        
+        feeder = threading.Thread(target=feed, daemon=True)
+        drainer = threading.Thread(target=lambda: stderr_chunks.append(process.stderr.read()), daemon=True)
+        feeder.start()
+        drainer.start()
         
-        logger.info(f"Tracked {len(self.results['mousePositions'])} mouse positions")
+        for jpeg_bytes in _split_mjpeg_stream(process.stdout):
+            self._add_frame(jpeg_bytes, frame_queue)
+        returncode = process.wait()
+        feeder.join()
+        drainer.join()
+        
+        # A failed GCS read would otherwise look like a short video
+        if feed_errors:
+            raise feed_errors[0]
+        
+        if returncode != 0 or not self.frames:
+            return False
+        
+        # Stream info comes from ffmpeg's own log; piped input may not report a duration
+        log = b''.join(stderr_chunks).decode('utf-8', errors='replace')
+        duration_match = _DURATION_RE.search(log)
+        fps_match = _FPS_RE.search(log)
+        
+        if duration_match:
+            hours, minutes, seconds = duration_match.groups()
+            duration = int(hours) * 3600 + int(minutes) * 60 + float(seconds)
+        else:
+            duration = float(len(self.frames))
+        
+        self.results['stats']['videoDuration'] = duration
+        self.results['stats']['fps'] = float(fps_match.group(1)) if fps_match else None
+        return True
+    
+    def _extract_frames_from_file(self, frame_queue=None):
+        """Extract frames at 1 FPS from the downloaded video file."""
+        import ffmpeg
+        
+        # Get video info
+        probe = ffmpeg.probe(self.video_path)
+        video_info = next(s for s in probe['streams'] if s['codec_type'] == 'video')
+        fps = float(Fraction(video_info['r_frame_rate']))
+        duration = float(probe['format']['duration'])
+        
+        # Extract frames at 1 FPS as an MJPEG stream on stdout (no PNG encode, no disk)
+        process = (
+            ffmpeg
+            .input(self.video_path)
+            .filter('fps', fps=1)
+            .output('pipe:', format='image2pipe', vcodec='mjpeg', qscale=2, qmin=1, vsync=0)
+            .global_args('-loglevel', 'error', '-nostats')
+            .run_async(pipe_stdout=True)
+        )
+        for jpeg_bytes in _split_mjpeg_stream(process.stdout):
+            self._add_frame(jpeg_bytes, frame_queue)
+        if process.wait() != 0:
+            raise RuntimeError(f"ffmpeg exited with status {process.returncode}")
+        
+        self.results['stats']['videoDuration'] = duration
+        self.results['stats']['fps'] = fps
+    
+    def _track_mouse(self, frame_queue):
+        """Track mouse movements in frames as extraction queues them, until it queues None."""
+        positions = self.results['mousePositions']
+        batch = []
+        
+        # Decode in parallel (cv2.imdecode releases the GIL) and locate the cursor a batch at a time
+        with ThreadPoolExecutor(max_workers=DECODE_WORKERS) as executor:
+            while True:
+                item = frame_queue.get()
+                if item is None:
+                    break
+                if item is _RESTART_TRACKING:
+                    batch = []
+                    for column in positions.values():
+                        column.clear()
+                    continue
+                
+                # Sample every 10th frame for mouse tracking
+                if item[0] % 10 == 0:
+                    batch.append(item)
+                    if len(batch) == TRACK_BATCH_SIZE:
+                        self._track_mouse_batch(executor, batch)
+                        batch = []
+            
+            if batch:
+                self._track_mouse_batch(executor, batch)
+        
+        logger.info("Tracked %s mouse positions", len(self.results['mousePositions']['frameIndex']))
         
         # Calculate additional movement statistics
         self._calculate_movement_stats()
     
+    def _decode_frame(self, idx, jpeg_bytes, reduced=False):
+        """Decode extracted frame `idx` (at half size if `reduced`), or None if unreadable."""
+        import cv2
+        
+        # IMREAD_REDUCED_COLOR_2 has libjpeg emit half-size output directly during the IDCT
+        flags = cv2.IMREAD_REDUCED_COLOR_2 if reduced else cv2.IMREAD_COLOR
+        
+        try:
+            frame = cv2.imdecode(np.frombuffer(jpeg_bytes, np.uint8), flags)
+            if frame is None:
+                logger.warning("Could not decode frame %s", idx)
+            return frame
+        except Exception as e:
+            logger.warning("Error tracking mouse in frame %s: %s", idx, e)
+            return None
+    
+    def _track_mouse_batch(self, executor, batch):
+        """Locate the cursor in a batch of sampled (index, JPEG) frames with a compiled kernel."""
+        # Cursor centroids don't need native resolution; decode at half size
+        decoded = list(executor.map(lambda item: self._decode_frame(*item, reduced=True), batch))
+        valid = [(idx, frame) for (idx, _), frame in zip(batch, decoded) if frame is not None]
+        if not valid:
+            return
+        
+        shape = valid[0][1].shape
+        indices = [idx for idx, frame in valid if frame.shape == shape]
+        batch = np.stack([frame for _, frame in valid if frame.shape == shape])  # (N, H, W, 3)
+        
+        # Simple cursor detection: centroid of near-white pixels, in one fused pass per frame
+        # This is a simplified version - in production, use more sophisticated tracking
+        counts, x_sums, y_sums = _get_centroid_kernel()(batch)
+        
+        found = counts > 0
+        frame_indices = np.asarray(indices)[found].tolist()
+        
+        positions = self.results['mousePositions']
+        positions['frameIndex'].extend(frame_indices)
+        positions['timestamp'].extend(frame_indices)  # seconds
+        positions['x'].extend(((x_sums[found] / counts[found]).astype(np.int64) * 2).tolist())
+        positions['y'].extend(((y_sums[found] / counts[found]).astype(np.int64) * 2).tolist())
+    
     def _calculate_movement_stats(self):
         """Calculate additional movement statistics."""
         positions = self.results['mousePositions']
-        if len(positions) < 2:
+        if len(positions['frameIndex']) < 2:
             return
         
-        total_distance = 0
-        speeds = []
+        # Distance between consecutive positions
+        distances = np.hypot(np.diff(positions['x']), np.diff(positions['y']))
+        total_distance = distances.sum()
         
-        for i in range(1, len(positions)):
-            prev_pos = positions[i-1]
-            curr_pos = positions[i]
-            
-            # Calculate distance
-            dx = curr_pos['x'] - prev_pos['x']
-            dy = curr_pos['y'] - prev_pos['y']
-            distance = np.sqrt(dx*dx + dy*dy)
-            total_distance += distance
-            
-            # Calculate speed (pixels per frame)
-            time_diff = curr_pos['timestamp'] - prev_pos['timestamp']
-            if time_diff > 0:
-                speed = distance / time_diff
-                speeds.append(speed)
+        # Calculate speed (pixels per frame)
+        time_diffs = np.diff(positions['timestamp'])
+        moving = time_diffs > 0
+        speeds = distances[moving] / time_diffs[moving]
         
         # Update stats
-        self.results['stats']['totalMovements'] = len(positions)
+        self.results['stats']['totalMovements'] = len(positions['frameIndex'])
         self.results['stats']['totalDistance'] = float(total_distance)
-        self.results['stats']['averageSpeed'] = float(np.mean(speeds)) if speeds else 0.0
-        self.results['stats']['maxSpeed'] = float(np.max(speeds)) if speeds else 0.0
+        self.results['stats']['averageSpeed'] = float(np.mean(speeds)) if speeds.size else 0.0
+        self.results['stats']['maxSpeed'] = float(np.max(speeds)) if speeds.size else 0.0
     
     def _analyze_events(self):
         """Analyze user events and funnel patterns from mouse movements."""
         positions = self.results['mousePositions']
-        if len(positions) < 2:
+        frame_indices = positions['frameIndex']
+        timestamps = positions['timestamp']
+        xs = positions['x']
+        ys = positions['y']
+        if len(frame_indices) < 2:
             return
         
         events = []
@@ -255,23 +477,19 @@ class VideoProcessor:
         scrolls = []
         
         # Detect clicks (rapid movement followed by pause)
-        for i in range(1, len(positions) - 1):
-            prev_pos = positions[i-1]
-            curr_pos = positions[i]
-            next_pos = positions[i+1]
-            
+        for i in range(1, len(frame_indices) - 1):
             # Calculate movement deltas
-            delta1 = np.sqrt((curr_pos['x'] - prev_pos['x'])**2 + (curr_pos['y'] - prev_pos['y'])**2)
-            delta2 = np.sqrt((next_pos['x'] - curr_pos['x'])**2 + (next_pos['y'] - curr_pos['y'])**2)
+            delta1 = np.sqrt((xs[i] - xs[i-1])**2 + (ys[i] - ys[i-1])**2)
+            delta2 = np.sqrt((xs[i+1] - xs[i])**2 + (ys[i+1] - ys[i])**2)
             
             # Detect click pattern: movement then stillness
             if delta1 > 20 and delta2 < 5:
                 click_event = {
                     'type': 'click',
-                    'frameIndex': curr_pos['frameIndex'],
-                    'timestamp': curr_pos['timestamp'],
-                    'x': curr_pos['x'],
-                    'y': curr_pos['y'],
+                    'frameIndex': frame_indices[i],
+                    'timestamp': timestamps[i],
+                    'x': xs[i],
+                    'y': ys[i],
                     'intensity': float(delta1)
                 }
                 events.append(click_event)
@@ -279,16 +497,16 @@ class VideoProcessor:
         
         # Detect scrolling (vertical movement patterns)
         window_size = 5
-        for i in range(window_size, len(positions) - window_size):
-            y_positions = [positions[j]['y'] for j in range(i-window_size, i+window_size)]
+        for i in range(window_size, len(frame_indices) - window_size):
+            y_positions = ys[i-window_size:i+window_size]
             y_trend = y_positions[-1] - y_positions[0]
             
             # Significant vertical movement indicates scrolling
             if abs(y_trend) > 50:
                 scroll_event = {
                     'type': 'scroll',
-                    'frameIndex': positions[i]['frameIndex'],
-                    'timestamp': positions[i]['timestamp'],
+                    'frameIndex': frame_indices[i],
+                    'timestamp': timestamps[i],
                     'direction': 'down' if y_trend > 0 else 'up',
                     'magnitude': abs(float(y_trend))
                 }
@@ -332,97 +550,127 @@ class VideoProcessor:
                 'description': f"User performed {rage_click['clickCount']} rapid clicks in the same area, indicating potential frustration or unresponsive UI element"
             })
         
-        logger.info(f"Detected {len(events)} events: {len(clicks)} clicks, {len(scrolls)} scrolls, {len(rage_clicks)} rage clicks")
+        logger.info("Detected %s events: %s clicks, %s scrolls, %s rage clicks", len(events), len(clicks), len(scrolls), len(rage_clicks))
     
     def _analyze_frames(self):
         """Analyze key frames using Anthropic AI."""
-        frame_files = sorted([f for f in os.listdir(self.frames_dir) if f.endswith('.png')])
-        
         # Select up to 6 key frames evenly distributed
-        total_frames = len(frame_files)
+        total_frames = len(self.frames)
         if total_frames <= 6:
             key_indices = list(range(total_frames))
         else:
             step = total_frames // 6
             key_indices = [i * step for i in range(6)]
         
-        for idx in key_indices:
-            frame_path = os.path.join(self.frames_dir, frame_files[idx])
+        # Fan the analyses out concurrently; results come back in key-frame order
+        results = asyncio.run(self._analyze_key_frames(key_indices))
+        
+        for idx, analysis_text in results:
+            if analysis_text is None:
+                continue
+            
+            self.results['frameAnalyses'].append({
+                'frameIndex': idx,
+                'timestamp': idx,
+                'analysisText': analysis_text
+            })
             
-            try:
-                # Read and encode frame
-                with open(frame_path, 'rb') as f:
-                    image_data = f.read()
-                
-                # Convert to base64
-                base64_image = base64.b64encode(image_data).decode('utf-8')
-                
-                # Call Anthropic API
-                response = anthropic_client.messages.create(
-                    model="claude-3-5-sonnet-20241022",
-                    max_tokens=300,
-                    messages=[{
-                        "role": "user",
-                        "content": [
-                            {
-                                "type": "text",
-                                "text": "Analyze this screenshot from a user session recording. Identify visible user actions, potential friction points, interface response issues, or any signs of user confusion or frustration. Be specific and concise."
-                            },
-                            {
-                                "type": "image",
-                                "source": {
-                                    "type": "base64",
-                                    "media_type": "image/png",
-                                    "data": base64_image
-                                }
-                            }
-                        ]
-                    }]
-                )
-                
-                analysis_text = response.content[0].text
-                
-                self.results['frameAnalyses'].append({
+            if self._summary_buf.tell():
+                self._summary_buf.write("\n\n")
+            self._summary_buf.write(f"Frame {idx} (t={idx}s): {analysis_text}")
+            
+            # Extract friction points from analysis
+            if _FRICTION_RE.search(analysis_text):
+                self.results['frictionPoints'].append({
+                    'type': 'ui_confusion',
                     'frameIndex': idx,
                     'timestamp': idx,
-                    'analysisText': analysis_text
+                    'description': analysis_text[:200]
                 })
-                
-                # Extract friction points from analysis
-                if any(keyword in analysis_text.lower() for keyword in ['error', 'confusion', 'stuck', 'unclear', 'frustration']):
-                    self.results['frictionPoints'].append({
-                        'type': 'ui_confusion',
-                        'frameIndex': idx,
-                        'timestamp': idx,
-                        'description': analysis_text[:200]
-                    })
-                
-                # Rate limiting
-                import time
-                time.sleep(0.2)
-                
-            except Exception as e:
-                logger.error(f"Error analyzing frame {idx}: {str(e)}")
         
-        logger.info(f"Analyzed {len(self.results['frameAnalyses'])} frames")
+        logger.info("Analyzed %s frames", len(self.results['frameAnalyses']))
+    
+    def _vision_jpeg(self, idx):
+        """JPEG bytes for a key frame, downscaled to the largest size Claude actually uses."""
+        import cv2
+        
+        jpeg_bytes = self.frames[idx]
+        
+        # The in-memory JPEG's header gives its size; only decode when it must be shrunk
+        dimensions = _jpeg_dimensions(jpeg_bytes)
+        if dimensions and max(dimensions) <= MAX_VISION_SIDE:
+            return jpeg_bytes
+        
+        frame = self._decode_frame(idx, jpeg_bytes)
+        if frame is None:
+            return jpeg_bytes
+        
+        scale = MAX_VISION_SIDE / max(frame.shape[:2])
+        if scale >= 1.0:
+            # Already small enough; the extracted frame is JPEG, so send it as-is
+            return jpeg_bytes
+        
+        frame = cv2.resize(frame, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+        return cv2.imencode('.jpg', frame, [cv2.IMWRITE_JPEG_QUALITY, 85])[1].tobytes()
+    
+    async def _analyze_key_frames(self, key_indices):
+        """Analyze key frames concurrently, returning (frameIndex, text or None) pairs."""
+        import anthropic
+        
+        semaphore = asyncio.Semaphore(MAX_CONCURRENT_ANALYSES)
+        
+        async with anthropic.AsyncAnthropic(api_key=Config.ANTHROPIC_API_KEY) as client:
+            async def analyze(idx):
+                async with semaphore:
+                    try:
+                        base64_image = pybase64.b64encode_as_string(self._vision_jpeg(idx))
+                        
+                        # Call Anthropic API
+                        response = await client.messages.create(
+                            model="claude-3-5-sonnet-20241022",
+                            max_tokens=300,
+                            messages=[{
+                                "role": "user",
+                                "content": [
+                                    {
+                                        "type": "text",
+                                        "text": "Analyze this screenshot from a user session recording. Identify visible user actions, potential friction points, interface response issues, or any signs of user confusion or frustration. Be specific and concise."
+                                    },
+                                    {
+                                        "type": "image",
+                                        "source": {
+                                            "type": "base64",
+                                            "media_type": "image/jpeg",
+                                            "data": base64_image
+                                        }
+                                    }
+                                ]
+                            }]
+                        )
+                        
+                        return idx, response.content[0].text
+                        
+                    except Exception as e:
+                        logger.error("Error analyzing frame %s: %s", idx, e)
+                        return idx, None
+            
+            return await asyncio.gather(*(analyze(idx) for idx in key_indices))
     
     def _generate_summary(self):
         """Generate overall behavior summary using AI."""
         try:
-            # Combine all analyses
-            all_analyses = "\n\n".join([
-                f"Frame {fa['frameIndex']} (t={fa['timestamp']}s): {fa['analysisText']}"
-                for fa in self.results['frameAnalyses']
-            ])
+            # All analyses, combined as they came in
+            all_analyses = self._summary_buf.getvalue()
             
             # Add mouse movement summary
-            if self.results['mousePositions']:
-                movement_summary = f"\nMouse tracking: {len(self.results['mousePositions'])} positions tracked"
+            position_count = len(self.results['mousePositions']['frameIndex'])
+            if position_count:
+                movement_summary = f"\nMouse tracking: {position_count} positions tracked"
             else:
                 movement_summary = "\nNo mouse movements detected"
             
             # Call Anthropic for summary
-            response = anthropic_client.messages.create(
+            response = _get_anthropic_client().messages.create(
                 model="claude-3-5-sonnet-20241022",
                 max_tokens=500,
                 messages=[{
@@ -444,14 +692,14 @@ Format your response as clear, actionable bullet points."""
             self.results['behaviorSummary'] = response.content[0].text
             
             # Extract high-priority friction points
-            if 'high' in self.results['behaviorSummary'].lower() or 'critical' in self.results['behaviorSummary'].lower():
+            if _HIGH_PRIORITY_RE.search(self.results['behaviorSummary']):
                 self.results['stats']['highPriorityFrictionCount'] = len([
                     fp for fp in self.results['frictionPoints'] 
                     if 'error' in fp.get('description', '').lower()
                 ])
             
         except Exception as e:
-            logger.error(f"Error generating summary: {str(e)}")
+            logger.error("Error generating summary: %s", e)
             self.results['behaviorSummary'] = "Error generating summary"
     
     def _save_results(self):
@@ -460,58 +708,57 @@ Format your response as clear, actionable bullet points."""
             # Save to Cloud Storage
             results_bucket = storage_client.bucket(Config.GCS_RESULTS_BUCKET)
             
-            # Save JSON results
-            json_blob = results_bucket.blob(f"{self.session_id}/analysis.json")
-            json_blob.upload_from_string(
-                json.dumps(self.results, indent=2),
-                content_type='application/json'
-            )
-            
-            # Generate and save heat map image
+            # Generate heat map image
             heatmap_url = None
-            if self.results['mousePositions']:
+            heatmap_path = None
+            positions = self.results['mousePositions']
+            if positions['frameIndex']:
                 heatmap_path = os.path.join(self.temp_dir, 'heatmap.png')
                 
-                # Convert mouse positions to format expected by generate_heat_map
-                formatted_positions = []
-                for pos in self.results['mousePositions']:
-                    formatted_positions.append({
-                        'position': (pos['x'], pos['y']),
-                        'timestamp': pos['timestamp']
-                    })
-                
-                # Generate heat map
-                generate_heat_map(formatted_positions, heatmap_path)
+                # Generate heat map (it reads the same column-wise 'x' and 'y' lists)
+                from mouse_tracker import generate_heat_map
+                generate_heat_map(positions, heatmap_path)
                 
+                heatmap_url = f"gs://{Config.GCS_RESULTS_BUCKET}/{self.session_id}/heatmap.png"
+            
+            # analysis.json already carries mousePositions, so it also records the heat map
+            # location instead of writing a separate heatmap.json
+            self.results['heatmapUrl'] = heatmap_url
+            
+            def upload_json():
+                # Save JSON results gzip-compressed; GCS transcodes for clients without gzip support
+                json_blob = results_bucket.blob(f"{self.session_id}/analysis.json")
+                json_blob.content_encoding = 'gzip'
+                json_blob.upload_from_string(
+                    gzip.compress(orjson.dumps(self.results, option=orjson.OPT_SERIALIZE_NUMPY)),
+                    content_type='application/json'
+                )
+            
+            def upload_heatmap():
                 # Upload heat map to Cloud Storage
                 heatmap_blob = results_bucket.blob(f"{self.session_id}/heatmap.png")
                 with open(heatmap_path, 'rb') as f:
                     heatmap_blob.upload_from_file(f, content_type='image/png')
-                
-                heatmap_url = f"gs://{Config.GCS_RESULTS_BUCKET}/{self.session_id}/heatmap.png"
-                logger.info(f"Heat map saved to {heatmap_url}")
-            
-            # Also save JSON metadata
-            heatmap_data = {
-                'sessionId': self.session_id,
-                'mousePositions': self.results['mousePositions'],
-                'generated': datetime.utcnow().isoformat(),
-                'heatmapUrl': heatmap_url
-            }
-            
-            heatmap_json_blob = results_bucket.blob(f"{self.session_id}/heatmap.json")
-            heatmap_json_blob.upload_from_string(
-                json.dumps(heatmap_data, indent=2),
-                content_type='application/json'
-            )
-            
-            # Update Firestore with all analytics
-            doc_ref = firestore_client.collection(Config.FIRESTORE_COLLECTION_SESSIONS).document(self.session_id)
+                logger.info("Heat map saved to %s", heatmap_url)
+            
+            # Run the uploads side by side rather than back to back
+            with ThreadPoolExecutor(max_workers=2) as executor:
+                uploads = [executor.submit(upload_json)]
+                if heatmap_path:
+                    uploads.append(executor.submit(upload_heatmap))
+                for upload in uploads:
+                    upload.result()
+            
+            # Update Firestore with all analytics and the completed status in one write;
+            # timestamps come from the server clock
+            doc_ref = _SESSIONS_COLL.document(self.session_id)
             update_data = {
+                'status': 'completed',
+                'lastUpdated': firestore.SERVER_TIMESTAMP,
                 'stats': self.results['stats'],
                 'frictionPoints': self.results['frictionPoints'],
                 'behaviorSummary': self.results['behaviorSummary'],
-                'analysisCompleted': datetime.utcnow(),
+                'analysisCompleted': firestore.SERVER_TIMESTAMP,
                 'resultsUri': f"gs://{Config.GCS_RESULTS_BUCKET}/{self.session_id}/",
                 'agentProcessed': False  # Flag for agent processing
             }
@@ -522,19 +769,19 @@ Format your response as clear, actionable bullet points."""
             
             doc_ref.update(update_data)
             
-            logger.info(f"Saved results for session {self.session_id}")
+            logger.info("Saved results for session %s", self.session_id)
             
         except Exception as e:
-            logger.error(f"Error saving results: {str(e)}")
+            logger.error("Error saving results: %s", e)
             raise
     
     def _update_status(self, status: str, error: str = None):
         """Update processing status in Firestore."""
         try:
-            doc_ref = firestore_client.collection(Config.FIRESTORE_COLLECTION_SESSIONS).document(self.session_id)
+            doc_ref = _SESSIONS_COLL.document(self.session_id)
             update_data = {
                 'status': status,
-                'lastUpdated': datetime.utcnow()
+                'lastUpdated': firestore.SERVER_TIMESTAMP
             }
             
             if error:
@@ -543,7 +790,7 @@ Format your response as clear, actionable bullet points."""
             doc_ref.update(update_data)
             
         except Exception as e:
-            logger.error(f"Error updating status: {str(e)}")
+            logger.error("Error updating status: %s", e)
     
     def _notify_agent(self):
         """Notify agent service about completed analysis."""
@@ -557,22 +804,22 @@ Format your response as clear, actionable bullet points."""
                     timeout=5
                 )
                 if response.status_code == 200:
-                    logger.info(f"Agent notified for session {self.session_id}")
+                    logger.info("Agent notified for session %s", self.session_id)
                 else:
-                    logger.warning(f"Agent notification failed: {response.status_code}")
+                    logger.warning("Agent notification failed: %s", response.status_code)
             except Exception as e:
-                logger.error(f"Error notifying agent: {str(e)}")
+                logger.error("Error notifying agent: %s", e)
 
 
 def process_message(message: message.Message):
     """Process a Pub/Sub message."""
     try:
         # Parse message
-        data = json.loads(message.data.decode('utf-8'))
+        data = orjson.loads(message.data)
         session_id = data['sessionId']
         gcs_uri = data['gcsUri']
         
-        logger.info(f"Processing message for session {session_id}")
+        logger.info("Processing message for session %s", session_id)
         
         # Process video
         processor = VideoProcessor(session_id, gcs_uri)
@@ -582,7 +829,7 @@ def process_message(message: message.Message):
         message.ack()
         
     except Exception as e:
-        logger.error(f"Error processing message: {str(e)}")
+        logger.error("Error processing message: %s", e)
         # Don't acknowledge - let it retry
         message.nack()
 
@@ -595,20 +842,24 @@ def main():
     try:
         Config.validate()
     except ValueError as e:
-        logger.error(f"Configuration error: {e}")
+        logger.error("Configuration error: %s", e)
         exit(1)
     
-    # Set up subscriber
-    flow_control = pubsub_v1.types.FlowControl(max_messages=1)
+    # Set up subscriber: jobs mostly wait on GCS, ffmpeg and Anthropic, so several
+    # videos are processed at once; leases are extended for up to an hour per job
+    workers = Config.VIDEO_PROCESSOR_WORKERS
+    flow_control = pubsub_v1.types.FlowControl(max_messages=workers, max_lease_duration=3600)
+    scheduler = ThreadScheduler(executor=ThreadPoolExecutor(max_workers=workers))
     
     # Start pulling messages
     streaming_pull_future = subscriber.subscribe(
         subscription_path,
         callback=process_message,
-        flow_control=flow_control
+        flow_control=flow_control,
+        scheduler=scheduler
     )
     
-    logger.info(f"Listening for messages on {subscription_path}")
+    logger.info("Listening for messages on %s", subscription_path)
     
     # Keep the main thread running
     with subscriber:
@@ -2,28 +2,36 @@
 
 import os
 import json
+import asyncio
+import math
 import logging
 import tempfile
-import base64
+import textwrap
+import pybase64
 from datetime import datetime
+from fractions import Fraction
 import cv2
 import numpy as np
 from google.cloud import storage, firestore, pubsub_v1
+from google.cloud.storage.retry import DEFAULT_RETRY
 from google.cloud.pubsub_v1.subscriber import message
+from google.cloud.pubsub_v1.subscriber.scheduler import ThreadScheduler
 import ffmpeg
+import orjson
 import anthropic
+import requests
+from requests.adapters import HTTPAdapter
 from PIL import Image
 import io
-import matplotlib
-matplotlib.use('Agg')
-import matplotlib.pyplot as plt
 from typing import List, Dict, Any, Tuple, Optional
-import time
-from collections import defaultdict
+import queue
+import threading
+from collections import Counter, defaultdict, deque
 import subprocess
+from concurrent.futures import ThreadPoolExecutor
+from itertools import chain, islice, repeat
 
 from config import Config
-from mouse_tracker import generate_heat_map
 
 # Initialize logging
 logging.basicConfig(level=logging.INFO)
@@ -32,12 +40,54 @@ logger = logging.getLogger(__name__)
 # Initialize Google Cloud clients
 storage_client = storage.Client(project=Config.GOOGLE_CLOUD_PROJECT)
 firestore_client = firestore.Client(project=Config.GOOGLE_CLOUD_PROJECT)
+_SESSIONS_COLL = firestore_client.collection(Config.FIRESTORE_COLLECTION_SESSIONS)
 os.environ['GOOGLE_CLOUD_PROJECT'] = Config.GOOGLE_CLOUD_PROJECT
 subscriber = pubsub_v1.SubscriberClient()
 
 # Initialize Anthropic client
 anthropic_client = anthropic.Anthropic(api_key=Config.ANTHROPIC_API_KEY)
 
+# Agent webhook calls share pooled keep-alive connections (one per concurrent job)
+agent_session = requests.Session()
+agent_session.mount('http://', HTTPAdapter(pool_connections=1, pool_maxsize=Config.VIDEO_PROCESSOR_WORKERS))
+agent_session.mount('https://', HTTPAdapter(pool_connections=1, pool_maxsize=Config.VIDEO_PROCESSOR_WORKERS))
+
+# Cursor tracking runs on frames scaled down to at most this width; positions are
+# mapped back to source pixels. Playback and the frames kept for AI stay full size
+ANALYSIS_WIDTH = 960
+
+# Cursor tracking runs on a small thread pool (OpenCV and the mask kernel release the GIL),
+# TRACK_BATCH_SIZE frames at a time so only a bounded number of raw frames is held
+TRACK_WORKERS = 4
+TRACK_BATCH_SIZE = 16
+
+# Template matching first searches this far (tracking-frame pixels) around the last known
+# cursor position, and only scans the whole frame when nothing matches there
+CURSOR_SEARCH_RADIUS = 100
+
+# UI element edges are found on frames scaled by this factor per side; boxes are scaled back
+UI_EDGE_SCALE = 0.5
+
+# Claude downsizes vision inputs to about this long side, so larger uploads are wasted bytes
+MAX_VISION_SIDE = 1568
+
+# The playback video is uploaded as a resumable upload in chunks of this size (a multiple of
+# 256 KiB): memory stays bounded and a dropped connection resumes from the last chunk
+PLAYBACK_UPLOAD_CHUNK_SIZE = 8 * 1024 * 1024
+
+# Upper bound on concurrent Anthropic frame analyses (keeps us under the RPM limit)
+MAX_CONCURRENT_ANALYSES = 4
+
+# ffmpeg scene-change score (0-1) above which a frame counts as a new screen for AI analysis
+SCENE_CHANGE_THRESHOLD = 0.1
+
+# Raw frames read ahead of tracking, so ffmpeg keeps decoding while a batch is analyzed
+FRAME_PREFETCH = 32
+
+# Numba cursor color-mask and event-detection kernels, compiled on first use
+_cursor_mask_kernel = None
+_event_mask_kernel = None
+
 # Subscription path
 subscription_path = subscriber.subscription_path(
     Config.GOOGLE_CLOUD_PROJECT, 
@@ -45,6 +95,63 @@ subscription_path = subscriber.subscription_path(
 )
 
 
+def _get_cursor_mask_kernel():
+    """Compile (on first use) the fused white/black/blue cursor HSV mask kernel."""
+    global _cursor_mask_kernel
+    if _cursor_mask_kernel is None:
+        from numba import njit
+        
+        @njit(nogil=True)
+        def cursor_mask(hsv):
+            # Same ranges as three cv2.inRange calls OR'd together, in one pass over the
+            # pixels; bitwise (branch-free) tests let the loop vectorize
+            height, width = hsv.shape[0], hsv.shape[1]
+            mask = np.empty((height, width), np.uint8)
+            for y in range(height):
+                for x in range(width):
+                    h = hsv[y, x, 0]
+                    s = hsv[y, x, 1]
+                    v = hsv[y, x, 2]
+                    white = (v >= 200) & (s <= 30)
+                    black = v <= 30
+                    blue = (h >= 100) & (h <= 130) & (s >= 50) & (v >= 50)
+                    mask[y, x] = np.uint8(255) * (white | black | blue)
+            return mask
+        
+        _cursor_mask_kernel = cursor_mask
+    return _cursor_mask_kernel
+
+
+def _get_event_mask_kernel():
+    """Compile (on first use) the click/hover detection kernel over position columns."""
+    global _event_mask_kernel
+    if _event_mask_kernel is None:
+        from numba import njit
+        
+        @njit(nogil=True)
+        def event_masks(xs, ys, timestamps):
+            # One pass over the positions: step lengths between neighbours, then a click
+            # (movement then pause) or hover (0.5s+ pause) test at each interior position
+            n = xs.size
+            deltas = np.empty(max(n - 1, 0), np.float64)
+            for i in range(n - 1):
+                deltas[i] = math.hypot(xs[i + 1] - xs[i], ys[i + 1] - ys[i])
+            
+            clicks = np.zeros(n, np.bool_)
+            hovers = np.zeros(n, np.bool_)
+            for i in range(1, n - 1):
+                delta1 = deltas[i - 1]
+                delta2 = deltas[i]
+                if delta1 > 20 and delta2 < 5:
+                    clicks[i] = True
+                elif delta1 < 10 and delta2 < 10 and timestamps[i + 1] - timestamps[i] > 0.5:
+                    hovers[i] = True
+            return deltas, clicks, hovers
+        
+        _event_mask_kernel = event_masks
+    return _event_mask_kernel
+
+
 class EnhancedVideoProcessor:
     """Enhanced video processor with dual-stream handling and advanced analytics."""
     
@@ -55,6 +162,20 @@ class EnhancedVideoProcessor:
         self.video_path = None
         self.playback_video_path = None
         self.frames_dir = None
+        self.scene_scores_path = None
+        self.vision_jpegs = {}  # Upload-ready JPEG bytes per key frame index, encoded once
+        self.analysis_scale = (1.0, 1.0)  # Source pixels per tracking-frame pixel (x, y)
+        # Tracked cursor positions as parallel columns for the analytics passes;
+        # results['mousePositions'] holds the same points as dicts for the JSON output
+        self.positions = {
+            'frame': np.empty(0, dtype=np.int32),
+            't': np.empty(0, dtype=np.float64),
+            'x': np.empty(0, dtype=np.int32),
+            'y': np.empty(0, dtype=np.int32),
+            'conf': np.empty(0, dtype=np.float64)
+        }
+        # (x0, y0, x1, y1, frameIndex) rows for results['uiElements'], for vectorized hit tests
+        self.ui_element_bounds = np.empty((0, 5), dtype=np.int64)
         self.results = {
             'sessionId': session_id,
             'frameAnalyses': [],
@@ -72,7 +193,7 @@ class EnhancedVideoProcessor:
     def process(self):
         """Enhanced processing pipeline."""
         try:
-            logger.info(f"Starting enhanced processing for session {self.session_id}")
+            logger.info("Starting enhanced processing for session %s", self.session_id)
             
             # Update status in Firestore
             self._update_status('processing')
@@ -85,33 +206,37 @@ class EnhancedVideoProcessor:
             # Download video
             self._download_video()
             
-            # Create dual streams (high-res for playback, optimized for analysis)
-            self._create_dual_streams()
-            
-            # Extract frames with higher quality
-            frame_count = self._extract_frames_enhanced()
-            self.results['stats']['totalFrames'] = frame_count
-            
-            # Enhanced mouse tracking (every frame for precision)
-            self._track_mouse_enhanced()
-            
-            # Detect UI elements and interactions
-            self._detect_ui_elements()
-            
-            # Analyze events and create funnel
-            self._analyze_events_enhanced()
-            
-            # Extract key moments
-            self._extract_key_moments()
-            
-            # Analyze key frames with AI
-            self._analyze_frames_enhanced()
-            
-            # Generate user journey narrative
-            self._generate_user_journey()
-            
-            # Generate comprehensive behavior summary
-            self._generate_enhanced_summary()
+            # Create dual streams (high-res for playback, optimized for analysis). The playback
+            # transcode is the slowest step and only the upload needs it, so ffmpeg runs it in
+            # the background while frames are extracted and analyzed from the original
+            with ThreadPoolExecutor(max_workers=1) as transcoder:
+                transcode = transcoder.submit(self._create_dual_streams)
+                
+                # Extract frames with higher quality; they are decoded lazily
+                frames = self._extract_frames_enhanced()
+                
+                # Enhanced mouse tracking (every frame for precision, as ffmpeg decodes it)
+                self._track_mouse_enhanced(frames)
+                
+                # Detect UI elements and interactions
+                self._detect_ui_elements()
+                
+                # Analyze events and create funnel
+                self._analyze_events_enhanced()
+                
+                # Extract key moments
+                self._extract_key_moments()
+                
+                # Analyze key frames with AI
+                self._analyze_frames_enhanced()
+                
+                # Generate user journey narrative
+                self._generate_user_journey()
+                
+                # Generate comprehensive behavior summary
+                self._generate_enhanced_summary()
+                
+                transcode.result()
             
             # Save all results
             self._save_enhanced_results()
@@ -122,10 +247,10 @@ class EnhancedVideoProcessor:
             # Notify agent service
             self._notify_agent()
             
-            logger.info(f"Completed enhanced processing for session {self.session_id}")
+            logger.info("Completed enhanced processing for session %s", self.session_id)
             
         except Exception as e:
-            logger.error(f"Error in enhanced processing: {str(e)}")
+            logger.error("Error in enhanced processing: %s", e)
             self._update_status('failed', error=str(e))
             raise
         
@@ -146,7 +271,7 @@ class EnhancedVideoProcessor:
         self.video_path = os.path.join(self.temp_dir, 'original_video.mp4')
         blob.download_to_filename(self.video_path)
         
-        logger.info(f"Downloaded video to {self.video_path}")
+        logger.info("Downloaded video to %s", self.video_path)
     
     def _create_dual_streams(self):
         """Create dual video streams: high-res for playback, optimized for analysis."""
@@ -161,8 +286,10 @@ class EnhancedVideoProcessor:
                 .output(self.playback_video_path, 
                        vcodec='libx264',
                        crf=23,  # High quality
-                       preset='medium',
-                       acodec='aac')
+                       preset='veryfast',  # Screen recordings compress well; medium mostly costs time
+                       threads=0,  # All cores
+                       acodec='aac',
+                       movflags='+faststart')  # Index up front so playback can start before the download ends
                 .overwrite_output()
                 .run(quiet=True)
             )
@@ -173,7 +300,7 @@ class EnhancedVideoProcessor:
             logger.info("Created dual video streams")
             
         except Exception as e:
-            logger.error(f"Error creating dual streams: {str(e)}")
+            logger.error("Error creating dual streams: %s", e)
             # Fall back to using original
             self.playback_video_path = self.video_path
     
@@ -183,81 +310,191 @@ class EnhancedVideoProcessor:
             # Get video info
             probe = ffmpeg.probe(self.video_path)
             video_info = next(s for s in probe['streams'] if s['codec_type'] == 'video')
-            fps = eval(video_info['r_frame_rate'])
+            fps = float(Fraction(video_info['r_frame_rate']))
             duration = float(probe['format']['duration'])
             width = int(video_info['width'])
             height = int(video_info['height'])
             
-            # Extract frames at 2 FPS for better temporal resolution
+            # Tracking frames are downsampled (even dimensions, aspect kept)
+            scale = min(1.0, ANALYSIS_WIDTH / width)
+            analysis_width = max(2, int(round(width * scale / 2)) * 2)
+            analysis_height = max(2, int(round(height * scale / 2)) * 2)
+            self.analysis_scale = (width / analysis_width, height / analysis_height)
+            
+            # Extract frames at 2 FPS for better temporal resolution. One decode feeds three
+            # outputs: raw BGR frames on stdout for tracking (no image encode/decode at all),
+            # JPEG files for the few frames later stages look at again, and a per-frame
+            # scene-change score (select only evaluates it; every frame passes)
             extraction_fps = 2
-            (
+            self.scene_scores_path = os.path.join(self.temp_dir, 'scene_scores.txt')
+            frames = ffmpeg.input(self.video_path).filter('fps', fps=extraction_fps).split()
+            process = (
                 ffmpeg
-                .input(self.video_path)
-                .filter('fps', fps=extraction_fps)
-                .output(os.path.join(self.frames_dir, 'frame_%06d.png'),
-                       format='image2',
-                       pix_fmt='rgb24',
-                       s=f'{width}x{height}')  # Preserve resolution
+                .merge_outputs(
+                    frames[0].output('pipe:', format='rawvideo', pix_fmt='bgr24',
+                                     s=f'{analysis_width}x{analysis_height}'),
+                    frames[1].output(os.path.join(self.frames_dir, 'frame_%06d.jpg'),
+                                     format='image2', qscale=2, s=f'{width}x{height}'),  # Preserve resolution
+                    frames[2].filter('select', 'gte(scene,0)')
+                             .filter('metadata', 'print', file=self.scene_scores_path)
+                             .output(os.devnull, format='null')
+                )
+                .global_args('-loglevel', 'error', '-nostats')
                 .overwrite_output()
-                .run(quiet=True)
+                .run_async(pipe_stdout=True)
             )
             
-            # Count extracted frames
-            frame_files = [f for f in os.listdir(self.frames_dir) if f.endswith('.png')]
-            frame_count = len(frame_files)
-            
             self.results['stats']['videoDuration'] = duration
             self.results['stats']['fps'] = fps
             self.results['stats']['resolution'] = f"{width}x{height}"
             self.results['stats']['extractionFps'] = extraction_fps
             
-            logger.info(f"Extracted {frame_count} frames at {extraction_fps} FPS")
-            return frame_count
+            return self._read_frames(process, analysis_width, analysis_height)
             
         except Exception as e:
-            logger.error(f"Error extracting frames: {str(e)}")
+            logger.error("Error extracting frames: %s", e)
             raise
     
-    def _track_mouse_enhanced(self):
-        """Enhanced mouse tracking with per-frame precision."""
-        frame_files = sorted([f for f in os.listdir(self.frames_dir) if f.endswith('.png')])
+    def _frame_path(self, idx):
+        """Path of the JPEG ffmpeg wrote for extracted frame `idx` (its image2 numbering starts at 1)."""
+        return os.path.join(self.frames_dir, f'frame_{idx + 1:06d}.jpg')
+    
+    def _read_frames(self, process, width, height):
+        """Yield BGR frames from ffmpeg's raw stdout as they are decoded, then record the count."""
+        frame_size = width * height * 3
+        frame_count = 0
         
-        # Use template matching for better cursor detection
-        cursor_template = self._create_cursor_template()
+        # A reader thread drains the pipe into a bounded queue (back-pressure caps memory);
+        # None marks the end of the stream
+        frame_queue = queue.Queue(maxsize=FRAME_PREFETCH)
+        stop = threading.Event()
         
-        for idx, frame_file in enumerate(frame_files):
-            frame_path = os.path.join(self.frames_dir, frame_file)
-            
+        def read():
             try:
-                frame = cv2.imread(frame_path)
-                
-                # Try template matching first
-                cursor_pos = self._detect_cursor_template(frame, cursor_template)
-                
-                # Fall back to color-based detection
-                if cursor_pos is None:
-                    cursor_pos = self._detect_cursor_color(frame)
-                
-                if cursor_pos:
-                    # Calculate actual timestamp based on extraction FPS
-                    timestamp = idx / self.results['stats']['extractionFps']
-                    
-                    self.results['mousePositions'].append({
-                        'frameIndex': idx,
-                        'timestamp': timestamp,
-                        'x': cursor_pos[0],
-                        'y': cursor_pos[1],
-                        'confidence': cursor_pos[2] if len(cursor_pos) > 2 else 1.0
-                    })
+                while not stop.is_set():
+                    buffer = process.stdout.read(frame_size)
+                    if len(buffer) < frame_size:
+                        break
+                    frame_queue.put(np.frombuffer(buffer, np.uint8).reshape(height, width, 3))
+            finally:
+                frame_queue.put(None)
+        
+        reader = threading.Thread(target=read, daemon=True)
+        reader.start()
+        
+        frame = None
+        try:
+            while (frame := frame_queue.get()) is not None:
+                yield frame
+                frame_count += 1
+        finally:
+            # If the consumer gave up early, unblock the reader and let it reach the end marker
+            if frame is not None:
+                stop.set()
+                while frame_queue.get() is not None:
+                    pass
+            reader.join()
+            
+            # Stops ffmpeg (broken pipe) if it was still decoding
+            process.stdout.close()
+            process.wait()
+        
+        if process.returncode != 0:
+            raise RuntimeError(f"ffmpeg exited with status {process.returncode}")
+        
+        self.results['stats']['totalFrames'] = frame_count
+        logger.info("Extracted %s frames at %s FPS", frame_count, self.results['stats']['extractionFps'])
+    
+    def _track_mouse_enhanced(self, frames):
+        """Enhanced mouse tracking with per-frame precision over decoded BGR `frames`."""
+        scale_x, scale_y = self.analysis_scale
+        
+        # Use template matching for better cursor detection, with templates shrunk to the
+        # tracking frames' scale
+        cursor_template = [
+            cv2.resize(template, (max(1, round(template.shape[1] / scale_x)), max(1, round(template.shape[0] / scale_y))),
+                       interpolation=cv2.INTER_AREA)
+            for template in self._create_cursor_template()
+        ]
+        area_scale = 1.0 / (scale_x * scale_y)
+        
+        # At most one position per frame, gathered in order
+        frame_indices = []
+        xs = []
+        ys = []
+        confs = []
+        
+        # Last position found, in tracking-frame pixels; a batch's frames run concurrently,
+        # so each one starts its search from where the previous batch left the cursor
+        last_pos = None
+        
+        def track(item, near):
+            idx, frame = item
+            return idx, self._track_frame(idx, frame, cursor_template, area_scale, near)
+        
+        # Frames are independent; map each batch over the pool, collecting results in order
+        numbered_frames = enumerate(frames)
+        with ThreadPoolExecutor(max_workers=TRACK_WORKERS) as executor:
+            while True:
+                batch = list(islice(numbered_frames, TRACK_BATCH_SIZE))
+                if not batch:
+                    break
                 
-            except Exception as e:
-                logger.warning(f"Error tracking mouse in frame {idx}: {str(e)}")
+                for idx, cursor_pos in executor.map(track, batch, repeat(last_pos)):
+                    if cursor_pos:
+                        last_pos = (int(cursor_pos[0]), int(cursor_pos[1]))
+                        
+                        # Back to source-resolution pixels
+                        frame_indices.append(idx)
+                        xs.append(int(round(cursor_pos[0] * scale_x)))
+                        ys.append(int(round(cursor_pos[1] * scale_y)))
+                        confs.append(cursor_pos[2] if len(cursor_pos) > 2 else 1.0)
+        
+        # Calculate actual timestamps based on extraction FPS
+        frame_indices = np.array(frame_indices, dtype=np.int32)
+        self.positions = {
+            'frame': frame_indices,
+            't': frame_indices / self.results['stats']['extractionFps'],
+            'x': np.array(xs, dtype=np.int32),
+            'y': np.array(ys, dtype=np.int32),
+            'conf': np.array(confs, dtype=np.float64)
+        }
         
-        logger.info(f"Tracked {len(self.results['mousePositions'])} mouse positions")
+        # Row form for the stored results, built once
+        self.results['mousePositions'] = [
+            {'frameIndex': frame, 'timestamp': timestamp, 'x': x, 'y': y, 'confidence': confidence}
+            for frame, timestamp, x, y, confidence in zip(
+                self.positions['frame'].tolist(), self.positions['t'].tolist(),
+                self.positions['x'].tolist(), self.positions['y'].tolist(),
+                self.positions['conf'].tolist()
+            )
+        ]
+        
+        logger.info("Tracked %s mouse positions", len(self.results['mousePositions']))
         
         # Calculate movement statistics
         self._calculate_movement_stats_enhanced()
     
+    def _track_frame(self, idx, frame, templates, area_scale, near=None):
+        """Locate the cursor in one BGR frame, searching around `near` first; returns (x, y, confidence) or None."""
+        try:
+            # Each color conversion is a full pass over the frame; do each at most once
+            gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+            
+            # Try template matching first
+            cursor_pos = self._detect_cursor_template(gray, templates, near)
+            
+            # Fall back to color-based detection
+            if cursor_pos is None:
+                hsv = cv2.cvtColor(frame, cv2.COLOR_BGR2HSV)
+                cursor_pos = self._detect_cursor_color(hsv, area_scale)
+            
+            return cursor_pos
+            
+        except Exception as e:
+            logger.warning("Error tracking mouse in frame %s: %s", idx, e)
+            return None
+    
     def _create_cursor_template(self):
         """Create cursor templates for template matching."""
         # Create common cursor shapes
@@ -275,14 +512,30 @@ class EnhancedVideoProcessor:
         
         return templates
     
-    def _detect_cursor_template(self, frame, templates):
-        """Detect cursor using template matching."""
-        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
-        
+    def _detect_cursor_template(self, gray, templates, near=None):
+        """Detect cursor using template matching on a grayscale frame, trying the window around `near` first."""
+        if near is not None:
+            # The cursor rarely jumps far between samples; matching a small window is far
+            # cheaper than the whole frame
+            x0 = max(0, near[0] - CURSOR_SEARCH_RADIUS)
+            y0 = max(0, near[1] - CURSOR_SEARCH_RADIUS)
+            window = gray[y0:near[1] + CURSOR_SEARCH_RADIUS, x0:near[0] + CURSOR_SEARCH_RADIUS]
+            best_match = self._match_cursor_templates(window, templates)
+            if best_match is not None:
+                return (best_match[0] + x0, best_match[1] + y0, best_match[2])
+        
+        return self._match_cursor_templates(gray, templates)
+    
+    def _match_cursor_templates(self, gray, templates):
+        """Best template match above the threshold in `gray` as (x, y, score), or None."""
         best_match = None
         best_score = 0
         
         for template in templates:
+            # The window can be clipped smaller than a template at the frame edge
+            if gray.shape[0] < template.shape[0] or gray.shape[1] < template.shape[1]:
+                continue
+            
             result = cv2.matchTemplate(gray, template, cv2.TM_CCOEFF_NORMED)
             min_val, max_val, min_loc, max_loc = cv2.minMaxLoc(result)
             
@@ -292,32 +545,11 @@ class EnhancedVideoProcessor:
         
         return best_match
     
-    def _detect_cursor_color(self, frame):
-        """Improved color-based cursor detection."""
-        hsv = cv2.cvtColor(frame, cv2.COLOR_BGR2HSV)
-        
-        # Multiple cursor color ranges
-        cursor_masks = []
-        
-        # White cursor
-        lower_white = np.array([0, 0, 200])
-        upper_white = np.array([180, 30, 255])
-        cursor_masks.append(cv2.inRange(hsv, lower_white, upper_white))
-        
-        # Black cursor  
-        lower_black = np.array([0, 0, 0])
-        upper_black = np.array([180, 255, 30])
-        cursor_masks.append(cv2.inRange(hsv, lower_black, upper_black))
-        
-        # Blue cursor (common in some UIs)
-        lower_blue = np.array([100, 50, 50])
-        upper_blue = np.array([130, 255, 255])
-        cursor_masks.append(cv2.inRange(hsv, lower_blue, upper_blue))
-        
-        # Combine masks
-        combined_mask = cursor_masks[0]
-        for mask in cursor_masks[1:]:
-            combined_mask = cv2.bitwise_or(combined_mask, mask)
+    def _detect_cursor_color(self, hsv, area_scale=1.0):
+        """Improved color-based cursor detection on an HSV frame (size limits scaled by `area_scale`)."""
+        # Multiple cursor color ranges, combined: white (V >= 200, S <= 30), black (V <= 30)
+        # and blue, common in some UIs (H 100-130, S >= 50, V >= 50)
+        combined_mask = _get_cursor_mask_kernel()(hsv)
         
         # Morphological operations to clean up
         kernel = np.ones((3, 3), np.uint8)
@@ -332,7 +564,7 @@ class EnhancedVideoProcessor:
             valid_contours = []
             for contour in contours:
                 area = cv2.contourArea(contour)
-                if 10 < area < 500:  # Reasonable cursor size
+                if 10 * area_scale < area < 500 * area_scale:  # Reasonable cursor size
                     x, y, w, h = cv2.boundingRect(contour)
                     aspect_ratio = w / h if h > 0 else 0
                     if 0.3 < aspect_ratio < 3:  # Reasonable aspect ratio
@@ -351,74 +583,52 @@ class EnhancedVideoProcessor:
     
     def _calculate_movement_stats_enhanced(self):
         """Enhanced movement statistics calculation."""
-        positions = self.results['mousePositions']
-        if len(positions) < 2:
+        positions = self.positions
+        if len(positions['frame']) < 2:
             return
         
-        total_distance = 0
-        speeds = []
-        accelerations = []
-        direction_changes = 0
-        
-        for i in range(1, len(positions)):
-            prev_pos = positions[i-1]
-            curr_pos = positions[i]
-            
-            # Calculate distance
-            dx = curr_pos['x'] - prev_pos['x']
-            dy = curr_pos['y'] - prev_pos['y']
-            distance = np.sqrt(dx*dx + dy*dy)
-            total_distance += distance
-            
-            # Calculate speed
-            time_diff = curr_pos['timestamp'] - prev_pos['timestamp']
-            if time_diff > 0:
-                speed = distance / time_diff
-                speeds.append(speed)
-                
-                # Calculate acceleration
-                if i > 1 and len(speeds) > 1:
-                    prev_speed = speeds[-2]
-                    acceleration = (speed - prev_speed) / time_diff
-                    accelerations.append(acceleration)
-                
-                # Detect direction changes
-                if i > 1:
-                    prev_prev_pos = positions[i-2]
-                    prev_dx = prev_pos['x'] - prev_prev_pos['x']
-                    prev_dy = prev_pos['y'] - prev_prev_pos['y']
-                    
-                    # Calculate angle change
-                    if (prev_dx != 0 or prev_dy != 0) and (dx != 0 or dy != 0):
-                        angle1 = np.arctan2(prev_dy, prev_dx)
-                        angle2 = np.arctan2(dy, dx)
-                        angle_diff = abs(angle2 - angle1)
-                        if angle_diff > np.pi:
-                            angle_diff = 2 * np.pi - angle_diff
-                        if angle_diff > np.pi / 4:  # 45 degrees
-                            direction_changes += 1
+        # Per-step displacement and distance
+        dx = np.diff(positions['x'])
+        dy = np.diff(positions['y'])
+        dt = np.diff(positions['t'])
+        distances = np.hypot(dx, dy)
+        total_distance = distances.sum()
+        
+        # Speed over steps that advance in time; acceleration between consecutive speeds
+        valid = dt > 0
+        speeds = distances[valid] / dt[valid]
+        accelerations = np.diff(speeds) / dt[valid][1:]
+        
+        # Direction changes: turns of more than 45 degrees between consecutive moving steps.
+        # For an angle in [0, 180], cos < sin exactly when it exceeds 45, so the test is
+        # dot < |cross| on the integer step vectors; no trigonometry needed
+        cross = dx[:-1] * dy[1:] - dy[:-1] * dx[1:]
+        dot = dx[:-1] * dx[1:] + dy[:-1] * dy[1:]
+        moved = (dx != 0) | (dy != 0)
+        turns = valid[1:] & moved[:-1] & moved[1:] & (dot < np.abs(cross))
+        direction_changes = int(turns.sum())
         
         # Update enhanced stats
-        self.results['stats']['totalMovements'] = len(positions)
+        self.results['stats']['totalMovements'] = len(positions['frame'])
         self.results['stats']['totalDistance'] = float(total_distance)
-        self.results['stats']['averageSpeed'] = float(np.mean(speeds)) if speeds else 0.0
-        self.results['stats']['maxSpeed'] = float(np.max(speeds)) if speeds else 0.0
-        self.results['stats']['minSpeed'] = float(np.min(speeds)) if speeds else 0.0
-        self.results['stats']['speedStdDev'] = float(np.std(speeds)) if speeds else 0.0
-        self.results['stats']['averageAcceleration'] = float(np.mean(accelerations)) if accelerations else 0.0
+        self.results['stats']['averageSpeed'] = float(np.mean(speeds)) if speeds.size else 0.0
+        self.results['stats']['maxSpeed'] = float(np.max(speeds)) if speeds.size else 0.0
+        self.results['stats']['minSpeed'] = float(np.min(speeds)) if speeds.size else 0.0
+        self.results['stats']['speedStdDev'] = float(np.std(speeds)) if speeds.size else 0.0
+        self.results['stats']['averageAcceleration'] = float(np.mean(accelerations)) if accelerations.size else 0.0
         self.results['stats']['directionChanges'] = direction_changes
     
     def _detect_ui_elements(self):
         """Detect UI elements in frames using computer vision."""
         # Sample key frames for UI detection
-        frame_files = sorted([f for f in os.listdir(self.frames_dir) if f.endswith('.png')])
-        sample_indices = list(range(0, len(frame_files), max(1, len(frame_files) // 10)))
+        total_frames = self.results['stats']['totalFrames']
+        sample_indices = list(range(0, total_frames, max(1, total_frames // 10)))
         
         for idx in sample_indices[:5]:  # Analyze up to 5 frames
-            frame_path = os.path.join(self.frames_dir, frame_files[idx])
-            
             try:
-                frame = cv2.imread(frame_path)
+                frame = cv2.imread(self._frame_path(idx))
+                if frame is None:
+                    continue
                 
                 # Detect buttons and clickable elements
                 ui_elements = self._detect_buttons_and_links(frame)
@@ -429,16 +639,25 @@ class EnhancedVideoProcessor:
                     self.results['uiElements'].append(element)
                 
             except Exception as e:
-                logger.warning(f"Error detecting UI elements in frame {idx}: {str(e)}")
+                logger.warning("Error detecting UI elements in frame %s: %s", idx, e)
         
-        logger.info(f"Detected {len(self.results['uiElements'])} UI elements")
+        # Index element bounds once so each click/hover lookup is a single array pass
+        self.ui_element_bounds = np.array([
+            (e['bounds']['x'], e['bounds']['y'],
+             e['bounds']['x'] + e['bounds']['width'], e['bounds']['y'] + e['bounds']['height'],
+             e['frameIndex'])
+            for e in self.results['uiElements']
+        ], dtype=np.int64).reshape(-1, 5)
+        
+        logger.info("Detected %s UI elements", len(self.results['uiElements']))
     
     def _detect_buttons_and_links(self, frame):
         """Detect buttons and clickable elements in a frame."""
         elements = []
         
-        # Convert to grayscale
-        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+        # Convert to grayscale at reduced size; candidate boxes don't need pixel accuracy
+        small = cv2.resize(frame, None, fx=UI_EDGE_SCALE, fy=UI_EDGE_SCALE, interpolation=cv2.INTER_AREA)
+        gray = cv2.cvtColor(small, cv2.COLOR_BGR2GRAY)
         
         # Edge detection
         edges = cv2.Canny(gray, 50, 150)
@@ -447,8 +666,8 @@ class EnhancedVideoProcessor:
         contours, _ = cv2.findContours(edges, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
         
         for contour in contours:
-            # Get bounding box
-            x, y, w, h = cv2.boundingRect(contour)
+            # Get bounding box, back in full-frame pixels
+            x, y, w, h = (int(round(v / UI_EDGE_SCALE)) for v in cv2.boundingRect(contour))
             
             # Filter by size (potential buttons)
             if 20 < w < 300 and 15 < h < 100 and 0.2 < w/h < 5:
@@ -469,8 +688,12 @@ class EnhancedVideoProcessor:
     
     def _analyze_events_enhanced(self):
         """Enhanced event analysis with UI element interaction detection."""
-        positions = self.results['mousePositions']
-        if len(positions) < 2:
+        positions = self.positions
+        frame_indices = positions['frame']
+        timestamps = positions['t']
+        xs = positions['x']
+        ys = positions['y']
+        if len(frame_indices) < 2:
             return
         
         events = []
@@ -478,68 +701,62 @@ class EnhancedVideoProcessor:
         scrolls = []
         hovers = []
         
-        # Detect various event types
-        for i in range(1, len(positions) - 1):
-            prev_pos = positions[i-1]
-            curr_pos = positions[i]
-            next_pos = positions[i+1] if i+1 < len(positions) else curr_pos
-            
-            # Calculate movements
-            delta1 = np.sqrt((curr_pos['x'] - prev_pos['x'])**2 + (curr_pos['y'] - prev_pos['y'])**2)
-            delta2 = np.sqrt((next_pos['x'] - curr_pos['x'])**2 + (next_pos['y'] - curr_pos['y'])**2)
+        # Step lengths between positions, plus per-position click (movement then pause)
+        # and hover (pause of more than 0.5s without a click) flags
+        deltas, click_mask, hover_mask = _get_event_mask_kernel()(xs, ys, timestamps)
+        
+        # Detect various event types, visiting only the candidate positions
+        for i in np.flatnonzero(click_mask | hover_mask):
+            x, y, frame_index = int(xs[i]), int(ys[i]), int(frame_indices[i])
             
-            # Detect clicks (movement then pause)
-            if delta1 > 20 and delta2 < 5:
+            if click_mask[i]:
                 # Check if click is on a UI element
-                clicked_element = self._find_ui_element_at_position(curr_pos['x'], curr_pos['y'], curr_pos['frameIndex'])
+                clicked_element = self._find_ui_element_at_position(x, y, frame_index)
                 
                 click_event = {
                     'type': 'click',
-                    'frameIndex': curr_pos['frameIndex'],
-                    'timestamp': curr_pos['timestamp'],
-                    'x': curr_pos['x'],
-                    'y': curr_pos['y'],
-                    'intensity': float(delta1),
+                    'frameIndex': frame_index,
+                    'timestamp': float(timestamps[i]),
+                    'x': x,
+                    'y': y,
+                    'intensity': float(deltas[i - 1]),
                     'targetElement': clicked_element
                 }
                 events.append(click_event)
                 clicks.append(click_event)
             
-            # Detect hover (pause without click)
-            elif delta1 < 10 and delta2 < 10:
-                hover_duration = next_pos['timestamp'] - curr_pos['timestamp']
-                if hover_duration > 0.5:  # Hover for more than 0.5s
-                    hovered_element = self._find_ui_element_at_position(curr_pos['x'], curr_pos['y'], curr_pos['frameIndex'])
-                    
-                    hover_event = {
-                        'type': 'hover',
-                        'frameIndex': curr_pos['frameIndex'],
-                        'timestamp': curr_pos['timestamp'],
-                        'x': curr_pos['x'],
-                        'y': curr_pos['y'],
-                        'duration': hover_duration,
-                        'targetElement': hovered_element
-                    }
-                    events.append(hover_event)
-                    hovers.append(hover_event)
+            else:
+                hovered_element = self._find_ui_element_at_position(x, y, frame_index)
+                
+                hover_event = {
+                    'type': 'hover',
+                    'frameIndex': frame_index,
+                    'timestamp': float(timestamps[i]),
+                    'x': x,
+                    'y': y,
+                    'duration': float(timestamps[i + 1] - timestamps[i]),
+                    'targetElement': hovered_element
+                }
+                events.append(hover_event)
+                hovers.append(hover_event)
         
-        # Detect scrolling patterns
+        # Detect scrolling patterns: vertical travel across the window around each position
         window_size = 5
-        for i in range(window_size, len(positions) - window_size):
-            y_positions = [positions[j]['y'] for j in range(i-window_size, i+window_size)]
-            y_trend = y_positions[-1] - y_positions[0]
-            
-            if abs(y_trend) > 50:
-                scroll_event = {
-                    'type': 'scroll',
-                    'frameIndex': positions[i]['frameIndex'],
-                    'timestamp': positions[i]['timestamp'],
-                    'direction': 'down' if y_trend > 0 else 'up',
-                    'magnitude': abs(float(y_trend)),
-                    'speed': abs(y_trend) / (positions[i+window_size-1]['timestamp'] - positions[i-window_size]['timestamp'])
-                }
-                events.append(scroll_event)
-                scrolls.append(scroll_event)
+        n = len(frame_indices)
+        y_trends = ys[2 * window_size - 1:n - 1] - ys[:max(n - 2 * window_size, 0)]
+        for i in np.flatnonzero(np.abs(y_trends) > 50) + window_size:
+            y_trend = int(y_trends[i - window_size])
+            
+            scroll_event = {
+                'type': 'scroll',
+                'frameIndex': int(frame_indices[i]),
+                'timestamp': float(timestamps[i]),
+                'direction': 'down' if y_trend > 0 else 'up',
+                'magnitude': abs(float(y_trend)),
+                'speed': abs(y_trend) / float(timestamps[i + window_size - 1] - timestamps[i - window_size])
+            }
+            events.append(scroll_event)
+            scrolls.append(scroll_event)
         
         # Detect rage clicks
         rage_clicks = self._detect_rage_clicks(clicks)
@@ -558,36 +775,44 @@ class EnhancedVideoProcessor:
         # Analyze funnel metrics
         self._analyze_funnel_metrics(events)
         
-        logger.info(f"Detected {len(events)} events: {len(clicks)} clicks, {len(scrolls)} scrolls, {len(hovers)} hovers")
+        logger.info("Detected %s events: %s clicks, %s scrolls, %s hovers", len(events), len(clicks), len(scrolls), len(hovers))
     
     def _find_ui_element_at_position(self, x, y, frame_index):
         """Find UI element at given position."""
-        for element in self.results['uiElements']:
-            if abs(element['frameIndex'] - frame_index) < 5:  # Within 5 frames
-                bounds = element['bounds']
-                if (bounds['x'] <= x <= bounds['x'] + bounds['width'] and
-                    bounds['y'] <= y <= bounds['y'] + bounds['height']):
-                    return element
-        return None
+        bounds = self.ui_element_bounds
+        hits = (
+            (np.abs(bounds[:, 4] - frame_index) < 5) &  # Within 5 frames
+            (bounds[:, 0] <= x) & (x <= bounds[:, 2]) &
+            (bounds[:, 1] <= y) & (y <= bounds[:, 3])
+        )
+        
+        # First matching element, as in detection order
+        matches = np.flatnonzero(hits)
+        return self.results['uiElements'][matches[0]] if matches.size else None
     
     def _detect_rage_clicks(self, clicks):
         """Detect rage click patterns."""
         rage_clicks = []
         
-        # Group clicks by proximity in time and space
+        # Group clicks by proximity in time and space in one sweep: clicks arrive in time
+        # order, so a group stops accepting clicks 2 seconds after its first one
         click_groups = []
+        open_groups = deque()
         for click in clicks:
-            added = False
-            for group in click_groups:
-                # Check if click belongs to existing group
-                if (abs(click['timestamp'] - group[0]['timestamp']) < 2 and  # Within 2 seconds
-                    np.sqrt((click['x'] - group[0]['x'])**2 + (click['y'] - group[0]['y'])**2) < 50):  # Within 50 pixels
+            while open_groups and click['timestamp'] - open_groups[0][0]['timestamp'] >= 2:
+                open_groups.popleft()
+            
+            for group in open_groups:
+                # Check if click belongs to existing group (within 50 pixels of its first click)
+                dx = click['x'] - group[0]['x']
+                dy = click['y'] - group[0]['y']
+                if dx * dx + dy * dy < 2500:
                     group.append(click)
-                    added = True
                     break
-            
-            if not added:
-                click_groups.append([click])
+            else:
+                group = [click]
+                click_groups.append(group)
+                open_groups.append(group)
         
         # Identify rage click groups
         for group in click_groups:
@@ -679,28 +904,27 @@ class EnhancedVideoProcessor:
                     'icon': '😤'
                 })
         
-        # Add long pauses as key moments
-        if self.results['mousePositions']:
-            for i in range(1, len(self.results['mousePositions'])):
-                time_diff = self.results['mousePositions'][i]['timestamp'] - self.results['mousePositions'][i-1]['timestamp']
-                if time_diff > 3:  # Pause longer than 3 seconds
-                    key_moments.append({
-                        'type': 'pause',
-                        'timestamp': self.results['mousePositions'][i]['timestamp'],
-                        'frameIndex': self.results['mousePositions'][i]['frameIndex'],
-                        'description': f'User paused for {time_diff:.1f} seconds',
-                        'icon': '⏸️'
-                    })
+        # Add long pauses (longer than 3 seconds) as key moments
+        timestamps = self.positions['t']
+        gaps = np.diff(timestamps)
+        for i in np.flatnonzero(gaps > 3) + 1:
+            key_moments.append({
+                'type': 'pause',
+                'timestamp': float(timestamps[i]),
+                'frameIndex': int(self.positions['frame'][i]),
+                'description': f'User paused for {gaps[i - 1]:.1f} seconds',
+                'icon': '⏸️'
+            })
         
         # Sort by timestamp
         key_moments.sort(key=lambda x: x['timestamp'])
         
         self.results['keyMoments'] = key_moments[:10]  # Top 10 moments
-        logger.info(f"Extracted {len(key_moments)} key moments")
+        logger.info("Extracted %s key moments", len(key_moments))
     
     def _analyze_frames_enhanced(self):
         """Enhanced frame analysis with better AI prompts."""
-        frame_files = sorted([f for f in os.listdir(self.frames_dir) if f.endswith('.png')])
+        total_frames = self.results['stats']['totalFrames']
         
         # Select key frames based on events and key moments
         key_indices = set()
@@ -713,47 +937,166 @@ class EnhancedVideoProcessor:
         for moment in self.results['keyMoments']:
             key_indices.add(moment['frameIndex'])
         
+        # Top up to 6 frames with the biggest screen changes first
+        for idx in self._load_scene_changes():
+            if len(key_indices) >= 6:
+                break
+            key_indices.add(idx)
+        
         # Ensure we have at least 6 frames evenly distributed
         if len(key_indices) < 6:
-            step = max(1, len(frame_files) // 6)
-            for i in range(0, len(frame_files), step):
+            step = max(1, total_frames // 6)
+            for i in range(0, total_frames, step):
                 key_indices.add(i)
                 if len(key_indices) >= 6:
                     break
         
-        # Analyze selected frames
-        for idx in sorted(list(key_indices))[:8]:  # Analyze up to 8 key frames
-            if idx >= len(frame_files):
+        # Analyze selected frames (up to 8 key frames) concurrently; results come back in frame order
+        selected = [idx for idx in sorted(key_indices)[:8] if idx < total_frames]
+        events_by_frame = defaultdict(list)
+        for event in self.results['events']:
+            events_by_frame[event['frameIndex']].append(event)
+        analyses = asyncio.run(self._analyze_key_frames(selected, events_by_frame))
+        
+        for idx, analysis in zip(selected, analyses):
+            if analysis is None:
                 continue
-                
-            frame_path = os.path.join(self.frames_dir, frame_files[idx])
+            analysis_text, frame_context = analysis
             
-            try:
-                # Read and encode frame
-                with open(frame_path, 'rb') as f:
-                    image_data = f.read()
-                
-                # Convert to base64
-                base64_image = base64.b64encode(image_data).decode('utf-8')
-                
-                # Get context about what's happening at this frame
-                frame_context = []
-                for event in self.results['events']:
-                    if abs(event['frameIndex'] - idx) < 2:
-                        frame_context.append(f"{event['type']} at ({event['x']}, {event['y']})")
+            self.results['frameAnalyses'].append({
+                'frameIndex': idx,
+                'timestamp': idx / self.results['stats']['extractionFps'],
+                'analysisText': analysis_text,
+                'context': frame_context
+            })
+            
+            # Extract specific friction indicators
+            friction_keywords = ['error', 'confusion', 'stuck', 'unclear', 'frustration', 'difficult', 'problem', 'issue']
+            if any(keyword in analysis_text.lower() for keyword in friction_keywords):
+                self.results['frictionPoints'].append({
+                    'type': 'ui_confusion',
+                    'frameIndex': idx,
+                    'timestamp': idx / self.results['stats']['extractionFps'],
+                    'severity': 'medium',
+                    'description': analysis_text[:200],
+                    'recommendation': 'Review UI design and user flow at this point'
+                })
+        
+        logger.info("Analyzed %s key frames", len(self.results['frameAnalyses']))
+    
+    async def _analyze_key_frames(self, key_indices, events_by_frame):
+        """Analyze key frames, returning (analysis text, nearby actions) or None per frame."""
+        async with anthropic.AsyncAnthropic(api_key=Config.ANTHROPIC_API_KEY) as client:
+            # All frames go in one request; if that fails or its answer can't be matched back to
+            # the frames, fall back to one request per frame
+            analyses = await self._analyze_key_frames_batched(client, key_indices, events_by_frame)
+            if analyses is not None:
+                return analyses
+            
+            semaphore = asyncio.Semaphore(MAX_CONCURRENT_ANALYSES)
+            
+            async def analyze(idx):
+                async with semaphore:
+                    return await self._analyze_key_frame(client, idx, events_by_frame)
+            
+            return await asyncio.gather(*(analyze(idx) for idx in key_indices))
+    
+    async def _analyze_key_frames_batched(self, client, key_indices, events_by_frame):
+        """Ask Claude about all key frames in a single request; returns the per-frame
+        (analysis text, nearby actions) pairs, or None if the request or its answer is unusable."""
+        if not key_indices:
+            return []
+        
+        try:
+            # Read and re-encode the frames (off the event loop; cv2 releases the GIL)
+            images = await asyncio.gather(*(asyncio.to_thread(self._vision_jpeg, idx) for idx in key_indices))
+            
+            # Each frame is introduced by its own context, then its image
+            contexts = []
+            content = []
+            for idx, image_data in zip(key_indices, images):
+                frame_context = self._frame_context(idx, events_by_frame)
+                contexts.append(frame_context)
                 
                 context_str = "User actions near this frame: " + ", ".join(frame_context) if frame_context else "No specific actions detected"
-                
-                # Enhanced AI prompt
-                response = anthropic_client.messages.create(
-                    model="claude-3-5-sonnet-20241022",
-                    max_tokens=400,
-                    messages=[{
-                        "role": "user",
-                        "content": [
-                            {
-                                "type": "text",
-                                "text": f"""Analyze this screenshot from a user session recording. {context_str}
+                content.append({"type": "text", "text": f"Frame {idx}. {context_str}"})
+                content.append({
+                    "type": "image",
+                    "source": {
+                        "type": "base64",
+                        "media_type": "image/jpeg",
+                        "data": pybase64.b64encode_as_string(image_data)
+                    }
+                })
+            
+            content.append({
+                "type": "text",
+                "text": """These are screenshots from a user session recording. For each frame, identify:
+1. What is the user trying to accomplish in this screen?
+2. Any visible UI issues, errors, or confusion indicators
+3. The user's emotional state based on interaction patterns
+4. Specific friction points or obstacles
+5. What UI element is the focus of attention
+
+Be specific about locations and describe exactly what you see. Respond with only a JSON array holding one object per frame, in order: {"frameIndex": <frame number>, "analysis": "<your analysis>"}"""
+            })
+            
+            response = await client.messages.create(
+                model="claude-3-5-sonnet-20241022",
+                max_tokens=400 * len(key_indices),
+                messages=[{"role": "user", "content": content}]
+            )
+            
+            # Tolerate prose around the array
+            text = response.content[0].text
+            answers = orjson.loads(text[text.index('['):text.rindex(']') + 1])
+            by_frame = {
+                int(answer['frameIndex']): answer['analysis']
+                for answer in answers
+                if isinstance(answer, dict) and isinstance(answer.get('analysis'), str)
+            }
+            if not all(idx in by_frame for idx in key_indices):
+                raise ValueError("response does not cover every frame")
+            
+            return [(by_frame[idx], frame_context) for idx, frame_context in zip(key_indices, contexts)]
+            
+        except Exception as e:
+            logger.warning("Batched frame analysis failed, analyzing frames one by one: %s", e)
+            return None
+    
+    def _frame_context(self, idx, events_by_frame):
+        """Descriptions of the events on frame `idx` and its neighbours."""
+        return [
+            f"{event['type']} at ({event['x']}, {event['y']})"
+            for frame_index in (idx - 1, idx, idx + 1)
+            for event in events_by_frame.get(frame_index, ())
+        ]
+    
+    async def _analyze_key_frame(self, client, idx, events_by_frame):
+        """Ask Claude about one key frame (`events_by_frame` maps frameIndex to events); returns
+        (analysis text, nearby actions) or None on error."""
+        try:
+            # Read and re-encode frame (off the event loop; cv2 releases the GIL)
+            image_data = await asyncio.to_thread(self._vision_jpeg, idx)
+            
+            # Convert to base64
+            base64_image = pybase64.b64encode_as_string(image_data)
+            
+            # Get context about what's happening at this frame and its neighbours
+            frame_context = self._frame_context(idx, events_by_frame)
+            
+            context_str = "User actions near this frame: " + ", ".join(frame_context) if frame_context else "No specific actions detected"
+            
+            # Enhanced AI prompt
+            response = await client.messages.create(
+                model="claude-3-5-sonnet-20241022",
+                max_tokens=400,
+                messages=[{
+                    "role": "user",
+                    "content": [
+                        {
+                            "type": "text",
+                            "text": f"""Analyze this screenshot from a user session recording. {context_str}
 
 Please identify:
 1. What is the user trying to accomplish in this screen?
@@ -763,137 +1106,172 @@ Please identify:
 5. What UI element is the focus of attention
 
 Be specific about locations and describe exactly what you see."""
-                            },
-                            {
-                                "type": "image",
-                                "source": {
-                                    "type": "base64",
-                                    "media_type": "image/png",
-                                    "data": base64_image
-                                }
+                        },
+                        {
+                            "type": "image",
+                            "source": {
+                                "type": "base64",
+                                "media_type": "image/jpeg",
+                                "data": base64_image
                             }
-                        ]
-                    }]
-                )
-                
-                analysis_text = response.content[0].text
-                
-                self.results['frameAnalyses'].append({
-                    'frameIndex': idx,
-                    'timestamp': idx / self.results['stats']['extractionFps'],
-                    'analysisText': analysis_text,
-                    'context': frame_context
-                })
-                
-                # Extract specific friction indicators
-                friction_keywords = ['error', 'confusion', 'stuck', 'unclear', 'frustration', 'difficult', 'problem', 'issue']
-                if any(keyword in analysis_text.lower() for keyword in friction_keywords):
-                    self.results['frictionPoints'].append({
-                        'type': 'ui_confusion',
-                        'frameIndex': idx,
-                        'timestamp': idx / self.results['stats']['extractionFps'],
-                        'severity': 'medium',
-                        'description': analysis_text[:200],
-                        'recommendation': 'Review UI design and user flow at this point'
-                    })
-                
-                # Rate limiting
-                time.sleep(0.2)
-                
-            except Exception as e:
-                logger.error(f"Error analyzing frame {idx}: {str(e)}")
-        
-        logger.info(f"Analyzed {len(self.results['frameAnalyses'])} key frames")
+                        }
+                    ]
+                }]
+            )
+            
+            return response.content[0].text, frame_context
+            
+        except Exception as e:
+            logger.error("Error analyzing frame %s: %s", idx, e)
+            return None
+    
+    def _vision_jpeg(self, idx):
+        """JPEG bytes for a key frame, at most MAX_VISION_SIDE on its long side and at upload quality."""
+        # The batched request and its per-frame fallback send the same frames
+        if idx not in self.vision_jpegs:
+            self.vision_jpegs[idx] = self._encode_vision_jpeg(idx)
+        return self.vision_jpegs[idx]
+    
+    def _encode_vision_jpeg(self, idx):
+        """Read key frame `idx` and re-encode it for upload (see _vision_jpeg)."""
+        with open(self._frame_path(idx), 'rb') as f:
+            image_data = f.read()
+        
+        # Extracted frames are near-lossless (qscale 2); a standard-quality re-encode is a
+        # fraction of the size and reads the same to the model
+        frame = cv2.imdecode(np.frombuffer(image_data, np.uint8), cv2.IMREAD_COLOR)
+        if frame is None:
+            return image_data
+        
+        scale = MAX_VISION_SIDE / max(frame.shape[:2])
+        if scale < 1.0:
+            frame = cv2.resize(frame, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+        
+        # Flat, simple frames can already be smaller as extracted
+        encoded = cv2.imencode('.jpg', frame, [cv2.IMWRITE_JPEG_QUALITY, 85])[1].tobytes()
+        return encoded if len(encoded) < len(image_data) else image_data
+    
+    def _load_scene_changes(self):
+        """Frame indices whose scene-change score passes the threshold, biggest change first."""
+        if not self.scene_scores_path or not os.path.exists(self.scene_scores_path):
+            return []
+        
+        # metadata=print writes a "frame:N pts:... pts_time:..." line, then key=value lines
+        scores = []
+        frame_index = None
+        with open(self.scene_scores_path) as f:
+            for line in f:
+                if line.startswith('frame:'):
+                    frame_index = int(line.split()[0][len('frame:'):])
+                elif line.startswith('lavfi.scene_score=') and frame_index is not None:
+                    score = float(line.split('=', 1)[1])
+                    if score > SCENE_CHANGE_THRESHOLD:
+                        scores.append((score, frame_index))
+        
+        return [idx for _, idx in sorted(scores, reverse=True)]
     
     def _generate_user_journey(self):
         """Generate a narrative of the user's journey through the session."""
-        journey_points = []
-        
         # Start of session
-        journey_points.append({
+        session_start = {
             'timestamp': 0,
             'type': 'session_start',
             'description': 'User started the session',
             'icon': '🚀'
-        })
+        }
         
         # Add all events with descriptions
-        for event in self.results['events']:
-            if event['type'] == 'click':
-                desc = f"Clicked at ({event['x']}, {event['y']})"
-                if event.get('targetElement'):
-                    desc += f" on a {event['targetElement']['type']}"
-                journey_points.append({
-                    'timestamp': event['timestamp'],
-                    'type': 'interaction',
-                    'description': desc,
-                    'icon': '🖱️'
-                })
-            elif event['type'] == 'scroll':
-                journey_points.append({
-                    'timestamp': event['timestamp'],
-                    'type': 'navigation',
-                    'description': f"Scrolled {event['direction']} ({event['magnitude']:.0f}px)",
-                    'icon': '📜'
-                })
-            elif event['type'] == 'hover':
-                desc = f"Hovered for {event['duration']:.1f}s"
-                if event.get('targetElement'):
-                    desc += f" over a {event['targetElement']['type']}"
-                journey_points.append({
-                    'timestamp': event['timestamp'],
-                    'type': 'exploration',
-                    'description': desc,
-                    'icon': '👀'
-                })
-            elif event['type'] == 'rage_click':
-                journey_points.append({
-                    'timestamp': event['timestamp'],
-                    'type': 'frustration',
-                    'description': f"Rage clicked {event['clickCount']} times - user frustrated",
-                    'icon': '😤'
-                })
+        event_points = [
+            point for point in map(self._journey_event_point, self.results['events'])
+            if point is not None
+        ]
         
         # Add friction points
-        for fp in self.results['frictionPoints']:
-            if fp['type'] != 'rage_click':  # Avoid duplicates
-                journey_points.append({
-                    'timestamp': fp['timestamp'],
-                    'type': 'friction',
-                    'description': fp['description'][:100],
-                    'icon': '⚠️'
-                })
+        friction_points = [
+            {
+                'timestamp': fp['timestamp'],
+                'type': 'friction',
+                'description': fp['description'][:100],
+                'icon': '⚠️'
+            }
+            for fp in self.results['frictionPoints']
+            if fp['type'] != 'rage_click'  # Avoid duplicates
+        ]
         
         # Add pauses
-        for moment in self.results['keyMoments']:
-            if moment['type'] == 'pause':
-                journey_points.append({
-                    'timestamp': moment['timestamp'],
-                    'type': 'pause',
-                    'description': moment['description'],
-                    'icon': moment['icon']
-                })
+        pause_points = [
+            {
+                'timestamp': moment['timestamp'],
+                'type': 'pause',
+                'description': moment['description'],
+                'icon': moment['icon']
+            }
+            for moment in self.results['keyMoments']
+            if moment['type'] == 'pause'
+        ]
+        
+        journey_points = list(chain((session_start,), event_points, friction_points, pause_points))
         
         # Sort by timestamp
         journey_points.sort(key=lambda x: x['timestamp'])
         
         # Generate narrative
-        narrative_parts = []
-        for i, point in enumerate(journey_points):
-            time_str = f"{point['timestamp']:.1f}s"
-            narrative_parts.append(f"{point['icon']} At {time_str}: {point['description']}")
+        narrative_parts = [
+            f"{point['icon']} At {point['timestamp']:.1f}s: {point['description']}"
+            for point in journey_points
+        ]
         
         self.results['userJourney'] = journey_points
         self.results['userJourneyNarrative'] = "\n".join(narrative_parts)
         
-        logger.info(f"Generated user journey with {len(journey_points)} points")
+        logger.info("Generated user journey with %s points", len(journey_points))
+    
+    @staticmethod
+    def _journey_event_point(event):
+        """Journey point describing a detected event, or None for event types the journey skips."""
+        if event['type'] == 'click':
+            desc = f"Clicked at ({event['x']}, {event['y']})"
+            if event.get('targetElement'):
+                desc += f" on a {event['targetElement']['type']}"
+            return {
+                'timestamp': event['timestamp'],
+                'type': 'interaction',
+                'description': desc,
+                'icon': '🖱️'
+            }
+        if event['type'] == 'scroll':
+            return {
+                'timestamp': event['timestamp'],
+                'type': 'navigation',
+                'description': f"Scrolled {event['direction']} ({event['magnitude']:.0f}px)",
+                'icon': '📜'
+            }
+        if event['type'] == 'hover':
+            desc = f"Hovered for {event['duration']:.1f}s"
+            if event.get('targetElement'):
+                desc += f" over a {event['targetElement']['type']}"
+            return {
+                'timestamp': event['timestamp'],
+                'type': 'exploration',
+                'description': desc,
+                'icon': '👀'
+            }
+        if event['type'] == 'rage_click':
+            return {
+                'timestamp': event['timestamp'],
+                'type': 'frustration',
+                'description': f"Rage clicked {event['clickCount']} times - user frustrated",
+                'icon': '😤'
+            }
+        return None
     
     def _generate_enhanced_summary(self):
         """Generate comprehensive behavior summary with actionable insights."""
         try:
-            # Prepare comprehensive context
+            # Prepare comprehensive context; each frame's analysis is cut to its opening (the
+            # full texts are already in frameAnalyses) to keep the prompt small
             frame_analyses = "\n\n".join([
-                f"Frame at {fa['timestamp']:.1f}s: {fa['analysisText']}"
+                f"Frame at {fa['timestamp']:.1f}s: {textwrap.shorten(fa['analysisText'], width=300, placeholder='…')}"
                 for fa in self.results['frameAnalyses']
             ])
             
@@ -978,68 +1356,83 @@ Format as clear sections with bullet points. Be specific and actionable."""
             
             self.results['behaviorSummary'] = response.content[0].text
             
-            # Extract severity scores
-            high_severity = len([fp for fp in self.results['frictionPoints'] if fp.get('severity') == 'high'])
-            medium_severity = len([fp for fp in self.results['frictionPoints'] if fp.get('severity') == 'medium'])
+            # Extract severity scores in one pass; anything not high or medium counts as low
+            severities = Counter(fp.get('severity') for fp in self.results['frictionPoints'])
             
             self.results['stats']['frictionSeverity'] = {
-                'high': high_severity,
-                'medium': medium_severity,
-                'low': len(self.results['frictionPoints']) - high_severity - medium_severity
+                'high': severities['high'],
+                'medium': severities['medium'],
+                'low': len(self.results['frictionPoints']) - severities['high'] - severities['medium']
             }
             
         except Exception as e:
-            logger.error(f"Error generating enhanced summary: {str(e)}")
+            logger.error("Error generating enhanced summary: %s", e)
             self.results['behaviorSummary'] = "Error generating summary"
     
     def _save_enhanced_results(self):
         """Save all enhanced analysis results."""
         try:
-            # Save to Cloud Storage
+            # Save to Cloud Storage. The uploads are independent, so they run side by side
+            # (the playback video dominates) while the heat map is drawn here
             results_bucket = storage_client.bucket(Config.GCS_RESULTS_BUCKET)
             
-            # Save enhanced JSON results
-            json_blob = results_bucket.blob(f"{self.session_id}/analysis_enhanced.json")
-            json_blob.upload_from_string(
-                json.dumps(self.results, indent=2),
-                content_type='application/json'
-            )
-            
-            # Save high-quality playback video
-            if self.playback_video_path and os.path.exists(self.playback_video_path):
-                playback_blob = results_bucket.blob(f"{self.session_id}/playback_video.mp4")
-                with open(self.playback_video_path, 'rb') as f:
-                    playback_blob.upload_from_file(f, content_type='video/mp4')
+            with ThreadPoolExecutor(max_workers=4) as uploader:
+                uploads = []
                 
-                self.results['playbackVideoUrl'] = f"gs://{Config.GCS_RESULTS_BUCKET}/{self.session_id}/playback_video.mp4"
-            
-            # Generate and save enhanced heat map
-            heatmap_url = None
-            if self.results['mousePositions']:
-                heatmap_path = os.path.join(self.temp_dir, 'heatmap_enhanced.png')
+                # Save enhanced JSON results
+                json_blob = results_bucket.blob(f"{self.session_id}/analysis_enhanced.json")
+                uploads.append(uploader.submit(
+                    json_blob.upload_from_string,
+                    orjson.dumps(self.results, option=orjson.OPT_SERIALIZE_NUMPY),
+                    content_type='application/json'
+                ))
                 
-                # Generate high-quality heat map
-                self._generate_enhanced_heatmap(heatmap_path)
+                # Save high-quality playback video
+                if self.playback_video_path and os.path.exists(self.playback_video_path):
+                    playback_blob = results_bucket.blob(
+                        f"{self.session_id}/playback_video.mp4", chunk_size=PLAYBACK_UPLOAD_CHUNK_SIZE
+                    )
+                    # Overwriting the object is idempotent, so transient failures are safe to retry
+                    uploads.append(uploader.submit(
+                        playback_blob.upload_from_filename, self.playback_video_path,
+                        content_type='video/mp4', retry=DEFAULT_RETRY
+                    ))
+                    
+                    self.results['playbackVideoUrl'] = f"gs://{Config.GCS_RESULTS_BUCKET}/{self.session_id}/playback_video.mp4"
                 
-                # Upload heat map
-                heatmap_blob = results_bucket.blob(f"{self.session_id}/heatmap_enhanced.png")
-                with open(heatmap_path, 'rb') as f:
-                    heatmap_blob.upload_from_file(f, content_type='image/png')
+                # Save mouse trail data
+                trail_blob = results_bucket.blob(f"{self.session_id}/mouse_trail.json")
+                uploads.append(uploader.submit(
+                    trail_blob.upload_from_string,
+                    orjson.dumps({
+                        'positions': self.results['mousePositions'],
+                        'resolution': self.results['stats'].get('resolution', '1920x1080')
+                    }),
+                    content_type='application/json'
+                ))
                 
-                heatmap_url = f"gs://{Config.GCS_RESULTS_BUCKET}/{self.session_id}/heatmap_enhanced.png"
-            
-            # Save mouse trail data
-            trail_blob = results_bucket.blob(f"{self.session_id}/mouse_trail.json")
-            trail_blob.upload_from_string(
-                json.dumps({
-                    'positions': self.results['mousePositions'],
-                    'resolution': self.results['stats'].get('resolution', '1920x1080')
-                }, indent=2),
-                content_type='application/json'
-            )
+                # Generate and save enhanced heat map
+                heatmap_url = None
+                if self.results['mousePositions']:
+                    heatmap_path = os.path.join(self.temp_dir, 'heatmap_enhanced.png')
+                    
+                    # Generate high-quality heat map
+                    self._generate_enhanced_heatmap(heatmap_path)
+                    
+                    # Upload heat map
+                    heatmap_blob = results_bucket.blob(f"{self.session_id}/heatmap_enhanced.png")
+                    uploads.append(uploader.submit(
+                        heatmap_blob.upload_from_filename, heatmap_path, content_type='image/png'
+                    ))
+                    
+                    heatmap_url = f"gs://{Config.GCS_RESULTS_BUCKET}/{self.session_id}/heatmap_enhanced.png"
+                
+                # Surface the first failed upload
+                for upload in uploads:
+                    upload.result()
             
             # Update Firestore with enhanced data
-            doc_ref = firestore_client.collection(Config.FIRESTORE_COLLECTION_SESSIONS).document(self.session_id)
+            doc_ref = _SESSIONS_COLL.document(self.session_id)
             update_data = {
                 'stats': self.results['stats'],
                 'frictionPoints': self.results['frictionPoints'],
@@ -1057,16 +1450,16 @@ Format as clear sections with bullet points. Be specific and actionable."""
             
             doc_ref.update(update_data)
             
-            logger.info(f"Saved enhanced results for session {self.session_id}")
+            logger.info("Saved enhanced results for session %s", self.session_id)
             
         except Exception as e:
-            logger.error(f"Error saving enhanced results: {str(e)}")
+            logger.error("Error saving enhanced results: %s", e)
             raise
     
     def _generate_enhanced_heatmap(self, output_path):
         """Generate an enhanced heat map with better visualization."""
-        positions = self.results['mousePositions']
-        if not positions:
+        positions = self.positions
+        if not len(positions['frame']):
             return
         
         # Get video dimensions
@@ -1074,50 +1467,25 @@ Format as clear sections with bullet points. Be specific and actionable."""
         width = int(resolution[0])
         height = int(resolution[1])
         
-        # Create high-resolution heat map
-        fig, ax = plt.subplots(figsize=(width/100, height/100), dpi=100)
-        
-        # Extract x, y coordinates
-        x_coords = [pos['x'] for pos in positions]
-        y_coords = [pos['y'] for pos in positions]
+        # Create 2D histogram straight from the coordinate columns
+        heatmap, xedges, yedges = np.histogram2d(positions['x'], positions['y'], bins=[width//20, height//20])
         
-        # Create 2D histogram
-        heatmap, xedges, yedges = np.histogram2d(x_coords, y_coords, bins=[width//20, height//20])
+        # Apply Gaussian smoothing for better visualization (sigma 2 bins, reflected edges)
+        heatmap = cv2.GaussianBlur(heatmap.T, (17, 17), 2, borderType=cv2.BORDER_REFLECT)
         
-        # Apply Gaussian smoothing for better visualization
-        from scipy.ndimage import gaussian_filter
-        heatmap = gaussian_filter(heatmap.T, sigma=2)
+        # Normalize to 0-255 and stretch over the frame; the image is drawn frame-sized, with no
+        # axes or margins, so it lines up with the video it is overlaid on
+        span = heatmap.max() - heatmap.min()
+        heatmap = (heatmap - heatmap.min()) / span if span > 0 else np.zeros_like(heatmap)
+        heatmap = cv2.resize((heatmap * 255).astype(np.uint8), (width, height), interpolation=cv2.INTER_LINEAR)
         
-        # Create the heat map
-        im = ax.imshow(heatmap, extent=[0, width, height, 0], 
-                      cmap='hot', interpolation='bilinear', alpha=0.8)
-        
-        # Add color bar
-        cbar = plt.colorbar(im, ax=ax, fraction=0.046, pad=0.04)
-        cbar.set_label('Mouse Activity Intensity', rotation=270, labelpad=15)
-        
-        # Style the plot
-        ax.set_xlim(0, width)
-        ax.set_ylim(height, 0)  # Invert y-axis for image coordinates
-        ax.set_xlabel('X Position (pixels)')
-        ax.set_ylabel('Y Position (pixels)')
-        ax.set_title(f'User Activity Heat Map - Session {self.session_id}')
-        
-        # Remove tick marks for cleaner look
-        ax.set_xticks([])
-        ax.set_yticks([])
-        
-        # Add grid
-        ax.grid(True, alpha=0.1)
-        
-        # Save with high quality
-        plt.savefig(output_path, dpi=150, bbox_inches='tight', facecolor='black')
-        plt.close()
+        # Hot colormap on black (the frontend screen-blends it over the video)
+        cv2.imwrite(output_path, cv2.applyColorMap(heatmap, cv2.COLORMAP_HOT))
     
     def _update_status(self, status: str, error: str = None):
         """Update processing status in Firestore."""
         try:
-            doc_ref = firestore_client.collection(Config.FIRESTORE_COLLECTION_SESSIONS).document(self.session_id)
+            doc_ref = _SESSIONS_COLL.document(self.session_id)
             update_data = {
                 'status': status,
                 'lastUpdated': datetime.utcnow()
@@ -1129,19 +1497,17 @@ Format as clear sections with bullet points. Be specific and actionable."""
             doc_ref.update(update_data)
             
         except Exception as e:
-            logger.error(f"Error updating status: {str(e)}")
+            logger.error("Error updating status: %s", e)
     
     def _notify_agent(self):
         """Notify agent service about completed analysis."""
         agent_webhook_url = os.getenv('AGENT_WEBHOOK_URL')
         if agent_webhook_url:
             try:
-                import requests
-                
                 # Include friction severity in notification
                 severity = self.results['stats'].get('frictionSeverity', {})
                 
-                response = requests.post(
+                response = agent_session.post(
                     f"{agent_webhook_url}/webhook/session-completed",
                     json={
                         'sessionId': self.session_id,
@@ -1152,11 +1518,11 @@ Format as clear sections with bullet points. Be specific and actionable."""
                     timeout=5
                 )
                 if response.status_code == 200:
-                    logger.info(f"Agent notified for session {self.session_id}")
+                    logger.info("Agent notified for session %s", self.session_id)
                 else:
-                    logger.warning(f"Agent notification failed: {response.status_code}")
+                    logger.warning("Agent notification failed: %s", response.status_code)
             except Exception as e:
-                logger.error(f"Error notifying agent: {str(e)}")
+                logger.error("Error notifying agent: %s", e)
 
 
 def process_message(message: message.Message):
@@ -1167,7 +1533,7 @@ def process_message(message: message.Message):
         session_id = data['sessionId']
         gcs_uri = data['gcsUri']
         
-        logger.info(f"Processing message for session {session_id} with enhanced processor")
+        logger.info("Processing message for session %s with enhanced processor", session_id)
         
         # Use enhanced processor
         processor = EnhancedVideoProcessor(session_id, gcs_uri)
@@ -1177,7 +1543,7 @@ def process_message(message: message.Message):
         message.ack()
         
     except Exception as e:
-        logger.error(f"Error processing message: {str(e)}")
+        logger.error("Error processing message: %s", e)
         # Don't acknowledge - let it retry
         message.nack()
 
@@ -1190,20 +1556,24 @@ def main():
     try:
         Config.validate()
     except ValueError as e:
-        logger.error(f"Configuration error: {e}")
+        logger.error("Configuration error: %s", e)
         exit(1)
     
-    # Set up subscriber
-    flow_control = pubsub_v1.types.FlowControl(max_messages=1)
+    # Set up subscriber: jobs mostly wait on GCS, ffmpeg and Anthropic, so several
+    # videos are processed at once; leases are extended for up to an hour per job
+    workers = Config.VIDEO_PROCESSOR_WORKERS
+    flow_control = pubsub_v1.types.FlowControl(max_messages=workers, max_lease_duration=3600)
+    scheduler = ThreadScheduler(executor=ThreadPoolExecutor(max_workers=workers))
     
     # Start pulling messages
     streaming_pull_future = subscriber.subscribe(
         subscription_path,
         callback=process_message,
-        flow_control=flow_control
+        flow_control=flow_control,
+        scheduler=scheduler
     )
     
-    logger.info(f"Listening for messages on {subscription_path}")
+    logger.info("Listening for messages on %s", subscription_path)
     
     # Keep the main thread running
     with subscriber: